@@ -0,0 +1,90 @@
+''' Benchmark of the vectorised position buffering against the per element implementation it replaced
+
+    Usage: python benchmarks/bench_buffering.py [n_date] [n_ticker] [n_rule]
+'''
+
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+from hydrogen.trading_rules import buffer_positions
+
+
+def apply_buffer_one_signal(opt_pos, trade_to_edge, round_position):
+    ''' The former Portfolio.position buffering of one position series, kept as the reference '''
+
+    def apply_buffer_one_signal_one_period(previous_pos, opt_pos, lower_limit, upper_limit, trade_to_edge):
+        if np.isnan(upper_limit) or np.isnan(lower_limit) or np.isnan(opt_pos):
+            return previous_pos
+
+        if previous_pos > upper_limit:
+            if trade_to_edge:
+                return upper_limit
+            else:
+                return opt_pos
+        elif previous_pos < lower_limit:
+            if trade_to_edge:
+                return lower_limit
+            else:
+                return opt_pos
+        else:
+            return previous_pos
+
+    buffer = opt_pos.abs() * 0.1
+    lower_limit = opt_pos - buffer
+    upper_limit = opt_pos + buffer
+
+    if round_position:
+        opt_pos = opt_pos.round()
+        upper_limit = upper_limit.round()
+        lower_limit = lower_limit.round()
+
+    current_position = 0.0
+    buffered_position_list = []
+
+    for x, y, z in zip(opt_pos, lower_limit, upper_limit):
+        current_position = apply_buffer_one_signal_one_period(current_position, x, y, z, trade_to_edge)
+        buffered_position_list.append(current_position)
+
+    buffered_position = pd.Series(buffered_position_list, index=opt_pos.index)
+    buffered_position[opt_pos.isnull()] = np.nan
+    return buffered_position
+
+
+def create_positions(n_date, n_ticker, n_rule, random_seed=0):
+    random_state = np.random.RandomState(random_seed)
+    opt_pos = np.cumsum(random_state.randn(n_date, n_ticker, n_rule), axis=0)
+    # instruments starting on different dates and a few missing values
+    for i in range(n_ticker):
+        opt_pos[:random_state.randint(n_date // 2), i] = np.nan
+    opt_pos[random_state.rand(n_date, n_ticker, n_rule) < 0.01] = np.nan
+    return opt_pos
+
+
+def reference(opt_pos, trade_to_edge, round_position):
+    res = np.empty_like(opt_pos)
+    for i in range(opt_pos.shape[1]):
+        frame = pd.DataFrame(opt_pos[:, i, :])
+        res[:, i, :] = frame.apply(apply_buffer_one_signal, args=(trade_to_edge, round_position)).values
+    return res
+
+
+def main(n_date=2500, n_ticker=20, n_rule=7):
+    opt_pos = create_positions(n_date, n_ticker, n_rule)
+    print('Buffering {} dates x {} tickers x {} rules'.format(n_date, n_ticker, n_rule))
+
+    for trade_to_edge, round_position in [(False, False), (True, False), (True, True)]:
+        np.testing.assert_array_equal(buffer_positions(opt_pos, trade_to_edge, round_position),
+                                      reference(opt_pos, trade_to_edge, round_position))
+
+        reference_time = min(timeit.repeat(lambda: reference(opt_pos, trade_to_edge, round_position), number=1,
+                                           repeat=3))
+        vectorised_time = min(timeit.repeat(lambda: buffer_positions(opt_pos, trade_to_edge, round_position),
+                                            number=1, repeat=3))
+        print('trade_to_edge={!s:5} round_position={!s:5} per element: {:.3f}s vectorised: {:.3f}s '
+              'speed up: {:.0f}x'.format(trade_to_edge, round_position, reference_time, vectorised_time,
+                                         reference_time / vectorised_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
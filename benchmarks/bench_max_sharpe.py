@@ -0,0 +1,49 @@
+''' Benchmark of the active set max Sharpe solver against SLSQP, cold and warm started
+
+    The warm start solves the moments of a rolling window starting from the weights of the previous window, as
+    port_opt one_period does.
+
+    Usage: python benchmarks/bench_max_sharpe.py [n_window]
+'''
+
+import sys
+import timeit
+import numpy as np
+from hydrogen.portopt import mean_var_port_opt, port_SR
+
+
+def create_moments(n_window, n_asset, random_seed=0):
+    ''' Means and covariance matrices of rolling windows of 256 days of correlated returns, one day apart '''
+    random_state = np.random.RandomState(random_seed)
+    returns = random_state.randn(n_window + 255, n_asset) * random_state.uniform(0.005, 0.02, n_asset) + \
+        random_state.uniform(-0.0002, 0.001, n_asset)
+    returns[:, 1:] += 0.5 * returns[:, :1]
+    windows = [returns[i:i + 256] for i in range(n_window)]
+    return [window.mean(axis=0) for window in windows], [np.cov(window.T) for window in windows]
+
+
+def solve_all(means, sigma_mats, method, warm_start):
+    weights_list = []
+    for i in range(len(means)):
+        initial_weights = weights_list[-1] if warm_start and weights_list else None
+        weights_list.append(mean_var_port_opt(means[i], sigma_mats[i], initial_weights, method)[0])
+    return weights_list
+
+
+def main(n_window=200):
+    print('Max Sharpe weights of {} rolling windows'.format(n_window))
+    for n_asset in [3, 10, 40]:
+        means, sigma_mats = create_moments(n_window, n_asset)
+        slsqp_weights = solve_all(means, sigma_mats, 'SLSQP', False)
+        active_set_weights = solve_all(means, sigma_mats, 'active_set', True)
+        SR_gain = min(port_SR(active_set_weights[i], means[i], sigma_mats[i]) -
+                      port_SR(slsqp_weights[i], means[i], sigma_mats[i]) for i in range(n_window))
+
+        times = [min(timeit.repeat(lambda: solve_all(means, sigma_mats, method, warm_start), number=1, repeat=3))
+                 for method, warm_start in [('SLSQP', False), ('active_set', False), ('active_set', True)]]
+        print('{:3} assets SLSQP: {:.2f}ms active set: {:.2f}ms warm: {:.2f}ms per window, '
+              'min SR gain over SLSQP: {:.2e}'.format(n_asset, *[1000 * t / n_window for t in times], SR_gain))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,75 @@
+''' Benchmark of the incremental moments of port_opt against computing them from scratch for each fitting period
+
+    The moments of an expanding fit computed from scratch cost the length of each period, i.e., a quadratic total
+    cost, while the MomentAccumulator only adds the rows of each step, i.e., a linear total cost.
+
+    Usage: python benchmarks/bench_port_opt.py [n_asset] [step]
+'''
+
+import io
+import sys
+import timeit
+import contextlib
+import numpy as np
+import pandas as pd
+from hydrogen.portopt import port_opt, generate_fitting_period, MomentAccumulator, markotwitz_port_opt
+
+
+def create_returns(n_date, n_asset, random_seed=0):
+    random_state = np.random.RandomState(random_seed)
+    returns = random_state.randn(n_date, n_asset) * 0.01 + 0.0003
+    # assets starting on different dates and a few missing values
+    for i in range(n_asset):
+        returns[:random_state.randint(256), i] = np.nan
+    returns[random_state.rand(n_date, n_asset) < 0.01] = np.nan
+    return pd.DataFrame(returns, index=pd.bdate_range('19900101', periods=n_date))
+
+
+def scratch_moments(returns, periods):
+    for start, end in periods:
+        accumulator = MomentAccumulator.from_returns(returns[start:end])
+        accumulator.mean(), accumulator.cov()
+
+
+def incremental_moments(returns, periods):
+    accumulator = MomentAccumulator(returns.shape[1])
+    for start, end in periods:
+        accumulator.update_window(returns, start, end)
+        accumulator.mean(), accumulator.cov()
+
+
+def main(n_asset=20, step=5):
+    print('Moments of expanding fitting periods of {} assets every {} days'.format(n_asset, step))
+    for n_date in [1000, 2000, 4000, 8000]:
+        return_df = create_returns(n_date, n_asset)
+        returns = return_df.values
+        periods = list(generate_fitting_period(return_df, 'expanding', step=step))
+
+        scratch_time = min(timeit.repeat(lambda: scratch_moments(returns, periods), number=1, repeat=3))
+        incremental_time = min(timeit.repeat(lambda: incremental_moments(returns, periods), number=1, repeat=3))
+        print('{:5} days {:5} periods from scratch: {:.3f}s incremental: {:.3f}s'.format(n_date, len(periods),
+                                                                                      scratch_time,
+                                                                                      incremental_time))
+
+    return_df = create_returns(2000, 4)
+    returns = return_df.values
+    periods = list(generate_fitting_period(return_df, 'expanding', step=22))
+    scratch_weights = np.array([markotwitz_port_opt(returns[start:end], use_standardise_vol=True)
+                                for start, end in periods])
+    with contextlib.redirect_stdout(io.StringIO()):
+        weights = port_opt(return_df, 'one_period', 'expanding', step=22, use_standardise_vol=True)
+    np.testing.assert_allclose(weights.values, scratch_weights, atol=1e-6)
+
+    print('port_opt one_period expanding of 4 assets every 22 days')
+    for n_date in [1000, 2000, 4000, 8000]:
+        return_df = create_returns(n_date, 4)
+        with contextlib.redirect_stdout(io.StringIO()):
+            port_opt_time = min(timeit.repeat(lambda: port_opt(return_df, 'one_period', 'expanding', step=22,
+                                                               use_standardise_vol=True), number=1, repeat=3))
+        n_period = len(list(generate_fitting_period(return_df, 'expanding', step=22)))
+        print('{:5} days {:5} periods: {:.3f}s, {:.2f}ms per period'.format(n_date, n_period, port_opt_time,
+                                                                           1000 * port_opt_time / n_period))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
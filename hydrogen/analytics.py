@@ -1,98 +1,336 @@
 import logging
 import numpy as np
 import pandas as pd
+from scipy.signal import lfilter
 import hydrogen.system as system
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+VOL_METHODS = ('SD', 'ATR', 'RS', 'YZ')
+
+
 def vol(price_df: pd.DataFrame, annualised, method: str = 'YZ', **kwargs) -> pd.Series:
     """
-    
+
     Args:
-        price_df: OHLC(V) Price Data Frame with regular interval
-        calc: The type of volatility calculation. At the moment, it supports SD, EWMA or ATR
+        price_df: OHLC(V) Price Data Frame with regular interval. It is not modified.
+        calc: The type of volatility calculation. At the moment, it supports SD, ATR, RS and YZ
+        kwargs: ewm=True for exponentially weighted statistics with span, com, alpha or halflife, otherwise a rolling
+            window, and optionally min_periods
 
     Returns:
         The volatility time series with the same length, with padded NA at the initial rows if necessary.
 
     """
+    return vols(price_df, annualised, methods=(method,), **kwargs)[method]
 
-    res = {
-        'SD': _vol_std_dev,
-        'ATR': _vol_atr,
-        'RS': _vol_rs,
-        'YZ': _vol_yz
-    }.get(method)(price_df, **kwargs)
 
-    if annualised:
-        res *= system.root_n_bday_in_year
+def vols(price_df: pd.DataFrame, annualised, methods=VOL_METHODS, **kwargs) -> pd.DataFrame:
+    ''' Several volatility estimates of the same prices, sharing the log price building blocks
 
-    return res
+    Args:
+        price_df: OHLC(V) Price Data Frame with regular interval. It is not modified.
+        annualised: Scale the daily volatility to annual
+        methods: Any of SD, ATR, RS and YZ
+        kwargs: See vol
 
+    Returns:
+        A data frame with one volatility time series per method
+    '''
+    def column(name):
+        return price_df[name].values if name in price_df else None
 
-def _vol_std_dev(price_df: pd.DataFrame, ewm=False, **kwargs) -> pd.Series:
-    price_df["CLOSE_PREV"] = price_df.CLOSE.shift(1)
-    log_return = np.log(price_df.CLOSE / price_df.CLOSE_PREV)
+    res = vol_arrays(column('OPEN'), column('HIGH'), column('LOW'), column('CLOSE'), methods=methods,
+                     annualised=annualised, **kwargs)
+    return pd.DataFrame(res, index=price_df.index, columns=list(methods))
 
-    if ewm:
-        res = log_return.ewm(**kwargs).std()
-    else:
-        res = log_return.rolling(**kwargs).std()
 
-    return res
+def vol_panel(open_df: pd.DataFrame, high_df: pd.DataFrame, low_df: pd.DataFrame, close_df: pd.DataFrame,
+              annualised, method: str = 'YZ', **kwargs) -> pd.DataFrame:
+    ''' Volatility of many instruments at once
+
+    Each instrument is computed on its own dates, i.e., the dates on which it has any price, so that the result is the
+    same as calling vol instrument by instrument even though the panels are aligned on a common calendar, e.g., with
+    instruments starting on different dates or trading on different holidays.
+
+    Args:
+        open_df, high_df, low_df, close_df: Prices of dates by instruments. Only the ones used by the method are needed,
+            the others can be None.
+        annualised: Scale the daily volatility to annual
+        method: SD, ATR, RS or YZ
+        kwargs: See vol
+
+    Returns:
+        A data frame of volatility of the same dates by instruments as close_df, NA on the dates without price
+    '''
+    panels = [None if df is None else df.reindex(index=close_df.index, columns=close_df.columns).values
+              for df in (open_df, high_df, low_df, close_df)]
+
+    has_price = np.zeros(close_df.shape, dtype=bool)
+    for panel in panels:
+        if panel is not None:
+            has_price |= ~np.isnan(panel)
+
+    row_order, col_index = own_dates_order(has_price)
+    panels = [None if panel is None else panel[row_order, col_index] for panel in panels]
+
+    compact_res = vol_arrays(*panels, methods=(method,), annualised=annualised, **kwargs)[method]
 
+    res = np.empty(close_df.shape)
+    res[row_order, col_index] = compact_res
+    res[~has_price] = np.nan
 
-def _vol_atr(price_df: pd.DataFrame, ewm=False, **kwargs):
-    price_df["CLOSE_PREV"] = price_df.CLOSE.shift(1)
-    true_range_series = np.maximum(np.maximum(
-        price_df.HIGH - price_df.LOW,
-        np.abs(price_df.HIGH - price_df.CLOSE_PREV)),
-        np.abs(price_df.CLOSE - price_df.CLOSE_PREV))
+    return pd.DataFrame(res, index=close_df.index, columns=close_df.columns)
 
-    if ewm:
-        average_true_range_series = true_range_series.ewm(**kwargs).mean()  # i.e., span=27, alpha=1/14
-    else:
-        average_true_range_series = true_range_series.rolling(**kwargs).mean()  # i.e., span=27, alpha=1/14
 
-    return average_true_range_series #/ price_df.CLOSE / 1.645
+def own_dates_order(has_value):
+    ''' Index moving the dates of each column of a panel to the top of the column, keeping their order
 
+    Args:
+        has_value: Boolean array of dates by instruments, True on the dates of the instrument
+
+    Returns:
+        A tuple of row and column index arrays, such that panel[row_order, col_index] is the compacted panel and
+        res[row_order, col_index] = compacted_res scatters a result back to the original dates
+    '''
+    row_order = np.argsort(~has_value, axis=0, kind='mergesort')
+    col_index = np.arange(has_value.shape[1])
+    return row_order, col_index
+
+
+def ewm_mean(values, **kwargs):
+    ''' Exponentially weighted mean along the first axis of an array, as pandas ewm(**kwargs).mean()
+
+    Args:
+        values: 1D or 2D array, dates along the first axis
+        kwargs: span, com, alpha or halflife, and optionally min_periods
+
+    Returns:
+        An array of the same shape as values
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _EWMStats(**kwargs).mean(np.asarray(values, dtype=np.float64))
+
+
+def rolling_extrema(values, windows):
+    ''' Rolling max and min along the first axis for many windows, as pandas rolling(window).max() and min()
+
+    A sparse table of the max and min over the trailing 2**k values is built once for the largest window, and the
+    extrema over any window are the extrema of two overlapping power of two blocks. A window with a missing value
+    gives NA.
+
+    Args:
+        values: 1D or 2D array, dates along the first axis
+        windows: List of window sizes
+
+    Returns:
+        A dict of window to a tuple of (rolling max, rolling min), arrays of the same shape as values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    n_row = len(values)
+    levels = sorted(set(int(np.log2(window)) for window in windows))
 
-def _vol_rs(price_df: pd.DataFrame, ewm=False, **kwargs):
-    a = np.log(price_df.HIGH / price_df.CLOSE) * np.log(price_df.HIGH / price_df.OPEN)
-    b = np.log(price_df.LOW / price_df.CLOSE) * np.log(price_df.LOW / price_df.OPEN)
+    block_max = {}
+    block_min = {}
+    level_max = level_min = values
+    for level in range(levels[-1] + 1 if levels else 0):
+        if level > 0:
+            half = 2 ** (level - 1)
+            next_max = np.full_like(values, np.nan)
+            next_min = np.full_like(values, np.nan)
+            next_max[half:] = np.maximum(level_max[half:], level_max[:-half])
+            next_min[half:] = np.minimum(level_min[half:], level_min[:-half])
+            level_max, level_min = next_max, next_min
+        if level in levels:
+            block_max[level] = level_max
+            block_min[level] = level_min
 
-    if ewm:
-        res = np.sqrt((a + b).ewm(**kwargs).mean())
-    else:
-        res = np.sqrt((a + b).rolling(**kwargs).mean())
+    res = {}
+    for window in windows:
+        level = int(np.log2(window))
+        block = 2 ** level
+        roll_max = np.full_like(values, np.nan)
+        roll_min = np.full_like(values, np.nan)
+        if window <= n_row:
+            roll_max[window - 1:] = np.maximum(block_max[level][window - 1:],
+                                               block_max[level][block - 1:n_row - window + block])
+            roll_min[window - 1:] = np.minimum(block_min[level][window - 1:],
+                                               block_min[level][block - 1:n_row - window + block])
+        res[window] = (roll_max, roll_min)
 
     return res
 
 
-def _vol_yz(price_df: pd.DataFrame, ewm=False, **kwargs):
-    price_df["CLOSE_PREV"] = price_df.CLOSE.shift(1)
+def vol_arrays(open_, high, low, close, methods=('YZ',), annualised=False, ewm=False, **kwargs):
+    ''' Fused volatility kernel over arrays of prices
 
-    rs_vol = _vol_rs(price_df, ewm, **kwargs)
-    #rs_vol = _vol_rs(price_df, ewm, window=66)
+    The log prices are taken once and every estimator is built from their differences, with the rolling or
+    exponentially weighted statistics computed along the first axis, so a 2D array of dates by instruments is
+    processed in one go. Missing prices are skipped the same way as pandas rolling and ewm do.
 
-    rs_var = rs_vol * rs_vol
+    Args:
+        open_, high, low, close: Arrays of prices of the same shape, dates along the first axis. Only the ones used by
+            methods are needed, e.g., SD only needs close.
+        methods: Any of SD, ATR, RS and YZ
+        annualised: Scale the daily volatility to annual
+        ewm: Use exponentially weighted statistics (adjust=True, ignore_na=False) instead of a rolling window
+        kwargs: span, com, alpha or halflife when ewm, otherwise window, and optionally min_periods
+
+    Returns:
+        A dict of method to volatility array, of the same shape as the prices
+    '''
+    unknown_methods = [method for method in methods if method not in VOL_METHODS]
+    if unknown_methods:
+        raise ValueError('Unknown vol methods {}, expected any of {}'.format(unknown_methods, VOL_METHODS))
+
+    window_stats = _EWMStats(**kwargs) if ewm else _RollingStats(**kwargs)
 
-    if ewm:
-        overnight_var = np.log(price_df.OPEN / price_df.CLOSE_PREV).ewm(**kwargs).var()
-        open_close_var = np.log(price_df.CLOSE / price_df.OPEN).ewm(**kwargs).var()
-        window = kwargs['span']
-    else:
-        overnight_var = np.log(price_df.OPEN / price_df.CLOSE_PREV).rolling(**kwargs).var()
-        open_close_var = np.log(price_df.CLOSE / price_df.OPEN).rolling(**kwargs).var()
-        window = kwargs['window']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_close = np.log(np.asarray(close, dtype=np.float64))
+        log_close_prev = _shift(log_close)
+
+        if 'RS' in methods or 'YZ' in methods:
+            log_open = np.log(np.asarray(open_, dtype=np.float64))
+            log_high = np.log(np.asarray(high, dtype=np.float64))
+            log_low = np.log(np.asarray(low, dtype=np.float64))
+            rs_term = ((log_high - log_close) * (log_high - log_open) +
+                       (log_low - log_close) * (log_low - log_open))
+            rs_vol = np.sqrt(window_stats.mean(rs_term))
+
+        res = {}
+        for method in methods:
+            if method == 'SD':
+                res[method] = np.sqrt(window_stats.var(log_close - log_close_prev))
+            elif method == 'ATR':
+                close = np.asarray(close, dtype=np.float64)
+                close_prev = _shift(close)
+                high = np.asarray(high, dtype=np.float64)
+                true_range = np.maximum(np.maximum(high - np.asarray(low, dtype=np.float64),
+                                                   np.abs(high - close_prev)),
+                                        np.abs(close - close_prev))
+                res[method] = window_stats.mean(true_range)
+            elif method == 'RS':
+                res[method] = rs_vol
+            elif method == 'YZ':
+                overnight_var = window_stats.var(log_open - log_close_prev)
+                open_close_var = window_stats.var(log_close - log_open)
+                window = window_stats.window
+                k = 0.34 / (1.34 + (window + 1) / (window - 1))
+                res[method] = np.sqrt(overnight_var + k * open_close_var + (1 - k) * rs_vol * rs_vol)
+
+    if annualised:
+        res = {method: value * system.root_n_bday_in_year for method, value in res.items()}
 
-        #overnight_var = np.log(price_df.OPEN / price_df.CLOSE_PREV).rolling(window=66).var()
-        #pen_close_var = np.log(price_df.CLOSE / price_df.OPEN).rolling(window=66).var()
-        #window = 66
+    return res
 
-    k = 0.34 / (1.34 + (window + 1) / (window - 1))
 
-    res =  np.sqrt(overnight_var + k * open_close_var + (1 - k) * rs_var)
+def _shift(x):
+    ''' Shift an array by one row along the first axis, padding with NaN '''
+    res = np.empty_like(x)
+    res[:1] = np.nan
+    res[1:] = x[:-1]
     return res
+
+
+class _RollingStats:
+    ''' NaN aware rolling mean and variance (ddof=1) along the first axis, as pandas rolling with min_periods
+
+    Non-finite values are missing as in pandas, so that one infinite value, e.g., the log return of a zero price, only
+    spoils the windows it is in rather than every later cumulative sum.
+    '''
+
+    def __init__(self, window, min_periods=None, center=False):
+        if center:
+            raise ValueError('Centred rolling window is not supported')
+        self.window = int(window)
+        self.min_periods = self.window if min_periods is None else max(int(min_periods), 1)
+
+    def _sum(self, x):
+        res = np.cumsum(x, axis=0)
+        res[self.window:] -= res[:-self.window].copy()
+        return res
+
+    def _sums(self, x):
+        is_valid = np.isfinite(x)
+        return np.where(is_valid, x, 0.0), self._sum(is_valid.astype(np.int64))
+
+    def mean(self, x):
+        x, n_obs = self._sums(x)
+        res = self._sum(x) / n_obs
+        res[n_obs < self.min_periods] = np.nan
+        return res
+
+    def var(self, x):
+        # centre first so that the sum of squares does not swamp the variance
+        x = x - _nanmean(x)
+        x, n_obs = self._sums(x)
+        x_sum = self._sum(x)
+        res = np.maximum(self._sum(x * x) - x_sum * x_sum / n_obs, 0.0) / (n_obs - 1)
+        res[(n_obs < self.min_periods) | (n_obs < 2)] = np.nan
+        return res
+
+
+class _EWMStats:
+    ''' NaN aware exponentially weighted mean and unbiased variance along the first axis, as pandas ewm with
+        adjust=True and ignore_na=False
+
+    The weighted sums are first order recursions, which are run as linear filters.
+    '''
+
+    def __init__(self, span=None, com=None, alpha=None, halflife=None, min_periods=0, adjust=True,
+                 ignore_na=False):
+        if not adjust or ignore_na:
+            raise ValueError('Only adjust=True and ignore_na=False are supported')
+
+        params = [param for param in (span, com, alpha, halflife) if param is not None]
+        if len(params) != 1:
+            raise ValueError('Exactly one of span, com, alpha and halflife is required')
+
+        if span is not None:
+            alpha = 2.0 / (span + 1.0)
+        elif com is not None:
+            alpha = 1.0 / (com + 1.0)
+        elif halflife is not None:
+            alpha = 1.0 - np.exp(np.log(0.5) / halflife)
+
+        self.alpha = float(alpha)
+        self.min_periods = max(int(min_periods), 1)
+        # the span equivalent to the decay, used as the window of the YZ estimator
+        self.window = 2.0 / self.alpha - 1.0
+
+    def _filter(self, x, decay):
+        return lfilter([1.0], [1.0, -decay], x, axis=0)
+
+    def _sums(self, x):
+        # non-finite values are missing as in pandas, an infinite value would stay in the recursions forever
+        is_valid = np.isfinite(x)
+        weight_sum = self._filter(is_valid.astype(np.float64), 1.0 - self.alpha)
+        n_obs = np.cumsum(is_valid, axis=0)
+        return np.where(is_valid, x, 0.0), is_valid, weight_sum, n_obs
+
+    def mean(self, x):
+        x, is_valid, weight_sum, n_obs = self._sums(x)
+        res = self._filter(x, 1.0 - self.alpha) / weight_sum
+        res[n_obs < self.min_periods] = np.nan
+        return res
+
+    def var(self, x):
+        x = x - _nanmean(x)
+        x, is_valid, weight_sum, n_obs = self._sums(x)
+        mean = self._filter(x, 1.0 - self.alpha) / weight_sum
+        biased_var = np.maximum(self._filter(x * x, 1.0 - self.alpha) / weight_sum - mean * mean, 0.0)
+
+        weight_square_sum = self._filter(is_valid.astype(np.float64), (1.0 - self.alpha) ** 2)
+        weight_sum_square = weight_sum * weight_sum
+        res = biased_var * weight_sum_square / (weight_sum_square - weight_square_sum)
+        res[(n_obs < self.min_periods) | (n_obs < 2)] = np.nan
+        return res
+
+
+def _nanmean(x):
+    ''' Mean along the first axis ignoring NaN and infinite values, zero for columns without a finite value '''
+    is_valid = np.isfinite(x)
+    n_obs = is_valid.sum(axis=0)
+    return np.where(is_valid, x, 0.0).sum(axis=0) / np.maximum(n_obs, 1)
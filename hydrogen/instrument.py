@@ -1,34 +1,111 @@
+import copy
 import logging
+import threading
+from collections import namedtuple, OrderedDict
 import numpy as np
 import pandas as pd
-import os
 import hydrogen.system as system
 from pandas.tseries.offsets import BDay
 import hydrogen.analytics
+from hydrogen.market_data import ohlcv_store, static_store
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+_Chain = namedtuple('_Chain', ['contract_map', 'fields', 'keys', 'values'])
+
+
+class lazy_artefact:
+    ''' Derived data of an instrument computed on first access and memoised on the instance
+
+    The value is stored in the instance __dict__ under the same name, which then takes precedence over this
+    (non-data) descriptor, so later accesses are plain attribute lookups.
+    '''
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        logger.debug('Materialising {} of {}'.format(self.name, instance._ticker))
+        value = self.func(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
 class InstrumentFactory():
     ''' Instrument factory that is responsible to create instrument objects
 
     Ticker suffix (based on bloomberg convention) is used to determine what instrument object to create,
     e.g. Curncy is for FX. It only supports Future and FX.
 
+    Instruments are interned in a process-wide registry keyed by (ticker, as_of_date), so creating the same
+    instrument twice, e.g., the USDUSD Curncy leg of every USD future, returns the same shared object. The registry
+    keeps the registry_size most recently used instruments, e.g., the last days of a walk-forward advancing them.
+
+    Shared instruments must be treated as read-only. This is not enforced: their data frames are plain pandas objects,
+    which cannot be locked reliably, and copying them on access would defeat the sharing and the vol cache. Create
+    an instrument with use_registry=False to modify it.
+
     '''
 
+    _registry = OrderedDict()
+    _registry_lock = threading.Lock()
+    registry_size = 256
+
+    @staticmethod
+    def _registry_key(ticker: str, as_of_date):
+        return ticker, pd.Timestamp(as_of_date)
+
     def create_instrument(self, ticker: str,
-                          as_of_date=pd.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)):
+                          as_of_date=pd.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0),
+                          use_registry=True):
         '''Create instrument object based on the ticker suffix
 
         Args:
             ticker: Bloomberg ticker, e.g., ES1 Index
             as_of_date: The date of the instrument
+            use_registry: Return the shared instrument from the registry, creating and registering it if necessary
 
         Returns:
             An instrument object of the given ticker with meta data and price data as of as_of_date.
         '''
+        if not use_registry:
+            return self._create_instrument(ticker, as_of_date)
+
+        key = self._registry_key(ticker, as_of_date)
+        instrument = self._registry_get(key)
+
+        if instrument is None:
+            # build outside the lock as a future creates its FX leg through the factory as well
+            instrument = self._registry_add(key, self._create_instrument(ticker, as_of_date))
+
+        return instrument
+
+    @classmethod
+    def _registry_get(cls, key):
+        with cls._registry_lock:
+            instrument = cls._registry.get(key)
+            if instrument is not None:
+                cls._registry.move_to_end(key)
+            return instrument
+
+    @classmethod
+    def _registry_add(cls, key, instrument):
+        ''' Register the instrument unless key is already registered, evicting the least recently used ones '''
+        with cls._registry_lock:
+            instrument = cls._registry.setdefault(key, instrument)
+            cls._registry.move_to_end(key)
+            while len(cls._registry) > cls.registry_size:
+                cls._registry.popitem(last=False)
+            return instrument
+
+    def _create_instrument(self, ticker: str, as_of_date):
         logger.debug('Creating instrument {}'.format(ticker))
         prefix, suffix = ticker.rsplit(" ", maxsplit=1)
         class_map = {"Curncy": FX,
@@ -37,27 +114,145 @@ class InstrumentFactory():
                      }
         return class_map[suffix](ticker, as_of_date)
 
+    def advance_instrument(self, instrument, as_of_date):
+        ''' Return the registered instrument as of a later date, advancing the given one if there is none
+
+        Args:
+            instrument: An instrument object as of an earlier date
+            as_of_date: The new date of the instrument
+
+        Returns:
+            An instrument object of the same ticker as of as_of_date
+        '''
+        registered_instrument = self._registry_get(self._registry_key(instrument._ticker, as_of_date))
+        if registered_instrument is not None:
+            return registered_instrument
+
+        return self.register(instrument.advance_to(as_of_date))
+
+    @classmethod
+    def register(cls, instrument):
+        ''' Add an instrument built elsewhere, e.g., in another process, to the registry
+
+        Returns:
+            The registered instrument, which is the existing one if the same ticker and as of date is already registered
+        '''
+        fx = getattr(instrument, 'fx', None)
+        if fx is not None:
+            instrument.fx = cls.register(fx)
+
+        return cls._registry_add(cls._registry_key(instrument._ticker, instrument._as_of_date), instrument)
+
+    @classmethod
+    def evict(cls, ticker: str = None, as_of_date=None):
+        ''' Remove instruments from the registry
+
+        Args:
+            ticker: Only remove instruments of this ticker, all tickers if None
+            as_of_date: Only remove instruments as of this date, all dates if None
+
+        Returns:
+            The number of instruments removed
+        '''
+        as_of_date = None if as_of_date is None else pd.Timestamp(as_of_date)
+        with cls._registry_lock:
+            keys = [key for key in cls._registry
+                    if (ticker is None or key[0] == ticker) and (as_of_date is None or key[1] == as_of_date)]
+            for key in keys:
+                del cls._registry[key]
+        return len(keys)
+
+    @classmethod
+    def clear_registry(cls):
+        ''' Remove all instruments from the registry '''
+        cls.evict()
+
+    @classmethod
+    def registered(cls):
+        ''' Return the (ticker, as_of_date) keys of the instruments in the registry '''
+        with cls._registry_lock:
+            return sorted(cls._registry)
 
 
 class Instrument:
     ''' Based class to model tradable instruments with bloomberg ticker serve as identifier '''
 
-    _BBG_FIELD_MAP = {'PX_OPEN': 'OPEN',
-                      'PX_LOW': 'LOW',
-                      'PX_HIGH': 'HIGH',
-                      'PX_LAST': 'CLOSE',
-                      'PX_VOLUME': 'VOLUME',
-                      'ROLL_DT': 'ROLL_DT',
-                      }
+    _BBG_FIELD_MAP = static_store.BBG_FIELD_MAP
 
     def __init__(self, ticker: str, as_of_date):
         self._ticker = ticker
         self._as_of_date = as_of_date
         self.b_day_list = pd.date_range('20050101', as_of_date, freq='1B')
+        self._vol_cache = {}
 
     def __repr__(self):
         return str(self.__class__) + ":" + self._ticker + " as of " + str(self._as_of_date)
 
+    def advance_to(self, as_of_date):
+        ''' Roll the instrument forward to a later as of date
+
+        Only the bars after the current as of date are added, so this gives the same result as creating the
+        instrument as of the new date without rebuilding its whole history. The data of these bars is read again, so the
+        bars added to the OHLCV store after the instrument was created are included.
+
+        Args:
+            as_of_date: The new date of the instrument, not earlier than the current one
+
+        Returns:
+            A new instrument object as of as_of_date. The instrument itself is left unchanged.
+        '''
+        previous_as_of_date = pd.Timestamp(self._as_of_date)
+        as_of_date = pd.Timestamp(as_of_date)
+
+        if as_of_date < previous_as_of_date:
+            raise ValueError('Cannot advance {} as of {} back to {}'.format(self._ticker, previous_as_of_date,
+                                                                           as_of_date))
+
+        instrument = copy.copy(self)
+        instrument._as_of_date = as_of_date
+        instrument.b_day_list = pd.date_range('20050101', as_of_date, freq='1B')
+        instrument._vol_cache = {}
+        instrument._advance(previous_as_of_date)
+        return instrument
+
+    def _advance(self, previous_as_of_date):
+        ''' Append the data between previous_as_of_date (exclusively) and self._as_of_date
+
+        By default, the instrument is created again as of the new date, with all its derived data computed on demand.
+        '''
+        ticker, as_of_date = self._ticker, self._as_of_date
+        self.__dict__.clear()
+        self.__init__(ticker, as_of_date)
+
+    @classmethod
+    def artefacts(cls):
+        ''' Return the names of the derived data computed on demand '''
+        names = []
+        for klass in reversed(cls.__mro__):
+            names.extend(name for name, value in vars(klass).items()
+                         if isinstance(value, lazy_artefact) and name not in names)
+        return names
+
+    def materialized_artefacts(self):
+        ''' Return the names of the derived data computed so far '''
+        return [name for name in self.artefacts() if name in self.__dict__]
+
+    def materialize(self):
+        ''' Compute all the derived data now, including the ones of the FX leg, e.g., in a worker loading instruments
+
+        Returns:
+            The instrument itself
+        '''
+        for name in self._applicable_artefacts():
+            value = getattr(self, name)
+            if isinstance(value, Instrument):
+                value.materialize()
+        return self
+
+    def _applicable_artefacts(self):
+        ''' Return the names of the derived data this instrument has '''
+        return self.artefacts()
+
     @property
     def ccy(self):
         return self._ccy
@@ -82,23 +277,56 @@ class Instrument:
         '''
         return self._unadjusted_ohlcv
 
+    def _load_ohlcv(self, ticker):
+        ''' Load the raw daily prices of the ticker from the OHLCV store, with Bloomberg fields renamed '''
+        return ohlcv_store.read_ohlcv(ticker).rename(columns=self._BBG_FIELD_MAP)
+
     @property
     def price_diff(self):
         return self.ohlcv.CLOSE.diff()
 
-    def vol_pct(self):
-        '''' SD of % daily change '''
-        return 100 * hydrogen.analytics.vol(self.ohlcv, method='YZ', window=system.n_bday_in_3m, annualised=False)
+    def vol_pct(self, method='YZ', window=system.n_bday_in_3m, annualised=False):
+        ''' SD of % daily change, memoised until the adjusted OHLCV changes '''
+        return self._cached_vol(('pct', method, window, annualised, False), (self.ohlcv,),
+                                lambda: 100 * hydrogen.analytics.vol(self.ohlcv, method=method, window=window,
+                                                                     annualised=annualised))
+
+    def vol_price(self, to_usd=False, method='YZ', window=system.n_bday_in_3m, annualised=False):
+        ''' Vol of one contract in price terms, in local currency unless to_usd, memoised like vol_pct '''
+        fx_ohlcv = self.fx.ohlcv if to_usd and self.ccy != 'USD' else None
+        sources = (self.ohlcv, self.unadjusted_ohlcv, fx_ohlcv)
+
+        def calc_vol_price():
+            vol = self.vol_pct(method, window, annualised) * self.cont_size * self.unadjusted_ohlcv.CLOSE
+            if fx_ohlcv is not None:
+                vol = vol * fx_ohlcv.CLOSE.reindex(vol.index)
+            return vol
+
+        return self._cached_vol(('price', method, window, annualised, to_usd), sources, calc_vol_price)
 
-    def vol_price(self, to_usd=False):
-        ''' ccy = None means local currency '''
-        vol = self.vol_pct() * self.cont_size * self.unadjusted_ohlcv.CLOSE
+    def _cached_vol(self, key, sources, calc_vol):
+        ''' Return the cached vol of key, calculating it again if any of the source data frames has been replaced
 
-        if to_usd and self.ccy != 'USD':
-            vol = vol * self.fx.ohlcv.CLOSE[self.instrument_currency_vol.index]
+        Args:
+            key: (kind, method, window, annualised, to_usd)
+            sources: The data frames the vol is calculated from, compared by identity
+            calc_vol: Function calculating the vol
+
+        Returns:
+            The vol time series, shared between callers so it must not be modified in place
+        '''
+        entry = self._vol_cache.get(key)
+        if entry is not None and all(cached is source for cached, source in zip(entry[0], sources)):
+            return entry[1]
 
+        vol = calc_vol()
+        self._vol_cache[key] = (sources, vol)
         return vol
 
+    def invalidate_vol_cache(self):
+        ''' Drop the memoised vol, e.g., after the OHLCV data frames have been modified in place '''
+        self._vol_cache.clear()
+
     @property
     def cont_size(self):
         return self._cont_size
@@ -115,7 +343,7 @@ class Instrument:
 
     @property
     def cost_in_SR(self):
-        return 2 * self.cost / (system.root_n_bday_in_year * self.vol_price)
+        return 2 * self.cost / (system.root_n_bday_in_year * self.vol_price())
 
     def calc_annual_yield(self):
         ct_distance = self._static_df.MONTHS_BTW_CT.iloc[0]
@@ -137,23 +365,34 @@ class FX(Instrument):
         # TODO: END
 
         self._ccy = None
-        self._ohlcv = self._read_ohlcv(self._ticker)
-        self._unadjusted_ohlcv = self._ohlcv
 
-        prefix, suffix = self._ticker.rsplit(" ", maxsplit=1)
-        carry_ticker = prefix + 'CR ' + suffix
+    @lazy_artefact
+    def _raw_ohlcv(self):
+        return self._load_ohlcv(self._ticker)
 
-        self._cr_ohlcv = self._read_ohlcv(carry_ticker)
+    @lazy_artefact
+    def _ohlcv(self):
+        return self._resample(self._raw_ohlcv)
 
-    def _read_ohlcv(self, filename):
-        ohlcv_df = pd.DataFrame()
+    @property
+    def _unadjusted_ohlcv(self):
+        return self._ohlcv
+
+    @lazy_artefact
+    def _raw_cr_ohlcv(self):
+        prefix, suffix = self._ticker.rsplit(" ", maxsplit=1)
+        carry_ticker = prefix + 'CR ' + suffix
+        return self._load_ohlcv(carry_ticker)
 
-        filename = os.path.join(system.ohlcv_path, self._ticker + '.csv')
+    @lazy_artefact
+    def _cr_ohlcv(self):
+        return self._resample(self._raw_cr_ohlcv)
 
-        if os.path.exists(filename):
-            ohlcv_df = pd.read_csv(filename, index_col='DATE').rename(columns=self._BBG_FIELD_MAP)
-            ohlcv_df.index = pd.to_datetime(ohlcv_df.index)
+    def _read_ohlcv(self, ticker):
+        return self._resample(self._load_ohlcv(ticker))
 
+    def _resample(self, ohlcv_df):
+        if not ohlcv_df.empty:
             # only see data up to as of date (inclusively)
             ohlcv_df = ohlcv_df[:self._as_of_date]
 
@@ -162,6 +401,33 @@ class FX(Instrument):
 
         return ohlcv_df
 
+    def _append_resampled(self, ohlcv_df, raw_ohlcv_df):
+        ''' Extend the resampled ohlcv_df up to as of date with the business days after its last date '''
+        if ohlcv_df.empty:
+            return self._resample(raw_ohlcv_df)
+
+        last_date = ohlcv_df.index[-1]
+
+        # resampling from the last raw row already used gives the same days as resampling the whole history
+        start = max(raw_ohlcv_df.index.searchsorted(last_date, side='right') - 1, 0)
+        tail = self._resample(raw_ohlcv_df.iloc[start:])
+
+        return pd.concat([ohlcv_df, tail[tail.index > last_date]])
+
+    def _advance(self, previous_as_of_date):
+        # artefacts not computed yet are left to be computed as of the new date
+        materialized_artefacts = self.materialized_artefacts()
+
+        # the raw prices are read again as bars may have been added to the store since they were loaded
+        for name in ['_raw_ohlcv', '_raw_cr_ohlcv']:
+            self.__dict__.pop(name, None)
+
+        if '_ohlcv' in materialized_artefacts:
+            self._ohlcv = self._append_resampled(self._ohlcv, self._raw_ohlcv)
+
+        if '_cr_ohlcv' in materialized_artefacts:
+            self._cr_ohlcv = self._append_resampled(self._cr_ohlcv, self._raw_cr_ohlcv)
+
 class Future(Instrument):
     '''Future instrument
     
@@ -179,34 +445,117 @@ class Future(Instrument):
         self._ccy = self._static_df.CRNCY.values[0]
         self._adj_info = self._get_adj_info(n_day=-1)
 
-        instrument_factory = InstrumentFactory()
-        self.fx = instrument_factory.create_instrument(self._ccy + 'USD Curncy')
-
-        if read_multiple_files:
-            self._unadjusted_ohlcv, self._ohlcv, self._adj = self._calc_ohlcv(self._adj_info, method='panama', dropna=True)
-
-            back_adj_info = self._adj_info.copy()
-            back_adj_info.TICKER = back_adj_info.TICKER.shift(-1)
-            back_adj_info.NEXT_TICKER = back_adj_info.NEXT_TICKER.shift(-1)
-            back_adj_info = back_adj_info[:-1]
-            self._back_ohlcv_df = self._calc_ohlcv(back_adj_info, method='no_adj', dropna=False)[0]
+        self._read_multiple_files = read_multiple_files
+        self._adj_method = 'panama'
 
-            # calculate the days between contract
-            # n_day_btw_contracts = self._adj_dates.END_DATE.diff().shift(-2).dt.days
-            # n_day_btw_contracts.index = pd.to_datetime(self._adj_dates.FUT_NOTICE_FIRST)
-            # self._n_day_btw_contracts = n_day_btw_contracts.asof(self._ohlcv.index)
-
-        else:
-            self._unadjusted_ohlcv = self._read_ohlcv(self._static_df.TICKER.iloc[0],
-                                                      self._adj_info.START_DATE.iloc[0],
-                                                      self._adj_info.END_DATE.iloc[0],
-                                                      resample=False)
-            self._ohlcv = self.unadjusted_ohlcv
+        # calculate the days between contract
+        # n_day_btw_contracts = self._adj_dates.END_DATE.diff().shift(-2).dt.days
+        # n_day_btw_contracts.index = pd.to_datetime(self._adj_dates.FUT_NOTICE_FIRST)
+        # self._n_day_btw_contracts = n_day_btw_contracts.asof(self._ohlcv.index)
 
     @property
     def ticker_list(self):
         return self._static_df.TICKER.values
 
+    @lazy_artefact
+    def fx(self):
+        ''' The FX instrument converting the currency of the future to USD '''
+        return InstrumentFactory().create_instrument(self._ccy + 'USD Curncy', as_of_date=self._as_of_date)
+
+    @lazy_artefact
+    def _unadjusted_ohlcv(self):
+        if self._read_multiple_files:
+            return self._stitch(self._adj_info, dropna=True)
+
+        return self._read_ohlcv(self._static_df.TICKER.iloc[0],
+                                self._adj_info.START_DATE.iloc[0],
+                                self._adj_info.END_DATE.iloc[0],
+                                resample=False)
+
+    @lazy_artefact
+    def _ohlcv(self):
+        if not self._read_multiple_files:
+            return self._unadjusted_ohlcv
+
+        ohlcv, self._adj = self._adjust(self._unadjusted_ohlcv, self._next_close(self._adj_info), self._adj_method)
+        return ohlcv
+
+    def _applicable_artefacts(self):
+        # a single contract has no adjustment nor back contract
+        if not self._read_multiple_files:
+            return [name for name in self.artefacts() if name not in ['_adj', '_back_ohlcv_df']]
+        return self.artefacts()
+
+    @lazy_artefact
+    def _adj(self):
+        if not self._read_multiple_files:
+            raise AttributeError('{} is a single contract without adjustment'.format(self._ticker))
+
+        self._ohlcv, adj = self._adjust(self._unadjusted_ohlcv, self._next_close(self._adj_info), self._adj_method)
+        return adj
+
+    @lazy_artefact
+    def _back_ohlcv_df(self):
+        if not self._read_multiple_files:
+            raise AttributeError('{} is a single contract without back contract'.format(self._ticker))
+
+        return self._stitch(self._back_adj_info(), dropna=False)
+
+    def _back_adj_info(self):
+        ''' The windows of the back contract, i.e., the contract after the front contract of each window '''
+        back_adj_info = self._adj_info.copy()
+        back_adj_info.TICKER = back_adj_info.TICKER.shift(-1)
+        back_adj_info.NEXT_TICKER = back_adj_info.NEXT_TICKER.shift(-1)
+        return back_adj_info[:-1]
+
+    def _advance(self, previous_as_of_date):
+        # artefacts not computed yet are left to be computed as of the new date
+        materialized_artefacts = self.materialized_artefacts()
+
+        if 'fx' in materialized_artefacts:
+            self.fx = InstrumentFactory().advance_instrument(self.fx, self._as_of_date)
+
+        if '_chain' in materialized_artefacts:
+            # the bars of the contracts traded since the previous as of date may have been added to the store since
+            # the chain was loaded, i.e., the contracts whose windows overlap it and the next and back contracts
+            adj_info = self._adj_info
+            is_traded = (pd.DatetimeIndex(adj_info.END_DATE) > previous_as_of_date) & \
+                (pd.DatetimeIndex(adj_info.START_DATE) <= self._as_of_date)
+            contract_map = self._chain.contract_map
+            self._chain = self._reload_chain(set(adj_info.TICKER[is_traded]) | set(adj_info.NEXT_TICKER[is_traded]))
+
+            # a contract without data contributed no rows, so once it has some, its missing days are in the history
+            if not set(self._chain.contract_map) <= set(contract_map):
+                self.__dict__.pop('_back_ohlcv_df', None)
+
+        if not self._read_multiple_files:
+            for name in ['_unadjusted_ohlcv', '_ohlcv']:
+                self.__dict__.pop(name, None)
+            return
+
+        if '_unadjusted_ohlcv' in materialized_artefacts:
+            new_df = self._stitch(self._adj_info, dropna=True, after_date=previous_as_of_date)
+            df_no_adj = pd.concat([self._unadjusted_ohlcv, new_df])
+
+            if '_ohlcv' in materialized_artefacts:
+                next_close = self._next_close(self._adj_info)
+
+                if (next_close.index > previous_as_of_date).any() or self._adj_method == 'no_adj':
+                    # a roll boundary is crossed, so the adjustment of the whole history changes
+                    self._ohlcv, self._adj = self._adjust(df_no_adj, next_close, self._adj_method)
+                elif not new_df.empty:
+                    # the bars after the last roll are never adjusted, so they are appended as they are
+                    df, adj = self._adjust(new_df, next_close[:0], self._adj_method)
+                    self._ohlcv = pd.concat([self._ohlcv, df])
+                    self._adj = pd.concat([self._adj, adj])
+
+            self._unadjusted_ohlcv = df_no_adj
+
+        if '_back_ohlcv_df' in self.__dict__:
+            self._back_ohlcv_df = pd.concat([self._back_ohlcv_df,
+                                             self._stitch(self._back_adj_info(), dropna=False,
+                                                          after_date=previous_as_of_date)])
+
     def _get_adj_info(self, n_day):
         ''' Calculate the start and end dates for each ticker, and the next tickers
             Args:
@@ -236,50 +585,156 @@ class Future(Instrument):
     #        return exact_contract, prefix[:-1] + "[A-Z][0-9]+ " + suffix
 
     def _read_static_csv(self, ticker):
-        static_df = pd.read_csv(system.filtered_static_filename).rename(columns=self._BBG_FIELD_MAP)
-        static_df.ROLL_DT = pd.to_datetime(static_df.ROLL_DT).dt.date
+        return static_store.get_static_data().lookup(ticker)
+
+    def _read_ohlcv(self, ticker, start_date, end_date, resample=True, dropna=True):
+        ohlcv_df = self._load_ohlcv(ticker)
 
-        static_df_filter = static_df[static_df.TICKER == ticker]
+        if not ohlcv_df.empty:
+            if resample:
+                date_rack = pd.bdate_range(start_date, end_date)
+                ohlcv_df = ohlcv_df.asof(date_rack)
+            else:
+                ohlcv_df = ohlcv_df[start_date:end_date]
 
-        if static_df_filter.empty:
-            prefix, suffix = ticker.rsplit(" ", maxsplit=1)
-            ticker_pattern = prefix[:-1] + "[A-Z][0-9]+ "
-            static_df_filter = static_df[static_df.TICKER.str.contains(ticker_pattern)]
-            read_multiple_files = True
-        else:
-            read_multiple_files = False
+            # only see data up to as of date (inclusively)
+            ohlcv_df = ohlcv_df[:self._as_of_date]
 
-        static_df = static_df_filter.sort_values(by='ROLL_DT')
+            # ohlcv_df.ffill(inplace=True)
+            # ohlcv_df = ohlcv_df[ohlcv_df.HIGH.notnull() & ohlcv_df.LOW.notnull() & ohlcv_df.VOLUME.notnull()]
 
-        return read_multiple_files, static_df
+        # if resample_method:
+        #    ohlcv_df = ohlcv_df.resample(resample_method).pad()
+        if dropna:
+            ohlcv_df = ohlcv_df.dropna(axis='index')
 
-    def _read_ohlcv(self, ticker, start_date, end_date, resample=True, dropna=True):
-        ohlcv_df = pd.DataFrame()
-        filename = os.path.join(system.ohlcv_path, ticker + '.csv')
+        return ohlcv_df
 
-        if os.path.exists(filename):
-            ohlcv_df = pd.read_csv(filename, index_col='DATE').rename(columns=self._BBG_FIELD_MAP)
-            ohlcv_df.index = pd.to_datetime(ohlcv_df.index)
+    @lazy_artefact
+    def _chain(self):
+        ''' Every contract of the chain loaded once into a long panel of complete rows sorted by (contract, date)
 
-            if not ohlcv_df.empty:
-                if resample:
-                    date_rack = pd.bdate_range(start_date, end_date)
-                    ohlcv_df = ohlcv_df.asof(date_rack)
-                else:
-                    ohlcv_df = ohlcv_df[start_date:end_date]
+            A contract-by-date lookup is then a single searchsorted on the (contract, day) keys, which is the as of of
+            the contract on that date, i.e., its last row without any missing field.
+        '''
+        contract_map = {}
+        fields = []
+        keys = []
+        frames = []
+        self._load_chain_contracts(enumerate(self.ticker_list), contract_map, fields, keys, frames)
+        return self._make_chain(contract_map, fields, keys, frames)
+
+    def _load_chain_contracts(self, contracts, contract_map, fields, keys, frames):
+        ''' Load the complete rows of contracts, pairs of contract id and ticker, adding them to the chain parts '''
+        for contract_id, ticker in contracts:
+            ohlcv_df = self._load_ohlcv(ticker)
+
+            # a contract without data contributes no rows at all, not even missing ones
+            if ohlcv_df.empty:
+                continue
+
+            contract_map[ticker] = contract_id
+            fields.extend(field for field in ohlcv_df.columns if field not in fields)
+
+            ohlcv_df = ohlcv_df.dropna(axis='index')
+            keys.append(contract_id * self._CHAIN_KEY_STRIDE + self._day_number(ohlcv_df.index))
+            frames.append(ohlcv_df)
+
+    @staticmethod
+    def _make_chain(contract_map, fields, keys, frames):
+        keys = np.concatenate(keys) if keys else np.array([], dtype=np.int64)
+        values = np.concatenate([frame.reindex(columns=fields).values for frame in frames]) if frames \
+            else np.empty((0, len(fields)))
+
+        # the rows of the contracts are kept sorted by (contract, date)
+        order = np.argsort(keys, kind='mergesort')
+        return _Chain(contract_map, fields, keys[order], values[order])
+
+    def _reload_chain(self, tickers):
+        ''' Return the chain panel with the contracts of tickers loaded again, e.g., after bars were added to them '''
+        chain = self._chain
+        reloaded = [(contract_id, ticker) for contract_id, ticker in enumerate(self.ticker_list) if ticker in tickers]
+        is_kept = ~np.in1d(chain.keys // self._CHAIN_KEY_STRIDE, [contract_id for contract_id, _ in reloaded])
+
+        contract_map = {ticker: contract_id for ticker, contract_id in chain.contract_map.items()
+                        if ticker not in tickers}
+        fields = list(chain.fields)
+        keys = [chain.keys[is_kept]]
+        frames = [pd.DataFrame(chain.values[is_kept], columns=chain.fields)]
+        self._load_chain_contracts(reloaded, contract_map, fields, keys, frames)
+        return self._make_chain(contract_map, fields, keys, frames)
+
+    _CHAIN_KEY_STRIDE = 10 ** 6
+
+    @staticmethod
+    def _day_number(dates):
+        return pd.DatetimeIndex(dates).values.astype('M8[D]').astype(np.int64)
+
+    def _chain_asof(self, contract_ids, dates):
+        ''' Look up the as of rows of the given contracts on the given dates, NaN if there is none '''
+        chain = self._chain
+        keys = contract_ids * self._CHAIN_KEY_STRIDE + self._day_number(dates)
+        pos = np.searchsorted(chain.keys, keys, side='right') - 1
+        found = pos >= 0
+        found[found] = chain.keys[pos[found]] // self._CHAIN_KEY_STRIDE == contract_ids[found]
+
+        values = np.full((len(keys), len(chain.fields)), np.nan)
+        values[found] = chain.values[pos[found]]
+        return values
+
+    def _contract_ids(self, tickers):
+        ''' Map tickers to their ids in the chain panel, -1 for contracts without data '''
+        return np.array([self._chain.contract_map.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+
+    def _stitch(self, adj_dates: pd.DataFrame, dropna=True, after_date=None):
+        ''' Stitch the business days between START_DATE and END_DATE of each TICKER into one data frame
 
-                # only see data up to as of date (inclusively)
-                ohlcv_df = ohlcv_df[:self._as_of_date]
+            Args:
+                adj_dates: The windows of each contract, see _get_adj_info
+                dropna: Drop the days with any missing field
+                after_date: Only stitch the days after this date
+        '''
+        contract_ids = self._contract_ids(adj_dates.TICKER)
+        starts = pd.DatetimeIndex(adj_dates.START_DATE)
+        ends = pd.DatetimeIndex(adj_dates.END_DATE)
 
-                # ohlcv_df.ffill(inplace=True)
-                # ohlcv_df = ohlcv_df[ohlcv_df.HIGH.notnull() & ohlcv_df.LOW.notnull() & ohlcv_df.VOLUME.notnull()]
+        if len(adj_dates) == 0:
+            return pd.DataFrame(columns=self._chain.fields)
 
-            # if resample_method:
-            #    ohlcv_df = ohlcv_df.resample(resample_method).pad()
-            if dropna:
-                ohlcv_df = ohlcv_df.dropna(axis='index')
+        calendar = pd.bdate_range(starts.min(), ends.max())
+        start_pos = calendar.searchsorted(starts)
+        n_days = np.where(contract_ids >= 0, np.maximum(calendar.searchsorted(ends, side='right') - start_pos, 0), 0)
 
-        return ohlcv_df
+        # position of every business day of every window in the calendar, windows kept in order
+        window = np.repeat(np.arange(len(adj_dates)), n_days)
+        offset = np.arange(n_days.sum()) - np.repeat(np.cumsum(n_days) - n_days, n_days)
+        dates = calendar[start_pos[window] + offset]
+
+        # only see data up to as of date (inclusively)
+        visible = dates <= pd.Timestamp(self._as_of_date)
+        if after_date is not None:
+            visible &= dates > pd.Timestamp(after_date)
+        dates = dates[visible]
+        window = window[visible]
+
+        df = pd.DataFrame(self._chain_asof(contract_ids[window], dates), index=dates, columns=self._chain.fields)
+
+        if dropna:
+            df = df.dropna(axis='index')
+
+        return df
+
+    def _next_close(self, adj_dates: pd.DataFrame):
+        ''' Close of each NEXT_TICKER on the END_DATE of its previous contract '''
+        contract_ids = self._contract_ids(adj_dates.NEXT_TICKER)
+        ends = pd.DatetimeIndex(adj_dates.END_DATE)
+
+        # the roll date must be a business day the instrument can see
+        rolled = (contract_ids >= 0) & (ends.dayofweek < 5) & (ends <= pd.Timestamp(self._as_of_date))
+        ends = ends[rolled]
+
+        close = self._chain_asof(contract_ids[rolled], ends)[:, self._chain.fields.index('CLOSE')]
+        return pd.Series(close, index=ends, name='CLOSE')
 
     def _calc_ohlcv(self, adj_dates: pd.DataFrame = None, method='panama', dropna=True):
 
@@ -289,37 +744,33 @@ class Future(Instrument):
         if not isinstance(adj_dates, pd.DataFrame):
             raise ValueError('Calendar must be pandas DataFrame')
 
-        df_no_adj = pd.concat([self._read_ohlcv(row.TICKER, row.START_DATE, row.END_DATE, dropna=dropna)
-                        for _, row in adj_dates.iterrows()])
+        df_no_adj = self._stitch(adj_dates, dropna=dropna)
 
-        # if the day fall at the edge of each contract, resample within read ohlcv does not handle that
-        # if resample_method:
-        #    df_no_adj = df_no_adj.resample(resample_method).pad()
+        next_close = self._next_close(adj_dates)
+        df, adj = self._adjust(df_no_adj, next_close, method)
 
-        df = df_no_adj.copy()
-        close = df.CLOSE
+        return df_no_adj, df, adj
 
-        next_df = pd.concat([self._read_ohlcv(row.NEXT_TICKER, row.END_DATE, row.END_DATE, dropna=False)
-                             for _, row in adj_dates.iterrows()])
+    def _adjust(self, df_no_adj: pd.DataFrame, next_close: pd.Series, method='panama'):
+        ''' Back adjust the stitched prices by the gap between the contracts on each roll date
 
-        next_close = next_df.CLOSE
+            Returns:
+                A tuple of the adjusted data frame and the adjustment
+        '''
+        df = df_no_adj.copy()
+        close = df.CLOSE
 
+        prices = ['OPEN', 'HIGH', 'LOW', 'CLOSE']
         if method == 'panama':
             adj = (next_close - close.asof(next_close.index))
             adj = adj[::-1].cumsum()[::-1].reindex(df.index, method='bfill').fillna(0)
-            df.OPEN = (df.OPEN + adj)
-            df.HIGH = (df.HIGH + adj)
-            df.LOW = (df.LOW + adj)
-            df.CLOSE = (df.CLOSE + adj)
+            df[prices] = df[prices].add(adj, axis=0)
         elif method == 'ratio':
             adj = (next_close / close.asof(next_close.index))
             adj = adj[::-1].cumprod()[::-1].reindex(df.index, method='bfill').fillna(1)
-            df.OPEN = (df.OPEN * adj)
-            df.HIGH = (df.HIGH * adj)
-            df.LOW = (df.LOW * adj)
-            df.CLOSE = (df.CLOSE * adj)
+            df[prices] = df[prices].multiply(adj, axis=0)
         elif method == 'no_adj':
-            adj = next_close  # to get the data frame shape
+            adj = next_close.copy()  # to get the data frame shape
             adj[:] = 0
 
-        return df_no_adj, df, adj
\ No newline at end of file
+        return df, adj
@@ -0,0 +1,128 @@
+''' Binary columnar store of daily OHLCV data
+
+    Each ticker is kept in a single .npy file holding one record whose fields are whole columns: DATE (int64
+    nanoseconds since epoch) followed by one float64 column per Bloomberg field, in the order of the source csv.
+    The file is opened memory-mapped, so loading a contract is a handful of contiguous copies rather than a text parse.
+'''
+
+import logging
+import os
+import numpy as np
+import pandas as pd
+import hydrogen.system as system
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+STORE_SUFFIX = '.npy'
+
+
+def store_filename(ticker: str, store_path=None):
+    if store_path is None:
+        store_path = system.ohlcv_store_path
+    return os.path.join(store_path, ticker + STORE_SUFFIX)
+
+
+def csv_filename(ticker: str, csv_path=None):
+    if csv_path is None:
+        csv_path = system.ohlcv_path
+    return os.path.join(csv_path, ticker + '.csv')
+
+
+def read_ohlcv_csv(filename):
+    ohlcv_df = pd.read_csv(filename, index_col='DATE')
+    ohlcv_df.index = pd.to_datetime(ohlcv_df.index)
+    return ohlcv_df
+
+
+def write_ohlcv(ticker: str, ohlcv_df: pd.DataFrame, store_path=None):
+    ''' Write the daily prices of a ticker to the store
+
+    Args:
+        ticker: Bloomberg ticker, e.g., ESH15 Index
+        ohlcv_df: Data frame indexed by date, with one numeric column per field
+        store_path: Directory of the store, default to system.ohlcv_store_path
+
+    Returns:
+        The name of the file written
+    '''
+    filename = store_filename(ticker, store_path)
+    n_row = len(ohlcv_df)
+
+    dtype = np.dtype([('DATE', '<i8', (n_row,))] + [(str(col), '<f8', (n_row,)) for col in ohlcv_df.columns])
+    record = np.zeros((), dtype=dtype)
+    record['DATE'] = pd.to_datetime(ohlcv_df.index).values.astype('M8[ns]').view('<i8')
+    for col in ohlcv_df.columns:
+        record[str(col)] = ohlcv_df[col].values.astype('<f8')
+
+    # write to a temporary file first so that readers never see a partial file
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        np.save(f, record)
+    os.replace(tmp_filename, filename)
+
+    return filename
+
+
+def read_ohlcv(ticker: str, store_path=None, csv_path=None):
+    ''' Read the daily prices of a ticker
+
+    The binary store is used when it holds the ticker and is not older than the csv file, otherwise the csv file is
+    parsed as before.
+
+    Args:
+        ticker: Bloomberg ticker, e.g., ESH15 Index
+        store_path: Directory of the store, default to system.ohlcv_store_path
+        csv_path: Directory of the csv files, default to system.ohlcv_path
+
+    Returns:
+        A data frame indexed by DATE with the Bloomberg field columns, or an empty data frame if there is no data
+    '''
+    filename = store_filename(ticker, store_path)
+    csv_file = csv_filename(ticker, csv_path)
+
+    store_exists = os.path.exists(filename)
+    csv_exists = os.path.exists(csv_file)
+
+    if store_exists and (not csv_exists or os.path.getmtime(filename) >= os.path.getmtime(csv_file)):
+        record = np.load(filename, mmap_mode='r')
+        fields = record.dtype.names[1:]
+        index = pd.DatetimeIndex(np.asarray(record['DATE']).view('M8[ns]'), name='DATE')
+        return pd.DataFrame({field: np.asarray(record[field]) for field in fields}, index=index, columns=fields)
+
+    if csv_exists:
+        return read_ohlcv_csv(csv_file)
+
+    return pd.DataFrame()
+
+
+def convert_csv_tree(csv_path=None, store_path=None):
+    ''' One-shot conversion of every csv file under csv_path into the binary store
+
+    Args:
+        csv_path: Directory of the csv files, default to system.ohlcv_path
+        store_path: Directory of the store, default to system.ohlcv_store_path
+
+    Returns:
+        The list of tickers converted
+    '''
+    if csv_path is None:
+        csv_path = system.ohlcv_path
+    if store_path is None:
+        store_path = system.ohlcv_store_path
+
+    os.makedirs(store_path, exist_ok=True)
+
+    tickers = sorted(filename[:-len('.csv')] for filename in os.listdir(csv_path) if filename.endswith('.csv'))
+
+    for ticker in tickers:
+        logger.debug('Converting {} to the OHLCV store'.format(ticker))
+        write_ohlcv(ticker, read_ohlcv_csv(csv_filename(ticker, csv_path)), store_path)
+
+    logger.info('Converted {} tickers from {} to {}'.format(len(tickers), csv_path, store_path))
+    return tickers
+
+
+if __name__ == '__main__':
+    convert_csv_tree()
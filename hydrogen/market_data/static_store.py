@@ -0,0 +1,100 @@
+''' Process-wide cache of the parsed static data
+
+    The filtered static csv is parsed once per process for a given (filename, modification time) and indexed by
+    contract ticker and by generic ticker, e.g., Z 1 Index, so that resolving a future chain is a dictionary lookup.
+'''
+
+import logging
+import os
+import re
+import threading
+import pandas as pd
+import hydrogen.system as system
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Bloomberg fields of the static data and the OHLCV files to the column names used by the instruments
+BBG_FIELD_MAP = {'PX_OPEN': 'OPEN',
+                 'PX_LOW': 'LOW',
+                 'PX_HIGH': 'HIGH',
+                 'PX_LAST': 'CLOSE',
+                 'PX_VOLUME': 'VOLUME',
+                 'ROLL_DT': 'ROLL_DT',
+                 }
+
+_CONTRACT_CODE = re.compile(r'[A-Z][0-9]+$')
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def generic_ticker(contract_ticker: str):
+    ''' Map a contract ticker to its generic ticker, e.g., Z H05 Index to Z 1 Index '''
+    prefix, suffix = contract_ticker.rsplit(" ", maxsplit=1)
+    return _CONTRACT_CODE.sub('', prefix) + '1 ' + suffix
+
+
+class StaticData:
+    ''' Parsed static data indexed by contract and generic ticker '''
+
+    def __init__(self, static_df: pd.DataFrame):
+        static_df = static_df.rename(columns=BBG_FIELD_MAP)
+        static_df.ROLL_DT = pd.to_datetime(static_df.ROLL_DT).dt.date
+        self.static_df = static_df
+
+        # the labels of each group are kept in ROLL_DT order
+        sorted_df = static_df.sort_values(by='ROLL_DT', kind='mergesort')
+        self._ticker_index = sorted_df.groupby('TICKER', sort=False).groups
+        self._generic_index = sorted_df.groupby(sorted_df.TICKER.map(generic_ticker), sort=False).groups
+
+    def lookup(self, ticker: str):
+        ''' Find the static data of a ticker
+
+        Args:
+            ticker: Bloomberg ticker, either a contract, e.g., CLH15 Comdty, or a generic, e.g., CL1 Comdty
+
+        Returns:
+            A tuple of whether the ticker is a chain of contracts and the static data sorted by ROLL_DT
+        '''
+        labels = self._ticker_index.get(ticker)
+        if labels is not None:
+            return False, self.static_df.loc[labels]
+
+        # otherwise it is a generic ticker, e.g., ES1 Index, and the whole chain of its root is returned
+        prefix, suffix = ticker.rsplit(" ", maxsplit=1)
+        labels = self._generic_index.get(prefix[:-1] + '1 ' + suffix, [])
+        return True, self.static_df.loc[labels]
+
+    def roll_dates(self, ticker: str):
+        ''' Return the sorted roll dates of the contracts of a ticker '''
+        return self.lookup(ticker)[1].ROLL_DT.values
+
+
+def get_static_data(filename=None):
+    ''' Return the parsed static data of filename, default to system.filtered_static_filename
+
+    The file is only parsed again when its modification time changes.
+    '''
+    if filename is None:
+        filename = system.filtered_static_filename
+
+    key = (os.path.abspath(filename), os.path.getmtime(filename))
+
+    with _lock:
+        static_data = _cache.get(key)
+        if static_data is None:
+            logger.debug('Parsing static data {}'.format(filename))
+            static_data = StaticData(pd.read_csv(filename))
+            # only keep the latest version of each file
+            for stale_key in [k for k in _cache if k[0] == key[0]]:
+                del _cache[stale_key]
+            _cache[key] = static_data
+
+    return static_data
+
+
+def clear_cache():
+    ''' Drop all the parsed static data '''
+    with _lock:
+        _cache.clear()
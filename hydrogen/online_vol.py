@@ -0,0 +1,269 @@
+''' Online volatility estimators updated one bar at a time
+
+    The estimators give the same values as hydrogen.analytics.vol over the same history, but each new bar costs a
+    constant amount of work, using the recursions of the exponentially weighted statistics or running moments over a
+    ring buffer of the last window values. Their state is made of plain python values, so it can be saved, e.g., with
+    json, at the end of a run and restored at the next one.
+'''
+
+import logging
+import numpy as np
+import pandas as pd
+import hydrogen.system as system
+import hydrogen.analytics
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class _EWMMoments:
+    ''' Exponentially weighted mean and unbiased variance of a stream, as pandas ewm(adjust=True, ignore_na=False) '''
+
+    def __init__(self, alpha, min_periods):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.n_obs = 0
+        self.avg = np.nan
+        self.cov = 0.0
+        self.old_weight = 1.0
+        self.weight_sum = 1.0
+        self.weight_square_sum = 1.0
+
+    def update(self, x):
+        # non-finite values are missing as in the batch estimators
+        is_observation = bool(np.isfinite(x))
+        self.n_obs += is_observation
+
+        if np.isnan(self.avg):
+            if is_observation:
+                self.avg = x
+            return
+
+        decay = 1.0 - self.alpha
+        self.weight_sum *= decay
+        self.weight_square_sum *= decay * decay
+        self.old_weight *= decay
+
+        if is_observation:
+            old_avg = self.avg
+            if old_avg != x:
+                self.avg = (self.old_weight * old_avg + x) / (self.old_weight + 1.0)
+            self.cov = (self.old_weight * (self.cov + (old_avg - self.avg) ** 2) +
+                        (x - self.avg) ** 2) / (self.old_weight + 1.0)
+            self.weight_sum += 1.0
+            self.weight_square_sum += 1.0
+            self.old_weight += 1.0
+
+    def mean(self):
+        return self.avg if self.n_obs >= self.min_periods else np.nan
+
+    def var(self):
+        if self.n_obs < max(self.min_periods, 2):
+            return np.nan
+        weight_sum_square = self.weight_sum * self.weight_sum
+        denominator = weight_sum_square - self.weight_square_sum
+        return weight_sum_square / denominator * self.cov if denominator > 0 else np.nan
+
+    def state_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_state(cls, state):
+        moments = cls.__new__(cls)
+        moments.__dict__.update(state)
+        return moments
+
+
+class _RollingMoments:
+    ''' Mean and variance (ddof=1) of the valid values among the last window values of a stream, as pandas rolling
+
+    The values are kept in a ring buffer and the running moments are updated as values enter and leave the window.
+    '''
+
+    def __init__(self, window, min_periods):
+        self.window = window
+        self.min_periods = min_periods
+        self.buffer = [np.nan] * window
+        self.position = 0
+        self.n_obs = 0
+        self.avg = 0.0
+        self.ssqdm = 0.0
+
+    def update(self, x):
+        # non-finite values are missing as in the batch estimators, e.g., the log return of a zero price
+        x = float(x) if np.isfinite(x) else np.nan
+        removed = self.buffer[self.position]
+        self.buffer[self.position] = x
+        self.position = (self.position + 1) % self.window
+
+        if not np.isnan(removed):
+            self.n_obs -= 1
+            if self.n_obs == 0:
+                self.avg = self.ssqdm = 0.0
+            else:
+                delta = removed - self.avg
+                self.avg -= delta / self.n_obs
+                self.ssqdm -= delta * (removed - self.avg)
+
+        if not np.isnan(x):
+            self.n_obs += 1
+            delta = x - self.avg
+            self.avg += delta / self.n_obs
+            self.ssqdm += delta * (x - self.avg)
+
+    def mean(self):
+        return self.avg if self.n_obs >= self.min_periods else np.nan
+
+    def var(self):
+        if self.n_obs < max(self.min_periods, 2):
+            return np.nan
+        return max(self.ssqdm, 0.0) / (self.n_obs - 1)
+
+    def state_dict(self):
+        return dict(vars(self), buffer=list(self.buffer))
+
+    @classmethod
+    def from_state(cls, state):
+        moments = cls.__new__(cls)
+        moments.__dict__.update(state)
+        moments.buffer = list(state['buffer'])
+        return moments
+
+
+class OnlineVol:
+    ''' Volatility of one instrument updated bar by bar
+
+    Args:
+        method: SD, ATR, RS or YZ
+        annualised: Scale the daily volatility to annual
+        ewm: Use exponentially weighted statistics instead of a rolling window
+        kwargs: span, com, alpha or halflife when ewm, otherwise window, and optionally min_periods, as for
+            hydrogen.analytics.vol
+    '''
+
+    _STREAMS = {'SD': ['log_return'],
+                'ATR': ['true_range'],
+                'RS': ['rs'],
+                'YZ': ['rs', 'overnight', 'open_close'],
+                }
+
+    def __init__(self, method: str = 'YZ', annualised=False, ewm=False, **kwargs):
+        if method not in self._STREAMS:
+            raise ValueError('Unknown vol method {}, expected any of {}'.format(method, sorted(self._STREAMS)))
+
+        self.method = method
+        self.annualised = annualised
+        self.ewm = ewm
+        self.kwargs = kwargs
+        self.close_prev = np.nan
+        self.last_date = None
+
+        self._init_params()
+        self.streams = {name: self._new_moments() for name in self._STREAMS[method]}
+
+    def _init_params(self):
+        # the parameters are parsed and validated the same way as the batch estimators
+        if self.ewm:
+            window_stats = hydrogen.analytics._EWMStats(**self.kwargs)
+            self._alpha = window_stats.alpha
+        else:
+            window_stats = hydrogen.analytics._RollingStats(**self.kwargs)
+        self._window = window_stats.window
+        self._min_periods = window_stats.min_periods
+
+    def _new_moments(self):
+        if self.ewm:
+            return _EWMMoments(self._alpha, self._min_periods)
+        return _RollingMoments(self._window, self._min_periods)
+
+    def update(self, open_=np.nan, high=np.nan, low=np.nan, close=np.nan, date=None):
+        ''' Add the next bar
+
+        Args:
+            open_, high, low, close: Prices of the bar, only the ones used by the method are needed
+            date: Date of the bar, kept as the last date of the state
+
+        Returns:
+            The volatility as of the bar
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.method == 'SD':
+                self.streams['log_return'].update(np.log(close / self.close_prev))
+            elif self.method == 'ATR':
+                true_range = max(high - low, abs(high - self.close_prev), abs(close - self.close_prev))
+                self.streams['true_range'].update(np.nan if np.isnan([high, low, close, self.close_prev]).any()
+                                                  else true_range)
+            else:
+                log_open, log_high, log_low, log_close = np.log([open_, high, low, close])
+                self.streams['rs'].update((log_high - log_close) * (log_high - log_open) +
+                                          (log_low - log_close) * (log_low - log_open))
+                if self.method == 'YZ':
+                    self.streams['overnight'].update(log_open - np.log(self.close_prev))
+                    self.streams['open_close'].update(log_close - log_open)
+
+        self.close_prev = close
+        if date is not None:
+            self.last_date = pd.Timestamp(date).isoformat()
+
+        return self.value()
+
+    def update_df(self, price_df: pd.DataFrame):
+        ''' Add the bars of a data frame of OPEN, HIGH, LOW and CLOSE in order, e.g., to warm up from history
+
+        Returns:
+            The volatility time series as of each bar
+        '''
+        columns = [price_df[name].values if name in price_df else np.full(len(price_df), np.nan)
+                   for name in ['OPEN', 'HIGH', 'LOW', 'CLOSE']]
+        res = [self.update(*bar) for bar in zip(*columns)]
+        if len(price_df):
+            self.last_date = pd.Timestamp(price_df.index[-1]).isoformat()
+        return pd.Series(res, index=price_df.index)
+
+    def value(self):
+        ''' Return the current volatility '''
+        with np.errstate(invalid='ignore'):
+            if self.method == 'SD':
+                res = np.sqrt(self.streams['log_return'].var())
+            elif self.method == 'ATR':
+                res = self.streams['true_range'].mean()
+            else:
+                rs_vol = np.sqrt(self.streams['rs'].mean())
+                res = rs_vol
+                if self.method == 'YZ':
+                    window = self._window
+                    k = 0.34 / (1.34 + (window + 1) / (window - 1))
+                    res = np.sqrt(self.streams['overnight'].var() + k * self.streams['open_close'].var() +
+                                  (1 - k) * rs_vol * rs_vol)
+
+        if self.annualised:
+            res *= system.root_n_bday_in_year
+        return float(res)
+
+    def state_dict(self):
+        ''' Return the state as a dict of plain python values '''
+        return {'method': self.method,
+                'annualised': self.annualised,
+                'ewm': self.ewm,
+                'kwargs': dict(self.kwargs),
+                'close_prev': float(self.close_prev),
+                'last_date': self.last_date,
+                'streams': {name: moments.state_dict() for name, moments in self.streams.items()},
+                }
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Restore an estimator from the output of state_dict '''
+        online_vol = cls.__new__(cls)
+        online_vol.method = state['method']
+        online_vol.annualised = state['annualised']
+        online_vol.ewm = state['ewm']
+        online_vol.kwargs = dict(state['kwargs'])
+        online_vol.close_prev = state['close_prev']
+        online_vol.last_date = state['last_date']
+        online_vol._init_params()
+
+        moments_class = _EWMMoments if online_vol.ewm else _RollingMoments
+        online_vol.streams = {name: moments_class.from_state(moments_state)
+                              for name, moments_state in state['streams'].items()}
+        return online_vol
@@ -0,0 +1,284 @@
+''' Dense panel of dates by tickers by fields, e.g., the forecasts of each rule for each instrument
+
+    The panel is a float64 array on a calendar shared by all tickers, the union of their dates, with a mask of the
+    dates of each ticker and field, as the rules of a ticker may have different dates, e.g., carry is on the dates of
+    the front and back contracts. Operations along the dates, e.g., shift and diff, are done within the dates of each
+    ticker and field, so they give the same result as the per ticker and field series they replace, whatever the
+    other fields of the panel.
+'''
+
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import hydrogen.analytics
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class Panel:
+    ''' Array of dates by tickers by fields with a row mask of dates by tickers
+
+    Args:
+        values: Array of dates by tickers by fields, NA outside the row mask
+        dates: The shared calendar
+        tickers: Tickers along the second axis
+        fields: Fields along the third axis, e.g., rule names
+        row_mask: Boolean array of dates by tickers by fields, True on the dates of the ticker and field, or of dates
+            by tickers when the fields of a ticker share its dates
+    '''
+
+    def __init__(self, values, dates, tickers, fields, row_mask):
+        self.values = values
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.fields = list(fields)
+        if row_mask.ndim == 2:
+            row_mask = np.repeat(row_mask[:, :, np.newaxis], len(self.fields), axis=2)
+        self.row_mask = row_mask
+        self._ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self._field_index = {field: i for i, field in enumerate(self.fields)}
+        self._own_dates_order = None
+
+    def __repr__(self):
+        return '{}: {} dates x {} tickers x {} fields'.format(self.__class__.__name__, *self.values.shape)
+
+    @classmethod
+    def from_frames(cls, frames, dates=None, fields=None):
+        ''' Create a panel from data frames of dates by fields
+
+        Args:
+            frames: Ordered dict of ticker to data frame
+            dates: The shared calendar, default to the union of the dates of all frames
+            fields: Default to the columns of the first frame
+
+        Returns:
+            A panel with the dates of each ticker being the index of its frame
+        '''
+        if dates is None:
+            dates = union_calendar(frame.index for frame in frames.values())
+        if fields is None:
+            fields = next(iter(frames.values())).columns if frames else []
+
+        values = np.full((len(dates), len(frames), len(fields)), np.nan)
+        row_mask = np.zeros((len(dates), len(frames)), dtype=bool)
+        for i, frame in enumerate(frames.values()):
+            rows = dates.get_indexer(frame.index)
+            if (rows < 0).any():
+                raise ValueError('The dates of {} are not in the calendar'.format(list(frames)[i]))
+            values[rows, i, :] = frame.reindex(columns=fields).values
+            row_mask[rows, i] = True
+
+        return cls(values, dates, list(frames), fields, row_mask)
+
+    @classmethod
+    def from_series(cls, series_maps, dates=None, fields=None):
+        ''' Create a panel from time series of each ticker and field, each one on its own dates
+
+        Args:
+            series_maps: Ordered dict of ticker to ordered dict of field to series
+            dates: The shared calendar, default to the union of the dates of all series
+            fields: Default to the fields of the first ticker
+
+        Returns:
+            A panel with the dates of each ticker and field being the index of its series
+        '''
+        if dates is None:
+            dates = union_calendar(series.index for series_map in series_maps.values()
+                                   for series in series_map.values())
+        if fields is None:
+            fields = list(next(iter(series_maps.values()))) if series_maps else []
+
+        values = np.full((len(dates), len(series_maps), len(fields)), np.nan)
+        row_mask = np.zeros(values.shape, dtype=bool)
+        for i, (ticker, series_map) in enumerate(series_maps.items()):
+            for j, field in enumerate(fields):
+                series = series_map[field]
+                rows = dates.get_indexer(series.index)
+                if (rows < 0).any():
+                    raise ValueError('The dates of {} {} are not in the calendar'.format(ticker, field))
+                values[rows, i, j] = series.values
+                row_mask[rows, i, j] = True
+
+        return cls(values, dates, list(series_maps), fields, row_mask)
+
+    def with_values(self, values):
+        ''' Return a panel of the same axes with new values, NA outside the row mask '''
+        values = np.array(values, dtype=np.float64)
+        values[~self.row_mask] = np.nan
+        return self.__class__(values, self.dates, self.tickers, self.fields, self.row_mask)
+
+    def select(self, tickers=None, fields=None):
+        ''' Return the panel of a subset of tickers and fields, all if None '''
+        tickers = self.tickers if tickers is None else list(tickers)
+        fields = self.fields if fields is None else list(fields)
+        ticker_index = [self._ticker_index[ticker] for ticker in tickers]
+        field_index = [self._field_index[field] for field in fields]
+        return self.__class__(self.values[:, ticker_index][:, :, field_index], self.dates, tickers, fields,
+                              self.row_mask[:, ticker_index][:, :, field_index])
+
+    def frame(self, ticker, fields=None):
+        ''' Return the data frame of a ticker on the union of the dates of its fields '''
+        fields = self.fields if fields is None else list(fields)
+        i = self._ticker_index[ticker]
+        field_index = [self._field_index[field] for field in fields]
+        rows = self.row_mask[:, i, field_index].any(axis=1)
+        values = self.values[rows, i, :][:, field_index]
+        return pd.DataFrame(values, index=self.dates[rows], columns=fields)
+
+    def to_dict(self, tickers=None, fields=None):
+        ''' Return a dict of ticker to its data frame on its own dates '''
+        tickers = self.tickers if tickers is None else tickers
+        return {ticker: self.frame(ticker, fields) for ticker in tickers}
+
+    def reindex(self, dates=None, tickers=None, fields=None):
+        ''' Return the panel on axes containing the current ones, NA and outside the row mask on the new entries '''
+        dates = self.dates if dates is None else dates
+        tickers = self.tickers if tickers is None else list(tickers)
+        fields = self.fields if fields is None else list(fields)
+
+        rows = dates.get_indexer(self.dates)
+        ticker_index = pd.Index(tickers).get_indexer(self.tickers)
+        field_index = pd.Index(fields).get_indexer(self.fields)
+        if (rows < 0).any() or (ticker_index < 0).any() or (field_index < 0).any():
+            raise ValueError('The axes of {} are not all in the new axes'.format(self))
+
+        values = np.full((len(dates), len(tickers), len(fields)), np.nan)
+        values[np.ix_(rows, ticker_index, field_index)] = self.values
+        row_mask = np.zeros(values.shape, dtype=bool)
+        row_mask[np.ix_(rows, ticker_index, field_index)] = self.row_mask
+        return self.__class__(values, dates, tickers, fields, row_mask)
+
+    def own_dates_order(self):
+        ''' Return the index moving the own dates of each ticker and field to the top, as
+            hydrogen.analytics.own_dates_order of the row mask
+
+        Returns:
+            A tuple of index arrays of dates, tickers and fields, such that values[index] is the compacted panel and
+            res[index] = compacted_res scatters a result back to the original dates
+        '''
+        if self._own_dates_order is None:
+            n_dates, n_tickers, n_fields = self.row_mask.shape
+            row_order, _ = hydrogen.analytics.own_dates_order(self.row_mask.reshape(n_dates, n_tickers * n_fields))
+            self._own_dates_order = (row_order.reshape(self.row_mask.shape),
+                                     np.arange(n_tickers)[np.newaxis, :, np.newaxis],
+                                     np.arange(n_fields)[np.newaxis, np.newaxis, :])
+        return self._own_dates_order
+
+    def shift(self, periods=1):
+        ''' Shift the values of each ticker and field by periods of its own dates '''
+        index = self.own_dates_order()
+        compact_values = self.values[index]
+
+        shifted_values = np.full_like(compact_values, np.nan)
+        if periods >= 0:
+            shifted_values[periods:] = compact_values[:len(compact_values) - periods]
+        else:
+            shifted_values[:periods] = compact_values[-periods:]
+
+        values = np.empty_like(shifted_values)
+        values[index] = shifted_values
+        return self.with_values(values)
+
+    def diff(self, periods=1):
+        ''' Difference with the value periods earlier within the own dates of each ticker and field '''
+        return self.with_values(self.values - self.shift(periods).values)
+
+    def mean(self):
+        ''' Mean over the dates ignoring NA, as a data frame of tickers by fields '''
+        is_valid = ~np.isnan(self.values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = np.where(is_valid, self.values, 0.0).sum(axis=0) / is_valid.sum(axis=0)
+        return pd.DataFrame(res, index=self.tickers, columns=self.fields)
+
+
+class LazyPanel:
+    ''' Panel of tickers by fields materialised on demand, block by block
+
+    Only the cells of tickers and fields requested are computed, each one once, and the calendar grows with the dates
+    of the tickers computed.
+
+    Args:
+        tickers: All the tickers of the panel
+        fields: All the fields of the panel
+        calc_panel: Function of a list of tickers and a list of fields returning the panel of them
+    '''
+
+    def __init__(self, tickers, fields, calc_panel=None):
+        self.tickers = list(tickers)
+        self.fields = list(fields)
+        self.calc_panel = calc_panel
+        self.computed = np.zeros((len(self.tickers), len(self.fields)), dtype=bool)
+        self._panel = None
+        self._ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self._field_index = {field: i for i, field in enumerate(self.fields)}
+
+    def __repr__(self):
+        return '{}: {} of {} tickers x fields computed'.format(self.__class__.__name__, self.computed.sum(),
+                                                               self.computed.size)
+
+    def missing(self, tickers, fields):
+        ''' Return the blocks of (tickers, fields) not computed yet among tickers and fields, tickers being grouped by
+            their missing fields
+        '''
+        blocks = OrderedDict()
+        for ticker in tickers:
+            i = self._ticker_index[ticker]
+            missing_fields = tuple(field for field in fields if not self.computed[i, self._field_index[field]])
+            if missing_fields:
+                blocks.setdefault(missing_fields, []).append(ticker)
+        return [(block_tickers, list(block_fields)) for block_fields, block_tickers in blocks.items()]
+
+    def update(self, panel):
+        ''' Add the cells of a panel of some of the tickers and fields, marking them as computed '''
+        if self._panel is None:
+            self._panel = panel.reindex(tickers=self.tickers, fields=self.fields)
+        else:
+            dates = union_calendar([self._panel.dates, panel.dates])
+            current = self._panel if len(dates) == len(self._panel.dates) else self._panel.reindex(dates)
+            panel = panel.reindex(dates)
+
+            cells = np.ix_(np.arange(len(dates)), [self._ticker_index[ticker] for ticker in panel.tickers],
+                           [self._field_index[field] for field in panel.fields])
+            values = current.values.copy()
+            values[cells] = panel.values
+            row_mask = current.row_mask.copy()
+            row_mask[cells] = panel.row_mask
+            self._panel = Panel(values, dates, self.tickers, self.fields, row_mask)
+
+        self.computed[np.ix_([self._ticker_index[ticker] for ticker in panel.tickers],
+                             [self._field_index[field] for field in panel.fields])] = True
+
+    def select(self, tickers=None, fields=None):
+        ''' Return the panel of a subset of tickers and fields, all if None, computing the missing cells '''
+        tickers = self.tickers if tickers is None else list(tickers)
+        fields = self.fields if fields is None else list(fields)
+        for block_tickers, block_fields in self.missing(tickers, fields):
+            self.update(self.calc_panel(block_tickers, block_fields))
+
+        if self._panel is None:
+            return Panel(np.empty((0, len(tickers), len(fields))), union_calendar([]), tickers, fields,
+                         np.zeros((0, len(tickers), len(fields)), dtype=bool))
+        return self._panel.select(tickers, fields)
+
+
+def union_calendar(indexes):
+    ''' Return the sorted union of date indexes, named as the first one '''
+    indexes = list(indexes)
+    if not indexes:
+        return pd.DatetimeIndex([], name='DATE')
+
+    return pd.DatetimeIndex(np.unique(np.concatenate([np.asarray(index.values, dtype='M8[ns]') for index in indexes])),
+                            name=indexes[0].name)
+
+
+def aligned_values(series_map, dates, tickers):
+    ''' Return time series of tickers as an array of dates by tickers on the calendar dates, NA elsewhere '''
+    values = np.full((len(dates), len(tickers)), np.nan)
+    for i, ticker in enumerate(tickers):
+        series = series_map[ticker]
+        rows = dates.get_indexer(series.index)
+        is_in_calendar = rows >= 0
+        values[rows[is_in_calendar], i] = series.values[is_in_calendar]
+    return values
@@ -1,14 +1,83 @@
+import logging
+import os
 import numpy as np
 import pandas as pd
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from hydrogen.instrument import InstrumentFactory
-from hydrogen.trading_rules import signal_scalar, signal_clipper, EWMAC, carry
+from hydrogen.panel import Panel, LazyPanel, aligned_values
+from hydrogen.trading_rules import signal_scalar, signal_clipper, EWMAC, carry, ForecastGraph, rule_node, \
+    buffer_positions
 import hydrogen.system as system
 
-class Portfolio:
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def _create_instrument(ticker, as_of_date):
+    # the data is read and the rolls are stitched in the worker rather than on first access in the caller
+    return InstrumentFactory().create_instrument(ticker, as_of_date=as_of_date).materialize()
+
+
+def account_pnl(position, pnl_one_contract, cost, delays=(0,)):
+    ''' Gross pnl, cost and net pnl of a panel of positions for several delays at once
+
+    The positions are moved to the own dates of each ticker and rule, where the delays and the trades are plain shifts
+    and differences along the first axis, and the pnl of one contract and the cost are broadcast over the rules.
+
+    Args:
+        position: Panel of dates by tickers by rules of the number of contracts held
+        pnl_one_contract: Array of dates by tickers of the pnl of one contract, on the calendar of the position
+        cost: Array of tickers of the cost of trading one contract
+        delays: Numbers of days between a position and the first price change it earns
+
+    Returns:
+        A tuple of a dict of delay to the gross pnl panel, the cost panel and a dict of delay to the net pnl panel
+    '''
+    index = position.own_dates_order()
+    compact_position = position.values[index]
+    compact_pnl_one_contract = pnl_one_contract[index[:2]]
+
+    def scatter(compact_values):
+        values = np.empty_like(compact_values)
+        values[index] = compact_values
+        return position.with_values(values)
+
+    compact_cost = np.full_like(compact_position, np.nan)
+    compact_cost[1:] = np.abs(np.diff(compact_position, axis=0)) * cost[np.newaxis, :, np.newaxis]
+
+    gross_pnl = {}
+    net_pnl = {}
+    for delay in delays:
+        compact_gross_pnl = np.full_like(compact_position, np.nan)
+        compact_gross_pnl[delay:] = compact_position[:len(compact_position) - delay] * compact_pnl_one_contract[delay:]
+        gross_pnl[delay] = scatter(compact_gross_pnl)
+        net_pnl[delay] = scatter(compact_gross_pnl - compact_cost)
+
+    return gross_pnl, scatter(compact_cost), net_pnl
 
-    def __init__(self, name: str, cache_result=True):
-        self.ticker_instrument_map = {}
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class Portfolio:
+    ''' Portfolio of instruments traded with a set of rules
+
+    Args:
+        name: Name of the portfolio
+        cache_result: Memoise the forecasts, positions and pnl
+        cache_size: Maximum number of results kept, the least recently used ones being evicted first
+
+    The results are cached by the instruments (ticker, as of date and object), the rule definitions, the parameters of
+    the call and the kind of result, so changing the instruments or self.rules, or asking for other parameters, never
+    returns a stale result. Changes made in place to the data of an instrument are not detected, call
+    invalidate_cache after them.
+    '''
+
+    def __init__(self, name: str, cache_result=True, cache_size=32):
+        self.name = name
+        self.ticker_instrument_map = OrderedDict()
+        self.instrument_errors = {}
         self.rules = [
             ('EWMAC_2_8', EWMAC, {"fast_span": 2, "slow_span": 8} ) ,
             ('EWMAC_4_16', EWMAC, {"fast_span": 4, "slow_span": 16} ) ,
@@ -18,12 +87,115 @@ class Portfolio:
             ('EWMAC_64_256', EWMAC, {"fast_span": 64, "slow_span": 256}),
             ('carry', carry, {"span":32})
         ]
-        self._forecast = {}
-        self._position = {}
-
-    def set_instruments(self, ticker_list: list, as_of_date):
+        # LRU cache of dense panels of dates by tickers by rules, exposed as dicts of per ticker data frames
+        self.cache_size = cache_size if cache_result else 0
+        self._result_cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self.forecast_graph = None
+
+    def _cache_key(self, kind, params):
+        instruments = tuple((ticker, pd.Timestamp(inst._as_of_date))
+                            for ticker, inst in self.ticker_instrument_map.items())
+        rules = tuple((rulename, rule, repr(sorted(kargs.items()))) for rulename, rule, kargs in self.rules)
+        return kind, params, instruments, rules
+
+    def _cached_result(self, kind, params, calc_result):
+        ''' Return the cached result of kind and params, calculating it if it is missing or stale
+
+        Args:
+            kind: Name of the result, e.g., forecast
+            params: Tuple of the parameters of the result
+            calc_result: Function calculating the result on a miss
+
+        Returns:
+            The result, shared by all the callers, so it must not be modified
+        '''
+        key = self._cache_key(kind, params)
+        instruments = tuple(self.ticker_instrument_map.values())
+
+        entry = self._result_cache.get(key)
+        # an instrument created again with the same ticker and as of date may carry different data
+        if entry is not None and all(cached is inst for cached, inst in zip(entry[0], instruments)):
+            self._cache_hits += 1
+            self._result_cache.move_to_end(key)
+            return entry[1]
+
+        self._cache_misses += 1
+        result = calc_result()
+        if self.cache_size > 0:
+            self._result_cache[key] = (instruments, result)
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > self.cache_size:
+                self._result_cache.popitem(last=False)
+        return result
+
+    def cache_info(self):
+        ''' Return the hits, misses, maximum size and current size of the result cache '''
+        return CacheInfo(self._cache_hits, self._cache_misses, self.cache_size, len(self._result_cache))
+
+    def invalidate_cache(self, kind=None):
+        ''' Remove the cached results, only the ones of kind, e.g., forecast, if given
+
+        Returns:
+            The number of results removed
+        '''
+        keys = [key for key in self._result_cache if kind is None or key[0] == kind]
+        for key in keys:
+            del self._result_cache[key]
+        return len(keys)
+
+    def set_instruments(self, ticker_list: list, as_of_date, executor=None, max_workers=None):
+        ''' Create the instruments of the portfolio, kept in the order of ticker_list
+
+        Args:
+            ticker_list: Bloomberg tickers, e.g., ES1 Index
+            as_of_date: The date of the instruments
+            executor: None to create the instruments one by one, their data being read on first access, 'thread' to
+                create them on a thread pool (reading data is I/O bound) or 'process' on a process pool (roll
+                stitching is CPU bound)
+            max_workers: Number of workers of the pool, default to the number of CPUs
+
+        In the executor modes, the workers read the data of the instruments and stitch their rolls upfront, see
+        Instrument.materialize, and a ticker that fails to load is logged and recorded in self.instrument_errors
+        instead of aborting the rest of the universe.
+        '''
         instrument_factory = InstrumentFactory()
-        self.ticker_instrument_map = { ticker:instrument_factory.create_instrument(ticker, as_of_date=as_of_date) for ticker in ticker_list }
+        self.instrument_errors = {}
+
+        if executor is None:
+            self.ticker_instrument_map = OrderedDict(
+                (ticker, instrument_factory.create_instrument(ticker, as_of_date=as_of_date)) for ticker in ticker_list)
+            return
+
+        executor_map = {'thread': ThreadPoolExecutor,
+                        'process': ProcessPoolExecutor}
+        if executor not in executor_map:
+            raise ValueError('executor is not valid: {}. Supported executors are {}.'.format(executor,
+                                                                                            list(executor_map)))
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        ticker_instrument_map = OrderedDict()
+        with executor_map[executor](max_workers=max_workers) as pool:
+            futures = [(ticker, pool.submit(_create_instrument, ticker, as_of_date)) for ticker in ticker_list]
+
+            for ticker, future in futures:
+                try:
+                    instrument = future.result()
+                except Exception as e:
+                    logger.exception('Failed to create instrument {}'.format(ticker))
+                    self.instrument_errors[ticker] = e
+                    continue
+
+                if executor == 'process':
+                    # share the instruments built in the worker processes with the rest of this process
+                    instrument = instrument_factory.register(instrument)
+
+                ticker_instrument_map[ticker] = instrument
+
+        self.ticker_instrument_map = ticker_instrument_map
 
     def _all_tickers_if_empty(self, ticker_list):
         if type(ticker_list) is str:
@@ -43,171 +215,162 @@ class Portfolio:
 
         return rule_list
 
-    def forecast(self, ticker_list=[], rule_list=[]):
+    def forecast(self, ticker_list=[], rule_list=[], clip=False):
         ''' Calculate the forecast for each rule for each ticker given, with
             the results are cached by default
-        '''
 
-        def _calc_forecast(clip=False):
-            res = {}
-            for ticker, inst in self.ticker_instrument_map.items():
-                forecasts = [signal_scalar(rule(rulename, inst, **kargs)) for rulename, rule, kargs in self.rules]
+        Args:
+            ticker_list: Tickers, all if empty
+            rule_list: Rule names, all if empty
+            clip: Clip the scaled forecasts to +/- 20
+        '''
+        return self._forecast_panel(ticker_list, rule_list, clip).to_dict()
+
+    def _lazy_panel(self, calc_panel):
+        return LazyPanel(self.ticker_instrument_map, [rulename for rulename, *_ in self.rules], calc_panel)
+
+    def _forecast_panel(self, ticker_list=[], rule_list=[], clip=False):
+        def _calc_forecast(ticker_list, rule_list):
+            rule_map = {rulename: (rule, kargs) for rulename, rule, kargs in self.rules}
+            forecast_graph = ForecastGraph([(rulename, rule_node(rulename, rule_map[rulename][0],
+                                                                 **rule_map[rulename][1]))
+                                            for rulename in rule_list])
+
+            res = OrderedDict()
+            for ticker in ticker_list:
+                rule_values = forecast_graph.run(self.ticker_instrument_map[ticker])
+                forecasts = [signal_scalar(forecast.rename(rulename)) for rulename, forecast in rule_values.items()]
                 if clip:
                     forecasts = [(signal_clipper(forecast)) for forecast in forecasts]
 
-                res[ticker] = pd.concat(forecasts, axis=1)
+                # each rule keeps its own dates
+                res[ticker] = OrderedDict((forecast.name, forecast) for forecast in forecasts)
 
-            self._forecast = res
+            self.forecast_graph = forecast_graph
+            return Panel.from_series(res)
 
-        if not self._forecast:
-            _calc_forecast(clip=False)
+        # only the forecasts of the tickers and rules requested are computed, the other ones on a later request
+        forecast = self._cached_result('forecast', (clip,), lambda: self._lazy_panel(_calc_forecast))
+        return forecast.select(self._all_tickers_if_empty(ticker_list), self._all_rules_if_empty(rule_list))
 
-        ticker_list = self._all_tickers_if_empty(ticker_list)
-        rule_list = self._all_rules_if_empty(rule_list)
-
-        res = { ticker:self._forecast[ticker][rule_list] for ticker in ticker_list }
-        return res
+    def _position_panel(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
+                        round_position=False, clip=False):
+        def _calc_position(ticker_list, rule_list):
+            forecast = self._forecast_panel(ticker_list, rule_list, clip)
+            vol_price = aligned_values({ticker: self.ticker_instrument_map[ticker].vol_price(to_usd=True)
+                                        for ticker in forecast.tickers}, forecast.dates, forecast.tickers)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                volatility_scalar = system.vol_target_cash_daily / vol_price
+            position = forecast.with_values(
+                forecast.values * volatility_scalar[:, :, np.newaxis] / system.avg_abs_forecast)
 
-    def position(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
-                 round_position=False):
-        def apply_buffer_one_signal(opt_pos, trade_to_edge, round_position):
-            """
-            Apply a buffer to a position
-            If position is outside the buffer, we either trade to the edge of the
-            buffer, or to the optimal
-            If we're rounding positions, then we floor and ceiling the buffers.
-            :param opt_pos: optimal position
-            :type opt_pos: pd.Series
-            :param trade_to_edge: Trade to the edge (True) or the optimal (False)
-            :type trade_to_edge: bool
-            :param round_position: Produce rounded positions
-            :type round_position: bool
-            :returns: pd.Series
-            """
-
-            def apply_buffer_one_signal_one_period(previous_pos, opt_pos, lower_limit, upper_limit, trade_to_edge):
-                """
-                Apply a buffer to a position, single period
-                If position is outside the buffer, we either trade to the edge of the
-                buffer, or to the optimal
-                :param previous_pos: last position we had
-                :type previous_pos: float
-                :param opt_pos: ideal position
-                :type opt_pos: float
-                :param upper_limit: top of buffer
-                :type upper_limit: float
-                :param lower_limit: bottom of buffer
-                :type lower_limit: float
-                :param trade_to_edge: Trade to the edge (TRue) or the optimal (False)
-                :type trade_to_edge: bool
-                :returns: float
-                """
-
-                if np.isnan(upper_limit) or np.isnan(lower_limit) or np.isnan(opt_pos):
-                    return previous_pos
-
-                if previous_pos > upper_limit:
-                    if trade_to_edge:
-                        return upper_limit
-                    else:
-                        return opt_pos
-                elif previous_pos < lower_limit:
-                    if trade_to_edge:
-                        return lower_limit
-                    else:
-                        return opt_pos
-                else:
-                    return previous_pos
-
-            buffer = opt_pos.abs() * 0.1
-            lower_limit = opt_pos - buffer
-            upper_limit = opt_pos + buffer
-
-            if round_position:
-                opt_pos = opt_pos.round()
-                upper_limit = upper_limit.round()
-                lower_limit = lower_limit.round()
-
-            current_position = 0.0
-            buffered_position_list = []
-
-            for x, y, z in zip(opt_pos, lower_limit, upper_limit):
-                current_position = apply_buffer_one_signal_one_period(current_position, x, y, z, trade_to_edge)
-                buffered_position_list.append(current_position)
-
-            buffered_position = pd.Series(buffered_position_list, index=opt_pos.index)
-            buffered_position[opt_pos.isnull()] = np.nan
-            return buffered_position
-
-        def _calc_position():
-            res = {}
-
-            ticker_list = self._forecast.keys()
-            volatility_scalar = {
-            ticker: system.vol_target_cash_daily / self.ticker_instrument_map[ticker].vol_price(to_usd=True) for ticker
-            in ticker_list}
-            position = {
-            ticker: self._forecast[ticker].multiply(volatility_scalar[ticker], axis=0) / system.avg_abs_forecast for
-            ticker in ticker_list}
-
-            self._position = position
-
-        if not self._position:
-            _calc_position()
+            # the buffering of a ticker and rule only depends on its own optimal positions
+            if buffered_position:
+                position = position.with_values(buffer_positions(position.values, trade_to_edge, round_position))
+            return position
 
-        ticker_list = self._all_tickers_if_empty(ticker_list)
-        rule_list = self._all_rules_if_empty(rule_list)
+        if not buffered_position:
+            trade_to_edge = round_position = False
 
-        position = {ticker: self._position[ticker][rule_list] for ticker in ticker_list}
+        position = self._cached_result('position', (clip, buffered_position, trade_to_edge, round_position),
+                                       lambda: self._lazy_panel(_calc_position))
+        return position.select(self._all_tickers_if_empty(ticker_list), self._all_rules_if_empty(rule_list))
 
-        if buffered_position:
-            position = {ticker: df.apply(apply_buffer_one_signal, args=(trade_to_edge, round_position)) for ticker, df
-                        in position.items()}
+    def position(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
+                 round_position=False, clip=False):
+        return self._position_panel(ticker_list, rule_list, buffered_position, trade_to_edge, round_position,
+                                    clip).to_dict()
 
-        return position
+    def _forecast_turnover_frame(self, ticker_list=[], rule_list=[]):
+        forecast = self._forecast_panel(ticker_list, rule_list)
+        turnover = forecast.with_values(forecast.values / system.target_abs_forecast).diff()
+        return turnover.with_values(np.abs(turnover.values)).mean()
 
     def forecast_turnover(self, ticker_list=[], rule_list=[]):
-        return {key: (value / system.target_abs_forecast).diff().abs().mean() for key, value in
-                self.forecast(ticker_list, rule_list).items()}
+        turnover = self._forecast_turnover_frame(ticker_list, rule_list)
+        return {ticker: pd.Series(turnover.loc[ticker].values, index=turnover.columns) for ticker in turnover.index}
 
     def forecast_cost_in_SR(self, ticker_list=[], rule_list=[]):
-        forecast_turnover = self.forecast_turnover(ticker_list, rule_list)
-        cost_in_SR = {key: self.ticker_instrument_map[key].cost_in_SR.apply(lambda x: x * value) for key, value in
-                      forecast_turnover.items()}
+        turnover = self._forecast_turnover_frame(ticker_list, rule_list)
+        cost_in_SR = {}
+        for ticker in turnover.index:
+            inst_cost_in_SR = self.ticker_instrument_map[ticker].cost_in_SR
+            cost_in_SR[ticker] = pd.DataFrame(np.outer(inst_cost_in_SR.values, turnover.loc[ticker].values),
+                                              index=inst_cost_in_SR.index, columns=turnover.columns)
         return cost_in_SR
 
+    def _position_turnover_panel(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
+                                 round_position=False, clip=False):
+        position = self._position_panel(ticker_list, rule_list, buffered_position, trade_to_edge, round_position, clip)
+        return position.with_values(np.abs(position.diff().values))
+
     def position_turnover(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
-                          round_position=False):
-        position = self.position(ticker_list, rule_list, buffered_position, trade_to_edge, round_position)
-        one_way_turnover = {key: value.diff().abs() for key, value in position.items()}
-        return one_way_turnover
+                          round_position=False, clip=False):
+        return self._position_turnover_panel(ticker_list, rule_list, buffered_position, trade_to_edge,
+                                             round_position, clip).to_dict()
 
     def position_cost_in_SR(self, ticker_list=[], rule_list=[]):
-        position_turnover = self.position_turnover(ticker_list, rule_list)
-        cost_in_SR = {key: value.apply(lambda x: x * self.ticker_instrument_map[key].cost_in_SR) for key, value in
-                      position_turnover.items()}
-        return cost_in_SR
-
-    def position_cost(self, ticker_list=[], rule_list=[]):
-        position_turnover = self.position_turnover(ticker_list, rule_list)
-        cost_in_SR = {key: value.apply(lambda x: x * self.ticker_instrument_map[key].cost) for key, value in
-                      position_turnover.items()}
-        return cost_in_SR
+        position_turnover = self._position_turnover_panel(ticker_list, rule_list)
+        cost_in_SR = aligned_values({ticker: self.ticker_instrument_map[ticker].cost_in_SR
+                                     for ticker in position_turnover.tickers},
+                                    position_turnover.dates, position_turnover.tickers)
+        return position_turnover.with_values(position_turnover.values * cost_in_SR[:, :, np.newaxis]).to_dict()
+
+    def _position_cost_panel(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
+                             round_position=False, clip=False):
+        position_turnover = self._position_turnover_panel(ticker_list, rule_list, buffered_position, trade_to_edge,
+                                                          round_position, clip)
+        cost = np.array([self.ticker_instrument_map[ticker].cost for ticker in position_turnover.tickers])
+        return position_turnover.with_values(position_turnover.values * cost[np.newaxis, :, np.newaxis])
+
+    def position_cost(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False,
+                      round_position=False, clip=False):
+        return self._position_cost_panel(ticker_list, rule_list, buffered_position, trade_to_edge, round_position,
+                                          clip).to_dict()
 
     def pnl(self, ticker_list=[], rule_list=[], buffered_position=False, trade_to_edge=False, round_position=False,
-            delay=0):
-        ticker_list = self._all_tickers_if_empty(ticker_list)
-        rule_list = self._all_rules_if_empty(rule_list)
+            delay=0, clip=False):
+        ''' Gross pnl, cost and net pnl of the positions of each rule for each ticker given
+
+        Args:
+            delay: Number of days between a position and the first price change it earns, or a list of them
 
-        position = self._position
-        pnl_one_contract = {
-            ticker: self.ticker_instrument_map[ticker].price_diff * self.ticker_instrument_map[ticker].cont_size for
-            ticker
-            in ticker_list}
-        gross_pnl = {ticker: position[ticker].shift(delay).multiply(pnl_one_contract[ticker], axis=0) for ticker in
-                     ticker_list}
+        Returns:
+            A tuple of dicts of ticker to data frame of the gross pnl, cost and net pnl, or a dict of delay to such a
+            tuple if delay is a list
+        '''
+        delays = list(delay) if isinstance(delay, (list, tuple)) else [delay]
+        if not buffered_position:
+            trade_to_edge = round_position = False
 
-        cost = self.position_cost(ticker_list, rule_list)
-        net_pnl = {ticker: gross_pnl[ticker].add(-cost[ticker]) for ticker in ticker_list}
+        ticker_list = self._all_tickers_if_empty(ticker_list)
+        rule_list = self._all_rules_if_empty(rule_list)
 
-        return gross_pnl, cost, net_pnl
+        # delay to lazy panels of the gross pnl, cost and net pnl
+        pnl = self._cached_result('pnl', (clip, buffered_position, trade_to_edge, round_position), dict)
+        block_delays = OrderedDict()
+        for delay_ in delays:
+            if delay_ not in pnl:
+                pnl[delay_] = (self._lazy_panel(None), self._lazy_panel(None), self._lazy_panel(None))
+            for block_tickers, block_rules in pnl[delay_][0].missing(ticker_list, rule_list):
+                block_delays.setdefault((tuple(block_tickers), tuple(block_rules)), []).append(delay_)
+
+        for (block_tickers, block_rules), missing_delays in block_delays.items():
+            position = self._position_panel(block_tickers, block_rules, buffered_position, trade_to_edge,
+                                            round_position, clip)
+            instruments = [self.ticker_instrument_map[ticker] for ticker in position.tickers]
+
+            pnl_one_contract = aligned_values({ticker: inst.ohlcv.CLOSE.diff() * inst.cont_size
+                                               for ticker, inst in zip(position.tickers, instruments)},
+                                              position.dates, position.tickers)
+            cost = np.array([inst.cost for inst in instruments])
+
+            gross_pnl, cost_panel, net_pnl = account_pnl(position, pnl_one_contract, cost, missing_delays)
+            for delay_ in missing_delays:
+                for lazy_panel, panel in zip(pnl[delay_], (gross_pnl[delay_], cost_panel, net_pnl[delay_])):
+                    lazy_panel.update(panel)
+
+        res = OrderedDict((delay_, tuple(lazy_panel.select(ticker_list, rule_list).to_dict()
+                                         for lazy_panel in pnl[delay_]))
+                          for delay_ in delays)
+        return res if isinstance(delay, (list, tuple)) else res[delay]
@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
-from scipy.optimize import minimize
 from hydrogen.portfolio import Portfolio
+import hydrogen.portopt
 
 class Optimiser():
 
@@ -24,17 +24,17 @@ class Optimiser():
         ''' returns the negative SR of a portfolio given component weights and sigma '''
         return -self.port_SR(weights, means, sigma_mat, risk_free_rates=0.0)
 
-    def standardise_vol(self, return_df, annualised_target_vol):
-        return return_df / return_df.std(axis=0) * (annualised_target_vol / 16)
+    def standardise_vol(self, returns, annualised_target_vol):
+        return hydrogen.portopt.standardise_vol(returns, annualised_target_vol)
 
-    def handcrafted_port_opt(self, return_df, use_standardise_vol=False, annualised_target_vol=0.2):
-        ''' Hand crafting portfolio weights '''
-        n_assets = return_df.shape[1]
+    def handcrafted_port_opt(self, returns, use_standardise_vol=False, annualised_target_vol=0.2):
+        ''' Hand crafting portfolio weights of an array of returns of dates by assets '''
+        n_assets = returns.shape[1]
 
         if (not use_standardise_vol) or (n_assets > 3):
             raise Exception("handcrafting_weight only works with 3 or fewer assets with same vol")
         else:
-            return_df = self.standardise_vol(return_df, annualised_target_vol)
+            returns = self.standardise_vol(returns, annualised_target_vol)
 
         def round_to_nearest(xs, refs=np.array([0, 0.25, 0.5, 0.75, 0.9])):
             ## return x rounded to nearest value in ref
@@ -49,90 +49,51 @@ class Optimiser():
         if n_assets < 3:
             return np.ones(n_assets) / n_assets
         elif n_assets == 3:
-            corr_mat = return_df.corr().values
+            corr_mat = hydrogen.portopt._nan_corr(returns)
             off_diagonal_corr_values = corr_mat[np.triu_indices(3, 1)]
             return weights_lookup(off_diagonal_corr_values)
         else:
             raise NotImplementedError('This line should never be reached')
 
-    def generate_fitting_period(self, return_df, data_split_method, n_roll_days=256):
-        ''' Assume return_df has daily index '''
-        supported_method = ['in_sample', 'rolling', 'expanding']
-
-        if data_split_method == 'in_sample':
-            df_list = [return_df]
-        elif data_split_method == 'rolling':
-            df_list = [return_df[start_date:end_date] for start_date, end_date
-                       in zip(return_df.index[:-n_roll_days + 1], return_df.index[n_roll_days - 1:])]
-        elif data_split_method == 'expanding':
-            df_list = [return_df[:end_date] for end_date
-                       in return_df.index[n_roll_days - 1:]]
-        else:
-            raise Exception(
-                'Unregonised data split method: {method}. Supported methods are {supported_method}.'.format(
-                    method=data_split_method,
-                    supported_method=supported_method))
-        return df_list
-
-    def mean_var_port_opt(self, means, sigma_mat):
-        n_assets = len(means)
-
-        initial_weights = np.ones(n_assets).reshape([1, -1]) / n_assets
-
-        bounds = [(0.0, 1.0)] * n_assets
-        constraint_dict = [{'type': 'eq', 'fun': lambda weights: 1 - sum(weights)}]
-
-        self.solution = minimize(self.port_SR_negative_riskfree, initial_weights, (means, sigma_mat), method='SLSQP',
-                                 bounds=bounds,
-                                 constraints=constraint_dict, tol=0.00001)
-
-        return self.solution['x'], self.solution
-
-    def markotwitz_port_opt(self, return_df, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2):
-        n_assets = return_df.shape[1]
-
-        if use_standardise_vol:
-            return_df = self.standardise_vol(return_df, annualised_target_vol)
-            return_df = self.standardise_vol(return_df, annualised_target_vol)
-
-        sigma_mat = return_df.cov().values
-
-        if use_equal_means:
-            means = np.ones(n_assets) * return_df.mean(axis=0).mean()
-        else:
-            means = return_df.mean(axis=0)
-
-        res, _ = self.mean_var_port_opt(means, sigma_mat)
+    def generate_fitting_period(self, return_df, data_split_method, n_roll_days=256, step=1):
+        ''' Generate the (start, end) row bounds of the fitting periods, see portopt.generate_fitting_period '''
+        return hydrogen.portopt.generate_fitting_period(return_df, data_split_method, n_roll_days, step)
+
+    def mean_var_port_opt(self, means, sigma_mat, initial_weights=None, method='active_set'):
+        ''' Long only max Sharpe weights, see portopt.mean_var_port_opt '''
+        weights, self.solution = hydrogen.portopt.mean_var_port_opt(means, sigma_mat, initial_weights, method)
+        return weights, self.solution
+
+    def markotwitz_port_opt(self, returns, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2):
+        return self.moments_port_opt(hydrogen.portopt.MomentAccumulator.from_returns(returns), use_equal_means,
+                                     use_standardise_vol, annualised_target_vol)
+
+    def moments_port_opt(self, accumulator, use_equal_means=False, use_standardise_vol=False,
+                         annualised_target_vol=0.2, initial_weights=None):
+        ''' Mean variance weights from the moments of a MomentAccumulator, see portopt.moments_port_opt '''
+        means, sigma_mat = hydrogen.portopt._adjust_moments(accumulator.mean(), accumulator.cov(), use_equal_means,
+                                                            use_standardise_vol, annualised_target_vol)
+        res, _ = self.mean_var_port_opt(means, sigma_mat, initial_weights)
         return res
 
-    def bootstrap_port_opt(self, return_df, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2,
-                           n_bootstrap_run=100, n_samples_per_run=256):
-        ''' Monte_carlo number of bootstrap, not block bootstrap '''
-        weights_mat = np.array(
-            [self.markotwitz_port_opt(return_df.sample(n=n_samples_per_run, replace=True), use_equal_means,
-                                      use_standardise_vol, annualised_target_vol) for _ in
-             range(n_bootstrap_run)])
-        return (weights_mat.T / weights_mat.sum(axis=1)).mean(axis=1)
-
-    def port_opt(self, return_df, fit_method, data_split_method, n_roll_days=256, step=22, **kwargs):
-        df_list = self.generate_fitting_period(return_df, data_split_method, n_roll_days)
-
-        weights_df_list = []
-
-        port_opt_helper = {'handcrafted': self.handcrafted_port_opt,
-                           'one_period': self.markotwitz_port_opt,
-                           'bootstrap': self.bootstrap_port_opt}[fit_method]
-        for df in df_list[::step]:
-            print('Optimising portfolio using data between {start_date} and {end_date}'.format(start_date=df.index[0],
-                                                                                               end_date=df.index[-1]))
-
-            weights = port_opt_helper(df, **kwargs)
-
-            weights_df = pd.DataFrame(weights.reshape(1, -1), [df.index[-1]], return_df.columns)
-
-            weights_df_list.append(weights_df)
-
-        return pd.concat(weights_df_list)
+    def bootstrap_port_opt(self, returns, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2,
+                           n_bootstrap_run=100, n_samples_per_run=256, seed=None, n_runs_per_block=128,
+                           executor=None, max_workers=None):
+        ''' Monte_carlo number of bootstrap, not block bootstrap, see portopt.bootstrap_port_opt '''
+        return hydrogen.portopt.bootstrap_port_opt(returns, use_equal_means, use_standardise_vol, annualised_target_vol,
+                                                   n_bootstrap_run, n_samples_per_run, seed, n_runs_per_block,
+                                                   executor, max_workers)
+
+    def port_opt(self, return_df, fit_method, data_split_method, n_roll_days=256, step=22, seed=None, executor=None,
+                 max_workers=None, **kwargs):
+        ''' Fit the weights of the columns of return_df on each fitting period with the methods of the optimiser,
+            see portopt.port_opt
+        '''
+        helpers = {'handcrafted': self.handcrafted_port_opt,
+                   'one_period': self.moments_port_opt,
+                   'bootstrap': self.bootstrap_port_opt}
+        return hydrogen.portopt.port_opt(return_df, fit_method, data_split_method, n_roll_days, step, seed, executor,
+                                         max_workers, helpers, **kwargs)
 
 
 if __name__ == '__main__':
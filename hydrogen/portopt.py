@@ -1,6 +1,8 @@
+import os
+from multiprocessing import Pool
 import pandas as pd
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import minimize, OptimizeResult
 
 
 def port_mean(weights, means):
@@ -23,18 +25,134 @@ def port_SR_negative_riskfree(weights, means, sigma_mat):
     return -port_SR(weights, means, sigma_mat, risk_free_rates=0.0)
 
 
-def standardise_vol(return_df, annualised_target_vol):
-    return return_df / return_df.std(axis=0) * (annualised_target_vol / 16)
-
-
-def handcrafted_port_opt(return_df, use_standardise_vol=False, annualised_target_vol=0.2):
-    ''' Hand crafting portfolio weights '''
-    n_assets = return_df.shape[1]
+class MomentAccumulator:
+    ''' Running pairwise moments of the columns of returns, updated as rows enter and leave a window
+
+    For each pair of columns (i, j), the number of rows where both are valid, the sum and the sum of squares of i on
+    these rows and the sum of the cross products are kept, so the moments match DataFrame.mean, cov (ddof=1) and corr
+    of the rows added. Adding or removing rows costs the number of rows times the square of the number of columns.
+
+    Args:
+        n_assets: Number of columns of the returns
+    '''
+
+    def __init__(self, n_assets):
+        self.n_assets = n_assets
+        self.start = None
+        self.end = None
+        self.reset()
+
+    def reset(self):
+        ''' Remove all the rows '''
+        self.offset = None
+        self.n_pair = np.zeros((self.n_assets, self.n_assets))
+        self.sum_pair = np.zeros((self.n_assets, self.n_assets))
+        self.square_sum_pair = np.zeros((self.n_assets, self.n_assets))
+        self.cross_sum = np.zeros((self.n_assets, self.n_assets))
+        self.start = self.end = None
+
+    @classmethod
+    def from_returns(cls, returns):
+        ''' Create an accumulator of all the rows of an array of returns of dates by assets '''
+        accumulator = cls(returns.shape[1])
+        accumulator.update_window(returns, 0, len(returns))
+        return accumulator
+
+    def add(self, returns, sign=1.0):
+        ''' Add rows of returns of dates by assets, or remove them if sign is -1 '''
+        if self.offset is None:
+            # the moments are accumulated around the mean of the first rows to limit the cancellation in cov
+            with np.errstate(invalid='ignore'):
+                self.offset = np.nan_to_num(_nansum(returns) / (~np.isnan(returns)).sum(axis=0))
+
+        is_valid = (~np.isnan(returns)).astype(np.float64)
+        valid_returns = np.where(is_valid, returns - self.offset, 0.0)
+        self.n_pair += sign * is_valid.T.dot(is_valid)
+        self.sum_pair += sign * valid_returns.T.dot(is_valid)
+        self.square_sum_pair += sign * (valid_returns ** 2).T.dot(is_valid)
+        self.cross_sum += sign * valid_returns.T.dot(valid_returns)
+
+    def remove(self, returns):
+        ''' Remove rows of returns added earlier '''
+        self.add(returns, -1.0)
+
+    def update_window(self, returns, start, end):
+        ''' Move the window of the accumulator to the rows start to end (excluded) of returns, only adding and
+            removing the rows that differ from the current window
+        '''
+        if self.end is None or start >= self.end or start < self.start or end < self.end:
+            self.reset()
+            self.add(returns[start:end])
+        else:
+            self.add(returns[self.end:end])
+            self.remove(returns[self.start:start])
+        self.start, self.end = start, end
+
+    def mean(self):
+        ''' Mean of each column over its valid rows '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.diag(self.sum_pair) / np.diag(self.n_pair) + self._offset()
+
+    def cov(self):
+        ''' Covariance matrix with ddof=1, each pair using the rows where both are valid '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (self.cross_sum - self.sum_pair * self.sum_pair.T / self.n_pair) / (self.n_pair - 1)
+        cov[self.n_pair < 2] = np.nan
+        return cov
+
+    def std(self):
+        ''' Standard deviation with ddof=1 of each column over its valid rows '''
+        with np.errstate(invalid='ignore'):
+            return np.sqrt(np.diag(self.cov()))
+
+    def corr(self):
+        ''' Correlation matrix, each pair using the rows where both are valid '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # the sum of the squared deviations of i over the rows where both i and j are valid
+            ssqdm_pair = self.square_sum_pair - self.sum_pair ** 2 / self.n_pair
+            return self.cov() * (self.n_pair - 1) / np.sqrt(ssqdm_pair * ssqdm_pair.T)
+
+    def _offset(self):
+        return np.zeros(self.n_assets) if self.offset is None else self.offset
+
+
+def _nansum(returns):
+    return np.where(np.isnan(returns), 0.0, returns).sum(axis=0)
+
+
+def _nan_mean(returns):
+    ''' Mean of each column of an array ignoring NA, as DataFrame.mean '''
+    return MomentAccumulator.from_returns(returns).mean()
+
+
+def _nan_cov(returns):
+    ''' Covariance matrix of the columns of an array with ddof=1, each pair using the rows where both are valid, as
+        DataFrame.cov
+    '''
+    return MomentAccumulator.from_returns(returns).cov()
+
+
+def _nan_corr(returns):
+    ''' Correlation matrix of the columns of an array, each pair using the rows where both are valid, as
+        DataFrame.corr
+    '''
+    return MomentAccumulator.from_returns(returns).corr()
+
+
+def standardise_vol(returns, annualised_target_vol):
+    ''' Scale each column of an array of returns to a daily vol of annualised_target_vol / 16 '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return returns / np.sqrt(np.diag(_nan_cov(returns))) * (annualised_target_vol / 16)
+
+
+def handcrafted_port_opt(returns, use_standardise_vol=False, annualised_target_vol=0.2):
+    ''' Hand crafting portfolio weights of an array of returns of dates by assets '''
+    n_assets = returns.shape[1]
 
     if (not use_standardise_vol) or (n_assets > 3):
         raise Exception("handcrafting_weight only works with 3 or fewer assets with same vol")
     else:
-        return_df = standardise_vol(return_df, annualised_target_vol)
+        returns = standardise_vol(returns, annualised_target_vol)
 
     def round_to_nearest(xs, refs=np.array([0, 0.25, 0.5, 0.75, 0.9])):
         ## return x rounded to nearest value in ref
@@ -49,37 +167,71 @@ def handcrafted_port_opt(return_df, use_standardise_vol=False, annualised_target
     if n_assets < 3:
         return np.ones(n_assets) / n_assets
     elif n_assets == 3:
-        corr_mat = return_df.corr().values
+        corr_mat = _nan_corr(returns)
         off_diagonal_corr_values = corr_mat[np.triu_indices(3, 1)]
         return weights_lookup(off_diagonal_corr_values)
     else:
         raise NotImplementedError('This line should never be reached')
 
 
-def generate_fitting_period(return_df, data_split_method, n_roll_days=256):
-    ''' Assume return_df has daily index '''
-    supported_method = ['in_sample', 'rolling', 'expanding']
+def generate_fitting_period(return_df, data_split_method, n_roll_days=256, step=1):
+    ''' Generate the fitting periods of a daily return_df as (start, end) row bounds, end excluded
 
-    if data_split_method == 'in_sample':
-        df_list = [return_df]
-    elif data_split_method == 'rolling':
-        df_list = [return_df[start_date:end_date] for start_date, end_date
-                   in zip(return_df.index[:-n_roll_days + 1], return_df.index[n_roll_days - 1:] )]
-    elif data_split_method == 'expanding':
-        df_list = [return_df[:end_date] for end_date
-                   in return_df.index[n_roll_days - 1:]]
-    else:
+    Args:
+        return_df: Data frame of daily returns, or any sequence of them
+        data_split_method: in_sample for all the rows, rolling for windows of n_roll_days rows or expanding for the
+            rows up to the end of each of these windows
+        n_roll_days: Number of rows of the first window
+        step: Number of rows between the ends of two fitting periods
+
+    Returns:
+        A generator of (start, end) tuples, such that return_df.iloc[start:end] is the fitting period
+    '''
+    supported_method = ['in_sample', 'rolling', 'expanding']
+    if data_split_method not in supported_method:
         raise Exception(
             'Unregonised data split method: {method}. Supported methods are {supported_method}.'.format(
                 method=data_split_method,
                 supported_method=supported_method))
-    return df_list
 
+    n_obs = len(return_df)
+    if data_split_method == 'in_sample':
+        yield 0, n_obs
+        return
+
+    for end in range(n_roll_days, n_obs + 1, step):
+        yield (end - n_roll_days if data_split_method == 'rolling' else 0), end
+
+
+def mean_var_port_opt(means, sigma_mat, initial_weights=None, method='active_set'):
+    ''' Long only weights summing to one of maximum Sharpe ratio
+
+    Args:
+        means: Array of the mean returns of the assets
+        sigma_mat: Covariance matrix of the returns of the assets
+        initial_weights: Weights to start from, e.g., the ones of the previous fitting period, default to equal weights
+        method: active_set for max_sharpe_port_opt, falling back to SLSQP from equal weights when it finds no solution,
+            or SLSQP
+
+    Returns:
+        The weights and the scipy.optimize.OptimizeResult of the solver
+    '''
+    if method not in ('active_set', 'SLSQP'):
+        raise ValueError('method is not valid: {}. Supported methods are active_set and SLSQP.'.format(method))
+
+    if method == 'active_set':
+        res = max_sharpe_port_opt(means, sigma_mat, initial_weights)
+        if res is not None:
+            weights, n_iter = res
+            return weights, OptimizeResult(x=weights, fun=-port_SR(weights, means, sigma_mat), nit=n_iter, success=True,
+                                           status=0, message='KKT conditions satisfied')
+        # e.g., no asset of positive mean, where the problem is not convex and SLSQP starts from equal weights as it did
+        initial_weights = None
 
-def mean_var_port_opt(means, sigma_mat):
     n_assets = len(means)
 
-    initial_weights = np.ones(n_assets).reshape([1, -1]) / n_assets
+    if initial_weights is None:
+        initial_weights = np.ones(n_assets) / n_assets
 
     bounds = [(0.0, 1.0)] * n_assets
     constraint_dict = [{'type': 'eq', 'fun': lambda weights: 1 - sum(weights)}]
@@ -90,51 +242,309 @@ def mean_var_port_opt(means, sigma_mat):
     return solution['x'], solution
 
 
-def markotwitz_port_opt(return_df, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2):
-    n_assets = return_df.shape[1]
+def max_sharpe_port_opt(means, sigma_mat, initial_weights=None, max_iter=None):
+    ''' Long only weights summing to one of maximum Sharpe ratio, by an active set method
+
+    The weights are y / sum(y) of the solution y of
+        min 1/2 y' sigma y - means' y  subject to  y >= 0
+    whose KKT conditions are the ones of the max Sharpe problem up to the scale of y. It is solved by the active set
+    method of Lawson and Hanson on the covariance matrix, starting from initial_weights, e.g., the weights of the
+    previous fitting period, whose assets held usually are the optimal ones already.
+
+    Args:
+        means: Array of the mean returns of the assets
+        sigma_mat: Covariance matrix of the returns of the assets
+        initial_weights: Weights whose assets held are the initial passive set, the start being these weights scaled
+        max_iter: Maximum number of assets added to the passive set, default to 3 times the number of assets
+
+    Returns:
+        A tuple of the weights and the number of iterations, or None if the solution does not satisfy the KKT
+        conditions, e.g., with no positive mean or a singular covariance matrix
+    '''
+    means = np.asarray(means, dtype=np.float64)
+    sigma_mat = np.asarray(sigma_mat, dtype=np.float64)
+    n_assets = len(means)
+    if not (np.isfinite(means).all() and np.isfinite(sigma_mat).all()) or not (means > 0).any():
+        return None
+
+    tolerance = 1e-9 * np.abs(means).max()
+    max_iter = 3 * n_assets if max_iter is None else max_iter
+    is_passive = np.zeros(n_assets, dtype=bool) if initial_weights is None else np.asarray(initial_weights) > 0
+
+    def solve_passive():
+        solution = np.zeros(n_assets)
+        passive = np.flatnonzero(is_passive)
+        if len(passive):
+            solution[passive] = np.linalg.solve(sigma_mat[np.ix_(passive, passive)], means[passive])
+        return solution
+
+    def move_to_passive_solution(y):
+        # move from the feasible y towards the solution on the passive set, dropping the assets reaching zero
+        while True:
+            solution = solve_passive()
+            is_negative = is_passive & (solution <= 0)
+            if not is_negative.any():
+                return solution
+
+            ratios = np.where(is_negative, y / np.where(is_negative, y - solution, 1.0), np.inf)
+            blocking = np.argmin(ratios)
+            y = y + ratios[blocking] * (solution - y)
+            y[blocking] = 0.0
+            is_passive[y <= 0] = False
+            y[~is_passive] = 0.0
+
+    # start from the previous weights scaled to the minimum of the objective along them, which is feasible, so that
+    # the passive set is only reduced to the assets blocking the move to the solution on it
+    y = np.zeros(n_assets)
+    if is_passive.any():
+        y[is_passive] = np.asarray(initial_weights, dtype=np.float64)[is_passive]
+        scale = means.dot(y) / y.dot(sigma_mat).dot(y)
+        if np.isfinite(scale) and scale > 0:
+            y *= scale
+
+    try:
+        y = move_to_passive_solution(y)
+        for n_iter in range(max_iter + 1):
+            gradient = means - sigma_mat.dot(y)
+            candidates = np.where(is_passive, -np.inf, gradient)
+            entering = np.argmax(candidates)
+            if candidates[entering] <= tolerance:
+                break
+            is_passive[entering] = True
+            y = move_to_passive_solution(y)
+        else:
+            return None
+    except np.linalg.LinAlgError:
+        return None
+
+    # KKT conditions: the gradient is zero on the assets held and no other asset improves the objective
+    gradient = means - sigma_mat.dot(y)
+    if y.sum() <= 0 or (y < 0).any() or (np.abs(gradient[is_passive]) > tolerance * 10).any() or \
+            (gradient[~is_passive] > tolerance).any():
+        return None
+
+    return y / y.sum(), n_iter
+
+
+def markotwitz_port_opt(returns, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2):
+    ''' Mean variance weights of an array of returns of dates by assets, which may contain NA '''
+    return moments_port_opt(MomentAccumulator.from_returns(returns), use_equal_means, use_standardise_vol,
+                            annualised_target_vol)
+
+
+def moments_port_opt(accumulator, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2,
+                     initial_weights=None):
+    ''' Mean variance weights from the moments of a MomentAccumulator, as markotwitz_port_opt of its rows
+
+    Args:
+        initial_weights: Weights the solver starts from, e.g., the ones of the previous fitting period
+    '''
+    means, sigma_mat = _adjust_moments(accumulator.mean(), accumulator.cov(), use_equal_means, use_standardise_vol,
+                                       annualised_target_vol)
+    res, _ = mean_var_port_opt(means, sigma_mat, initial_weights)
+    return res
 
-    if use_standardise_vol:
-        return_df = standardise_vol(return_df, annualised_target_vol)
-        return_df = standardise_vol(return_df, annualised_target_vol)
 
-    sigma_mat = return_df.cov().values
+def _adjust_moments(means, sigma_mat, use_equal_means, use_standardise_vol, annualised_target_vol):
+    ''' Means and covariance matrices, possibly batched along the first axes, of the standardised returns
+
+    Standardising the vol of the returns to annualised_target_vol / 16 scales the means by the target over the std and
+    the covariance by the product of the targets over the stds, which is done on the moments directly. A second
+    standardisation would leave them unchanged.
+    '''
+    if use_standardise_vol:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vol_scalar = (annualised_target_vol / 16) / np.sqrt(np.diagonal(sigma_mat, axis1=-2, axis2=-1))
+        means = means * vol_scalar
+        sigma_mat = sigma_mat * vol_scalar[..., :, np.newaxis] * vol_scalar[..., np.newaxis, :]
 
     if use_equal_means:
-        means = np.ones(n_assets) * return_df.mean(axis=0).mean()
+        means = np.ones_like(means) * means.mean(axis=-1)[..., np.newaxis]
+
+    return means, sigma_mat
+
+
+def batch_moments(samples):
+    ''' Means and covariance matrices of a batch of samples of dates by assets, as DataFrame.mean and cov of each
+
+    Args:
+        samples: Array of batch by dates by assets, which may contain NA
+
+    Returns:
+        An array of batch by assets of the means and an array of batch by assets by assets of the covariance matrices
+    '''
+    is_valid = (~np.isnan(samples)).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # the moments are accumulated around the overall mean to limit the cancellation in cov
+        offset = np.nan_to_num(_nansum(samples.reshape(-1, samples.shape[-1])) / is_valid.sum(axis=(0, 1)))
+        values = np.where(is_valid, samples - offset, 0.0)
+
+        values_t = np.transpose(values, (0, 2, 1))
+        n_pair = np.matmul(np.transpose(is_valid, (0, 2, 1)), is_valid)
+        sum_pair = np.matmul(values_t, is_valid)
+        cross_sum = np.matmul(values_t, values)
+
+        means = np.diagonal(sum_pair, axis1=1, axis2=2) / np.diagonal(n_pair, axis1=1, axis2=2) + offset
+        sigma_mats = (cross_sum - sum_pair * np.transpose(sum_pair, (0, 2, 1)) / n_pair) / (n_pair - 1)
+    sigma_mats[n_pair < 2] = np.nan
+    return means, sigma_mats
+
+
+def max_sharpe_weights(means, sigma_mats):
+    ''' Long only weights summing to one of maximum Sharpe ratio of a batch of means and covariance matrices
+
+    Each problem is solved by mean_var_port_opt, i.e., exactly by the active set method of max_sharpe_port_opt, and by
+    SLSQP for the problems without such a solution, e.g., with no positive mean. The problems are solved from scratch
+    so that the weights of a sample do not depend on the other samples of the batch.
+
+    Args:
+        means: Array of batch by assets
+        sigma_mats: Array of batch by assets by assets
+
+    Returns:
+        An array of batch by assets of the weights
+    '''
+    weights = np.full(means.shape, np.nan)
+    for i in range(len(means)):
+        weights[i], _ = mean_var_port_opt(means[i], sigma_mats[i])
+    return weights
+
+
+def bootstrap_port_opt(returns, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2,
+                       n_bootstrap_run=100, n_samples_per_run=256, seed=None, n_runs_per_block=128, executor=None,
+                       max_workers=None):
+    ''' Monte_carlo number of bootstrap, not block bootstrap
+
+    The runs are split in blocks of n_runs_per_block, each one drawing its samples at once from its own generator
+    spawned from seed, and computing their moments and weights as batches. The weights only depend on seed and
+    n_runs_per_block, so they are the same whether the blocks are evaluated one by one or on any number of workers.
+
+    Args:
+        seed: None for fresh entropy, an int or a numpy.random.SeedSequence
+        n_runs_per_block: Number of runs drawn from one generator and evaluated together
+        executor: None to evaluate the blocks one by one, or 'process' to evaluate them on a process pool
+        max_workers: Number of workers of the pool, default to the number of CPUs
+    '''
+    block_runs = [min(n_runs_per_block, n_bootstrap_run - start)
+                  for start in range(0, n_bootstrap_run, n_runs_per_block)]
+    block_seeds = _seed_sequence(seed).spawn(len(block_runs))
+    args = (n_samples_per_run, use_equal_means, use_standardise_vol, annualised_target_vol)
+
+    if executor is None:
+        blocks = [_bootstrap_block(returns, block_seed, n_runs, *args)
+                  for block_seed, n_runs in zip(block_seeds, block_runs)]
     else:
-        means = return_df.mean(axis=0)
+        with _process_pool(executor, max_workers, returns) as pool:
+            results = [pool.apply_async(_worker_bootstrap_block, (block_seed, n_runs) + args)
+                       for block_seed, n_runs in zip(block_seeds, block_runs)]
+            blocks = [result.get() for result in results]
+
+    return np.concatenate(blocks).mean(axis=0)
+
+
+def _bootstrap_block(returns, seed_sequence, n_runs, n_samples_per_run, use_equal_means, use_standardise_vol,
+                     annualised_target_vol):
+    ''' Weights, normalised to sum to one, of a block of bootstrap runs drawn from the generator of seed_sequence '''
+    indices = np.random.default_rng(seed_sequence).integers(len(returns), size=(n_runs, n_samples_per_run))
+    means, sigma_mats = _adjust_moments(*batch_moments(returns[indices]), use_equal_means=use_equal_means,
+                                        use_standardise_vol=use_standardise_vol,
+                                        annualised_target_vol=annualised_target_vol)
+    weights_mat = max_sharpe_weights(means, sigma_mats)
+    return weights_mat / weights_mat.sum(axis=1)[:, np.newaxis]
+
+
+def _seed_sequence(seed):
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+# the returns of the process pool worker, sent once per worker rather than with every task
+_worker_returns = None
 
-    res, _ =  mean_var_port_opt(means, sigma_mat)
-    return res
 
-def bootstrap_port_opt(return_df, use_equal_means=False, use_standardise_vol=False, annualised_target_vol=0.2,
-                       n_bootstrap_run=100, n_samples_per_run=256):
-    ''' Monte_carlo number of bootstrap, not block bootstrap '''
-    weights_mat = np.array([markotwitz_port_opt(return_df.sample(n=n_samples_per_run, replace=True), use_equal_means,
-                                                use_standardise_vol, annualised_target_vol) for _ in
-                            range(n_bootstrap_run)])
-    return (weights_mat.T / weights_mat.sum(axis=1)).mean(axis=1)
+def _set_worker_returns(returns):
+    global _worker_returns
+    _worker_returns = returns
 
 
-def port_opt(return_df, fit_method, data_split_method,  n_roll_days=256, step=22, **kwargs):
-    df_list = generate_fitting_period(return_df, data_split_method, n_roll_days)
+def _process_pool(executor, max_workers, returns):
+    ''' Process pool whose workers get the array of returns the tasks work on when they start '''
+    if executor != 'process':
+        raise ValueError('executor is not valid: {}. Supported executors are None and process.'.format(executor))
+    return Pool(max_workers or os.cpu_count() or 1, _set_worker_returns, (returns,))
 
-    weights_df_list = []
 
-    port_opt_helper = {'handcrafted': handcrafted_port_opt,
-                       'one_period': markotwitz_port_opt,
-                       'bootstrap': bootstrap_port_opt}[fit_method]
-    for df in df_list[::step]:
-        print('Optimising portfolio using data between {start_date} and {end_date}'.format(start_date=df.index[0],
-                                                                                           end_date=df.index[-1]))
+def _worker_bootstrap_block(seed_sequence, n_runs, *args):
+    return _bootstrap_block(_worker_returns, seed_sequence, n_runs, *args)
 
-        weights = port_opt_helper(df, **kwargs)
 
-        weights_df = pd.DataFrame(weights.reshape(1, -1), [df.index[-1]], return_df.columns)
+def _worker_bootstrap_port_opt(start, end, **kwargs):
+    return bootstrap_port_opt(_worker_returns[start:end], **kwargs)
 
-        weights_df_list.append(weights_df)
 
-    return pd.concat(weights_df_list)
+def port_opt(return_df, fit_method, data_split_method,  n_roll_days=256, step=22, seed=None, executor=None,
+             max_workers=None, helpers=None, **kwargs):
+    ''' Fit the weights of the columns of return_df on each fitting period
+
+    The optimisers work on row bounds into a single array of returns rather than on copies of the data frame. The
+    one_period moments of each fitting period are updated from the previous one, adding and removing the rows that
+    differ, so a rolling or expanding fit costs the same per period whatever the length of the history, and their
+    solver starts from the weights of the previous one.
+
+    The bootstrap of each fitting period uses its own seed spawned from seed, so the weights are reproducible and the
+    same whether the fitting periods are evaluated one by one or on any number of workers.
+
+    Args:
+        seed: None for fresh entropy, an int or a numpy.random.SeedSequence, used by bootstrap
+        executor: None to evaluate the fitting periods one by one, or 'process' to evaluate the bootstrap of the
+            fitting periods on a process pool. Its workers get the returns once, and fit each period with
+            bootstrap_port_opt rather than the bootstrap helper.
+        max_workers: Number of workers of the pool, default to the number of CPUs
+        helpers: Dict of fit_method to the functions replacing handcrafted_port_opt, moments_port_opt and
+            bootstrap_port_opt, e.g., the methods of an Optimiser
+
+    Returns:
+        A data frame of the weights, indexed by the last date of each fitting period
+    '''
+    if executor not in (None, 'process'):
+        raise ValueError('executor is not valid: {}. Supported executors are None and process.'.format(executor))
+
+    returns = return_df.values.astype(np.float64)
+
+    port_opt_helper = dict({'handcrafted': handcrafted_port_opt,
+                            'one_period': moments_port_opt,
+                            'bootstrap': bootstrap_port_opt}, **(helpers or {}))[fit_method]
+
+    periods = list(generate_fitting_period(return_df, data_split_method, n_roll_days, step))
+    if fit_method == 'bootstrap':
+        period_kwargs = [dict(kwargs, seed=period_seed) for period_seed in _seed_sequence(seed).spawn(len(periods))]
+    else:
+        period_kwargs = [kwargs] * len(periods)
+
+    is_pooled = executor is not None and fit_method == 'bootstrap'
+    accumulator = MomentAccumulator(returns.shape[1])
+    weights_list = []
+    end_dates = []
+    for (start, end), fit_kwargs in zip(periods, period_kwargs):
+        print('Optimising portfolio using data between {start_date} and {end_date}'.format(
+            start_date=return_df.index[start], end_date=return_df.index[end - 1]))
+
+        if fit_method == 'one_period':
+            accumulator.update_window(returns, start, end)
+            # the solver starts from the weights of the previous fitting period
+            initial_weights = weights_list[-1] if weights_list else None
+            weights_list.append(port_opt_helper(accumulator, initial_weights=initial_weights, **fit_kwargs))
+        elif not is_pooled:
+            weights_list.append(port_opt_helper(returns[start:end], **fit_kwargs))
+        end_dates.append(return_df.index[end - 1])
+
+    if is_pooled:
+        # one pool for all the fitting periods, each task only sends the bounds of its period
+        with _process_pool(executor, max_workers, returns) as pool:
+            results = [pool.apply_async(_worker_bootstrap_port_opt, (start, end), fit_kwargs)
+                       for (start, end), fit_kwargs in zip(periods, period_kwargs)]
+            weights_list = [result.get() for result in results]
+
+    return pd.DataFrame([np.ravel(weights) for weights in weights_list], end_dates, return_df.columns)
 
 
 if __name__=='__main__':
@@ -0,0 +1,189 @@
+''' Parameter sweep of trading rules across instruments
+
+    The forecasts of every parameter of a rule family are evaluated at once on arrays of dates by instruments by
+    parameters, in chunks of parameters to bound memory, optionally fanned out to a process pool. Each instrument is
+    evaluated on its own dates, i.e., the ones with a price.
+'''
+
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import hydrogen.system as system
+import hydrogen.analytics
+from hydrogen.trading_rules import ewmac_arrays, breakout_arrays, carry_arrays
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+SweepResult = namedtuple('SweepResult', ['sharpe_ratio', 'forecast', 'scaled_forecast'])
+
+
+def _ewmac_family(panels, params):
+    return ewmac_arrays(panels['price'], panels['vol'], params)
+
+
+def _breakout_family(panels, params):
+    windows = [param[0] if isinstance(param, tuple) else param for param in params]
+    spans = [param[1] if isinstance(param, tuple) else None for param in params]
+    return breakout_arrays(panels['price'], windows, spans)
+
+
+def _carry_family(panels, params):
+    return carry_arrays(panels['annual_yield'], params)
+
+
+# rule family: (function of the panels and a list of parameters, panels needed)
+RULE_FAMILIES = {'EWMAC': (_ewmac_family, ['price', 'vol']),
+                 'breakout': (_breakout_family, ['price']),
+                 'carry': (_carry_family, ['annual_yield']),
+                 }
+
+
+def sweep_panels(instruments, annual_yield=True):
+    ''' Return the data frames of dates by instruments needed by the rule families
+
+    Args:
+        instruments: Dict of ticker to instrument, e.g., Portfolio.ticker_instrument_map
+        annual_yield: Include the annual yield needed by carry
+
+    Returns:
+        A dict of price (adjusted close), vol (Instrument.vol_price, also used to size the positions) and annual_yield
+    '''
+    panels = {'price': pd.concat([inst.ohlcv.CLOSE.rename(ticker) for ticker, inst in instruments.items()], axis=1),
+              'vol': pd.concat([inst.vol_price().rename(ticker) for ticker, inst in instruments.items()], axis=1)}
+    if annual_yield:
+        panels['annual_yield'] = pd.concat([inst.calc_annual_yield().rename(ticker)
+                                            for ticker, inst in instruments.items()], axis=1)
+    return panels
+
+
+def sweep(panels, grids, chunk_size=None, max_chunk_bytes=2 ** 28, executor=None, max_workers=None, clip=False,
+          delay=1, keep_forecasts=False):
+    ''' Evaluate rule families over parameter grids
+
+    Args:
+        panels: Dict of data frames of dates by instruments, see sweep_panels
+        grids: Dict of rule family, i.e., EWMAC, breakout or carry, to a list of parameters, i.e., (fast_span,
+            slow_span) for EWMAC, window or (window, span) for breakout and span for carry
+        chunk_size: Number of parameters evaluated together, default to fit max_chunk_bytes
+        max_chunk_bytes: Bound of the size of a chunk of forecasts when chunk_size is None
+        executor: None to evaluate the chunks one by one, or 'process' to evaluate them on a process pool
+        max_workers: Number of workers of the pool, default to the number of CPUs
+        clip: Clip the scaled forecasts to +/- 20 as signal_clipper
+        delay: Number of days between a forecast and the first price change it earns
+        keep_forecasts: Also return the raw and scaled forecasts
+
+    Returns:
+        A SweepResult of dicts of rule family to
+            sharpe_ratio: Annualised gross Sharpe ratio of data frame of instruments by parameters, of a position
+                proportional to the scaled forecast divided by the vol, delayed by delay days
+            forecast, scaled_forecast: Arrays of dates by instruments by parameters, None unless keep_forecasts
+    '''
+    if executor not in (None, 'process'):
+        raise ValueError('executor is not valid: {}. Supported executors are None and process.'.format(executor))
+
+    unknown_families = [family for family in grids if family not in RULE_FAMILIES]
+    if unknown_families:
+        raise ValueError('Unknown rule families {}, expected any of {}'.format(unknown_families,
+                                                                               sorted(RULE_FAMILIES)))
+
+    price = panels['price']
+    price_values = price.values.astype(np.float64)
+    has_price = ~np.isnan(price_values)
+    row_order, col_index = hydrogen.analytics.own_dates_order(has_price)
+
+    # every panel is moved to the dates of its instrument so that a chunk is a plain computation along the first axis
+    panel_names = set(['price', 'vol']).union(*[RULE_FAMILIES[family][1] for family in grids])
+    compact_panels = {}
+    for name in panel_names:
+        if name not in panels:
+            raise ValueError('{} is needed by the rule families {}'.format(name, sorted(grids)))
+        values = panels[name].reindex(index=price.index, columns=price.columns).values.astype(np.float64)
+        compact_panels[name] = values[row_order, col_index]
+
+    if chunk_size is None:
+        # a chunk holds a few arrays of forecasts of the size of the panel per parameter
+        chunk_size = max(int(max_chunk_bytes // (4 * price_values.nbytes)), 1)
+
+    tasks = [(family, params[start:start + chunk_size])
+             for family, params in grids.items() for start in range(0, len(params), chunk_size)]
+    logger.debug('Sweeping {} parameters in {} chunks'.format(sum(len(params) for params in grids.values()),
+                                                              len(tasks)))
+
+    if executor is None:
+        chunk_results = [_evaluate_chunk(family, params, compact_panels, clip, delay, keep_forecasts)
+                         for family, params in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+            futures = [pool.submit(_evaluate_chunk, family, params, compact_panels, clip, delay, keep_forecasts)
+                       for family, params in tasks]
+            chunk_results = [future.result() for future in futures]
+
+    sharpe_ratio = {}
+    forecast = {} if keep_forecasts else None
+    scaled_forecast = {} if keep_forecasts else None
+    for family, params in grids.items():
+        family_results = [chunk_result for (task_family, _), chunk_result in zip(tasks, chunk_results)
+                          if task_family == family]
+        sharpe_ratio[family] = pd.DataFrame(np.concatenate([res[0] for res in family_results], axis=1),
+                                            index=price.columns, columns=[str(param) for param in params])
+        if keep_forecasts:
+            forecast[family] = _scatter(np.concatenate([res[1] for res in family_results], axis=2),
+                                        has_price, row_order, col_index)
+            scaled_forecast[family] = _scatter(np.concatenate([res[2] for res in family_results], axis=2),
+                                               has_price, row_order, col_index)
+
+    return SweepResult(sharpe_ratio, forecast, scaled_forecast)
+
+
+def _evaluate_chunk(family, params, panels, clip, delay, keep_forecasts):
+    ''' Return the gross Sharpe ratio of instruments by params and, if keep_forecasts, the raw and scaled forecasts '''
+    forecast = RULE_FAMILIES[family][0](panels, params)
+    scaled_forecast = scale_forecasts(forecast, clip)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # position in units of vol, earning the price changes from delay days after the forecast
+        position = _shift(scaled_forecast / panels['vol'][..., np.newaxis], delay)
+        returns = position[1:] * np.diff(panels['price'], axis=0)[..., np.newaxis]
+        sharpe_ratio = _nan_sharpe_ratio(returns)
+
+    if keep_forecasts:
+        return sharpe_ratio, forecast, scaled_forecast
+    return sharpe_ratio, None, None
+
+
+def scale_forecasts(forecast, clip=False, target_abs_forecast=system.target_abs_forecast):
+    ''' Scale forecasts along the first axis as signal_scalar, and clip them as signal_clipper if clip '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled_forecast = forecast * target_abs_forecast / hydrogen.analytics.ewm_mean(np.abs(forecast),
+                                                                                       span=system.n_bday_in_year)
+    if clip:
+        scaled_forecast = np.clip(scaled_forecast, -20, 20)
+    return scaled_forecast
+
+
+def _nan_sharpe_ratio(returns):
+    ''' Annualised Sharpe ratio along the first axis ignoring NA, with a sample standard deviation '''
+    is_valid = ~np.isnan(returns)
+    n_obs = is_valid.sum(axis=0)
+    returns = np.where(is_valid, returns, 0.0)
+    mean = returns.sum(axis=0) / n_obs
+    var = (np.where(is_valid, returns - mean, 0.0) ** 2).sum(axis=0) / (n_obs - 1)
+    return mean / np.sqrt(var) * system.root_n_bday_in_year
+
+
+def _shift(values, periods):
+    res = np.full_like(values, np.nan)
+    res[periods:] = values[:len(values) - periods]
+    return res
+
+
+def _scatter(values, has_price, row_order, col_index):
+    res = np.empty_like(values)
+    res[row_order, col_index] = values
+    res[~has_price] = np.nan
+    return res
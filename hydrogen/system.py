@@ -16,6 +16,7 @@ universe_filename = os.path.join(project_path, '../data/universe.csv')
 static_filename = os.path.join(project_path, '../data/static.csv')
 filtered_static_filename = os.path.join(project_path, '../data/filtered_static.csv')
 ohlcv_path = os.path.join(project_path, '../data/ohlcv')
+ohlcv_store_path = os.path.join(project_path, '../data/ohlcv_store')
 
 cfg_filename = os.path.join(project_path, 'config.yml')
 
@@ -38,6 +38,33 @@ class AnalyticsTest(unittest.TestCase):
         res = pd.concat([a, b, c, d], axis=1)
         logger.debug(res)
 
+    def test_vol_kernel(self):
+        columns = list(self.ohlcv.columns)
+        res = hydrogen.analytics.vols(self.ohlcv, annualised=False, window=system.n_bday_in_3m)
+        self.assertEqual(list(self.ohlcv.columns), columns)
+
+        log_return = np.log(self.ohlcv.CLOSE / self.ohlcv.CLOSE.shift(1))
+        pd.util.testing.assert_series_equal(res.SD, log_return.rolling(window=system.n_bday_in_3m).std(),
+                                            check_names=False)
+        pd.util.testing.assert_series_equal(
+            hydrogen.analytics.vol(self.ohlcv, annualised=False, method='SD', ewm=True, span=36),
+            log_return.ewm(span=36).std(), check_names=False)
+        pd.util.testing.assert_series_equal(
+            hydrogen.analytics.vol(self.ohlcv, annualised=False, method='YZ', window=system.n_bday_in_3m), res.YZ,
+            check_names=False)
+
+    def test_vol_panel(self):
+        ohlcv_dict = {'A': self.ohlcv, 'B': self.ohlcv.iloc[100::2]}
+        panels = {field: pd.concat({ticker: ohlcv[field] for ticker, ohlcv in ohlcv_dict.items()}, axis=1)
+                  for field in ['OPEN', 'HIGH', 'LOW', 'CLOSE']}
+        res = hydrogen.analytics.vol_panel(panels['OPEN'], panels['HIGH'], panels['LOW'], panels['CLOSE'],
+                                           annualised=True, method='YZ', window=system.n_bday_in_3m)
+
+        for ticker, ohlcv in ohlcv_dict.items():
+            expected = hydrogen.analytics.vol(ohlcv, annualised=True, method='YZ', window=system.n_bday_in_3m)
+            np.testing.assert_array_equal(res[ticker].dropna().index, expected.dropna().index)
+            np.testing.assert_allclose(res[ticker].dropna().values, expected.dropna().values)
+
     def test_adj(self):
         pass
 
@@ -45,5 +72,40 @@ class AnalyticsTest(unittest.TestCase):
         pass
 
 
+class WindowStatsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        close = pd.Series(100 * np.exp(np.cumsum(random_state.randn(60) * 0.01)),
+                          index=pd.bdate_range('20150101', periods=60))
+        # a zero bar gives infinite log returns
+        close.iloc[10] = 0.0
+        self.ohlcv = pd.DataFrame({'OPEN': close, 'HIGH': close, 'LOW': close, 'CLOSE': close})
+
+    def tearDown(self):
+        pass
+
+    def test_non_finite_returns(self):
+        log_return = np.log(self.ohlcv.CLOSE / self.ohlcv.CLOSE.shift(1))
+        self.assertTrue(np.isinf(log_return.iloc[10:12]).all())
+
+        res = hydrogen.analytics.vols(self.ohlcv, annualised=False, window=20)
+        expected = log_return.rolling(window=20, min_periods=5).std()
+        pd.util.testing.assert_series_equal(
+            hydrogen.analytics.vol(self.ohlcv, annualised=False, method='SD', window=20, min_periods=5), expected,
+            check_names=False)
+        self.assertTrue(np.isfinite(res.SD.iloc[32:]).all())
+        pd.util.testing.assert_series_equal(
+            hydrogen.analytics.vol(self.ohlcv, annualised=False, method='SD', ewm=True, span=10),
+            log_return.ewm(span=10).std(), check_names=False)
+
+
 if __name__ == '__main__':
     unittest.main(warnings='ignore')
@@ -1,6 +1,6 @@
 import unittest
 import logging
-from hydrogen.instrument import InstrumentFactory
+from hydrogen.instrument import InstrumentFactory, Instrument, Future, FX, lazy_artefact
 import pandas as pd
 import numpy as np
 from pandas.util.testing import assert_frame_equal
@@ -39,6 +39,22 @@ class FXTest(unittest.TestCase):
 
         self.assertIsNone(aud_ticker.ccy)
 
+    def test_registry_size(self):
+        InstrumentFactory.clear_registry()
+        registry_size = InstrumentFactory.registry_size
+        InstrumentFactory.registry_size = 2
+        try:
+            dates = pd.bdate_range(self.as_of_date, periods=3)
+            first = self.instrument_factory.create_instrument(self.aud_ticker, as_of_date=dates[0])
+            self.instrument_factory.create_instrument(self.aud_ticker, as_of_date=dates[1])
+            # using the first instrument again makes the second one the least recently used
+            self.assertIs(self.instrument_factory.create_instrument(self.aud_ticker, as_of_date=dates[0]), first)
+            self.instrument_factory.create_instrument(self.aud_ticker, as_of_date=dates[2])
+            self.assertEqual(InstrumentFactory.registered(), [(self.aud_ticker, dates[0]), (self.aud_ticker, dates[2])])
+        finally:
+            InstrumentFactory.registry_size = registry_size
+            InstrumentFactory.clear_registry()
+
     def tearDown(self):
         pass
 
@@ -85,6 +101,24 @@ class FutureTest(unittest.TestCase):
     #    future_CLH15_Comdty = self.instrument_factory.create_instrument(self.future_CLH15_Comdty_ticker, as_of_date=self.as_of_date)
     #    self.assertEqual(future_CLH15_Comdty._resolve_ticker(self.future_CLH15_Comdty_ticker), "CLH15 Comdty")
 
+    def test_registry(self):
+        InstrumentFactory.clear_registry()
+        future_ES_1_Index = self.instrument_factory.create_instrument(self.future_ES_1_Index_ticker, as_of_date=self.as_of_date)
+        future_CLH15_Comdty = self.instrument_factory.create_instrument(self.future_CLH15_Comdty_ticker, as_of_date=self.as_of_date)
+
+        # both are USD futures so they share the same FX leg
+        self.assertIs(future_ES_1_Index.fx, future_CLH15_Comdty.fx)
+        self.assertIs(self.instrument_factory.create_instrument(self.future_ES_1_Index_ticker, as_of_date='20100321'),
+                      future_ES_1_Index)
+        self.assertIsNot(self.instrument_factory.create_instrument(self.future_ES_1_Index_ticker, as_of_date=self.as_of_date,
+                                                                   use_registry=False),
+                         future_ES_1_Index)
+
+        self.assertEqual(InstrumentFactory.evict(self.future_ES_1_Index_ticker), 1)
+        self.assertNotIn((self.future_ES_1_Index_ticker, pd.Timestamp(self.as_of_date)), InstrumentFactory.registered())
+        InstrumentFactory.clear_registry()
+        self.assertEqual(InstrumentFactory.registered(), [])
+
     def test_read_static(self):
         future_Z_1_Index = self.instrument_factory.create_instrument(self.future_Z_1_Index_ticker, as_of_date=self.as_of_date)
         self.assertEqual(future_Z_1_Index._cont_size, np.array(10))
@@ -151,6 +185,58 @@ class FutureTest(unittest.TestCase):
         self.assertEqual(df.CLOSE.ix[0], 4834.5)
         self.assertEqual(adj.ix['20050616'], 0)
 
+    def test_advance_to(self):
+        future_Z_1_Index = self.instrument_factory.create_instrument(self.future_Z_1_Index_ticker, as_of_date=self.as_of_date)
+
+        # crosses the roll of Z H10 Index
+        for as_of_date in ['20100322', '20100323', '20100331', '20100701']:
+            advanced = future_Z_1_Index.advance_to(as_of_date)
+            rebuilt = self.instrument_factory.create_instrument(self.future_Z_1_Index_ticker, as_of_date=as_of_date,
+                                                                use_registry=False)
+            assert_frame_equal(advanced.unadjusted_ohlcv, rebuilt.unadjusted_ohlcv)
+            assert_frame_equal(advanced.ohlcv, rebuilt.ohlcv)
+            assert_frame_equal(advanced._back_ohlcv_df, rebuilt._back_ohlcv_df)
+            pd.util.testing.assert_series_equal(advanced._adj, rebuilt._adj)
+
+        self.assertEqual(future_Z_1_Index._as_of_date, self.as_of_date)
+        self.assertRaises(ValueError, future_Z_1_Index.advance_to, '20100301')
+
+    def test_lazy_artefacts(self):
+        future_Z_1_Index = self.instrument_factory.create_instrument(self.future_Z_1_Index_ticker, as_of_date=self.as_of_date,
+                                                                     use_registry=False)
+        self.assertEqual(future_Z_1_Index.materialized_artefacts(), [])
+
+        future_Z_1_Index.ohlcv.CLOSE
+        self.assertIn('_ohlcv', future_Z_1_Index.materialized_artefacts())
+        self.assertNotIn('_back_ohlcv_df', future_Z_1_Index.materialized_artefacts())
+        self.assertNotIn('fx', future_Z_1_Index.materialized_artefacts())
+
+        future_Z_1_Index.calc_annual_yield()
+        self.assertIn('_back_ohlcv_df', future_Z_1_Index.materialized_artefacts())
+
+        future_ES_1_Index = self.instrument_factory.create_instrument(self.future_ES_1_Index_ticker,
+                                                                      as_of_date=self.as_of_date,
+                                                                      use_registry=False).materialize()
+        self.assertEqual(future_ES_1_Index.materialized_artefacts(), future_ES_1_Index.artefacts())
+        self.assertIn('_ohlcv', future_ES_1_Index.fx.materialized_artefacts())
+
+    def test_vol_cache(self):
+        future_Z_1_Index = self.instrument_factory.create_instrument(self.future_Z_1_Index_ticker, as_of_date=self.as_of_date,
+                                                                     use_registry=False)
+        vol_price = future_Z_1_Index.vol_price(to_usd=True)
+        self.assertIs(future_Z_1_Index.vol_price(to_usd=True), vol_price)
+        self.assertIsNot(future_Z_1_Index.vol_price(), vol_price)
+        self.assertIsNot(future_Z_1_Index.vol_pct(window=20), future_Z_1_Index.vol_pct())
+
+        future_Z_1_Index.invalidate_vol_cache()
+        self.assertIsNot(future_Z_1_Index.vol_price(to_usd=True), vol_price)
+        pd.util.testing.assert_series_equal(future_Z_1_Index.vol_price(to_usd=True), vol_price)
+
+        # a new adjusted price series is picked up without explicit invalidation
+        vol_pct = future_Z_1_Index.vol_pct()
+        future_Z_1_Index._ohlcv = future_Z_1_Index.ohlcv.copy()
+        self.assertIsNot(future_Z_1_Index.vol_pct(), vol_pct)
+
     def test_length(self):
         future_VG_1_Index = self.instrument_factory.create_instrument(self.future_VG_1_Index_ticker, as_of_date=pd.datetime(year=2016, month=3, day=21))
         future_ES_1_Index = self.instrument_factory.create_instrument(self.future_ES_1_Index_ticker, as_of_date=pd.datetime(year=2016, month=3, day=21))
@@ -171,5 +257,171 @@ class FutureTest(unittest.TestCase):
         ticker_list = ['Z 1 Index', 'TY1 Comdty', 'CO1 Comdty', 'ES1 Index', 'VG1 Index']
         [ self._test_roll_front_future(ticker) for ticker in ticker_list ]
 
+
+class SyntheticChainFuture(Future):
+    ''' Future reading its contracts from a dict of data frames rather than the static data and the OHLCV store '''
+    def __init__(self, contracts, as_of_date, adj_info=None):
+        self._ticker = 'XX1 Index'
+        self._as_of_date = as_of_date
+        self._static_df = pd.DataFrame({'TICKER': list(contracts)})
+        self._contracts = contracts
+        self._adj_info = adj_info
+        self._read_multiple_files = True
+        self._adj_method = 'panama'
+
+    def _load_ohlcv(self, ticker):
+        return self._contracts.get(ticker, pd.DataFrame(columns=['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME'],
+                                                        index=pd.DatetimeIndex([]), dtype=np.float64))
+
+
+class SyntheticFX(FX):
+    ''' FX reading its prices from a dict of data frames rather than the OHLCV store '''
+    def __init__(self, prices, as_of_date):
+        super().__init__('XXUSD Curncy', as_of_date)
+        self._prices = prices
+
+    def _load_ohlcv(self, ticker):
+        return self._prices[ticker]
+
+
+class SyntheticInstrument(Instrument):
+    ''' Instrument without its own way of advancing, reading its prices from a dict of data frames '''
+    prices = {}
+
+    @lazy_artefact
+    def _ohlcv(self):
+        return self.prices[self._ticker][:self._as_of_date]
+
+
+class ChainStitchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        contracts = {}
+        for i, ticker in enumerate(['XXH5 Index', 'XXM5 Index', 'XXU5 Index', 'XXZ5 Index']):
+            index = pd.bdate_range(pd.Timestamp('20150101') + pd.DateOffset(months=3 * i), periods=120)
+            # holidays and missing fields
+            index = index.delete([5, 30, 31])
+            close = 100 + 10 * i + np.cumsum(random_state.randn(len(index)))
+            contracts[ticker] = pd.DataFrame({'OPEN': close + 0.1, 'HIGH': close + 1, 'LOW': close - 1, 'CLOSE': close,
+                                              'VOLUME': 1000.0}, index=index,
+                                             columns=['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME'])
+            contracts[ticker].iloc[[10, 50], 2] = np.nan
+        # a contract without data
+        contracts['XXH6 Index'] = contracts.pop('XXZ5 Index').iloc[:0]
+
+        self.future = SyntheticChainFuture(contracts, pd.Timestamp('20150920'))
+        self.adj_info = pd.DataFrame({
+            'TICKER': list(contracts),
+            'START_DATE': [date.date() for date in pd.to_datetime(['20150101', '20150317', '20150617', '20150916'])],
+            'END_DATE': [date.date() for date in pd.to_datetime(['20150316', '20150616', '20150915', '20151215'])],
+            'NEXT_TICKER': list(contracts)[1:] + ['']})
+
+    def tearDown(self):
+        pass
+
+    def _per_contract_ohlcv(self, adj_dates, method, dropna):
+        ''' The previous stitching, reading each contract in each window of adj_dates '''
+        df_no_adj = pd.concat([self.future._read_ohlcv(row.TICKER, row.START_DATE, row.END_DATE, dropna=dropna)
+                               for _, row in adj_dates.iterrows()])
+        df = df_no_adj.copy()
+        close = df.CLOSE
+        next_close = pd.concat([self.future._read_ohlcv(row.NEXT_TICKER, row.END_DATE, row.END_DATE, dropna=False)
+                                for _, row in adj_dates.iterrows()]).CLOSE
+
+        if method == 'panama':
+            adj = (next_close - close.asof(next_close.index))
+            adj = adj[::-1].cumsum()[::-1].reindex(df.index, method='bfill').fillna(0)
+            for field in ['OPEN', 'HIGH', 'LOW', 'CLOSE']:
+                df[field] = df[field] + adj
+        elif method == 'ratio':
+            adj = (next_close / close.asof(next_close.index))
+            adj = adj[::-1].cumprod()[::-1].reindex(df.index, method='bfill').fillna(1)
+            for field in ['OPEN', 'HIGH', 'LOW', 'CLOSE']:
+                df[field] = df[field] * adj
+        else:
+            adj = next_close.copy()
+            adj[:] = 0
+
+        return df_no_adj, df, adj
+
+    def test_stitch(self):
+        back_adj_info = self.adj_info.copy()
+        back_adj_info.TICKER = back_adj_info.TICKER.shift(-1)
+        back_adj_info.NEXT_TICKER = back_adj_info.NEXT_TICKER.shift(-1)
+        back_adj_info = back_adj_info[:-1]
+
+        for adj_dates, dropna in [(self.adj_info, True), (back_adj_info, False)]:
+            for method in ['panama', 'ratio', 'no_adj']:
+                res = self.future._calc_ohlcv(adj_dates, method=method, dropna=dropna)
+                expected = self._per_contract_ohlcv(adj_dates, method, dropna)
+                self.assertGreater(len(res[0]), 100)
+                assert_frame_equal(res[0], expected[0], check_freq=False)
+                assert_frame_equal(res[1], expected[1], check_freq=False)
+                pd.util.testing.assert_series_equal(res[2], expected[2], check_freq=False, check_names=False)
+
+    def test_advance_to_new_bars(self):
+        # the store as of the first date, the bars of the following days are added to it after the future is created
+        full_contracts = self.future._contracts
+        as_of_date = pd.Timestamp('20150610')
+        contracts = {ticker: df[:as_of_date] for ticker, df in full_contracts.items()}
+        future = SyntheticChainFuture(contracts, as_of_date, self.adj_info)
+        future.ohlcv
+        future._back_ohlcv_df
+        contracts.update(full_contracts)
+
+        # crossing the roll into a contract without data when the future was created
+        for new_as_of_date in ['20150612', '20150701', '20150706']:
+            future = future.advance_to(pd.Timestamp(new_as_of_date))
+            expected = SyntheticChainFuture(full_contracts, pd.Timestamp(new_as_of_date), self.adj_info)
+            self.assertEqual(future._unadjusted_ohlcv.index[-1], expected._unadjusted_ohlcv.index[-1])
+            for name in ['_unadjusted_ohlcv', 'ohlcv', '_back_ohlcv_df']:
+                assert_frame_equal(getattr(future, name), getattr(expected, name), check_freq=False)
+            pd.util.testing.assert_series_equal(future._adj, expected._adj, check_freq=False)
+
+        fx_prices = {'XXUSD Curncy': full_contracts['XXH5 Index'][:'20150210']}
+        fx = SyntheticFX(fx_prices, pd.Timestamp('20150210'))
+        fx.ohlcv
+        fx_prices['XXUSD Curncy'] = full_contracts['XXH5 Index']
+        fx = fx.advance_to(pd.Timestamp('20150227'))
+        assert_frame_equal(fx.ohlcv, SyntheticFX(fx_prices, pd.Timestamp('20150227')).ohlcv, check_freq=False)
+        self.assertEqual(fx.ohlcv.index[-1], pd.Timestamp('20150227'))
+
+    def test_advance_to_rebuild(self):
+        SyntheticInstrument.prices['XX Index'] = self.future._contracts['XXH5 Index']
+        instrument = SyntheticInstrument('XX Index', pd.Timestamp('20150210'))
+        instrument.ohlcv
+        advanced = instrument.advance_to(pd.Timestamp('20150227'))
+        self.assertEqual(advanced.materialized_artefacts(), [])
+        assert_frame_equal(advanced.ohlcv, SyntheticInstrument.prices['XX Index'][:'20150227'])
+        self.assertEqual(instrument.ohlcv.index[-1], pd.Timestamp('20150210'))
+        self.assertEqual(advanced.b_day_list[-1], pd.Timestamp('20150227'))
+
+    def test_materialize(self):
+        future = SyntheticChainFuture(self.future._contracts, pd.Timestamp('20150610'), self.adj_info)
+        future._read_multiple_files = False
+        future.fx = SyntheticFX({'XXUSD Curncy': self.future._contracts['XXH5 Index'],
+                                 'XXUSDCR Curncy': self.future._contracts['XXH5 Index']}, pd.Timestamp('20150610'))
+        future.materialize()
+        self.assertEqual(sorted(future.materialized_artefacts()),
+                         sorted(set(future.artefacts()) - {'_adj', '_back_ohlcv_df'}))
+        self.assertIn('_cr_ohlcv', future.fx.materialized_artefacts())
+
+        # an error computing the data is not mistaken for data the instrument does not have
+        class BrokenInstrument(SyntheticInstrument):
+            @lazy_artefact
+            def _cr_ohlcv(self):
+                return self._raw_cr_ohlcv
+
+        with self.assertRaises(AttributeError):
+            BrokenInstrument('XX Index', pd.Timestamp('20150210')).materialize()
+
 if __name__ == '__main__':
     unittest.main(warnings='ignore')
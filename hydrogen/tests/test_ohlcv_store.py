@@ -0,0 +1,64 @@
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+from hydrogen.market_data import ohlcv_store
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class OHLCVStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        self.csv_path = tempfile.mkdtemp()
+        self.store_path = tempfile.mkdtemp()
+
+        dates = pd.bdate_range('20150101', '20150301')
+        self.ticker = 'ESH15 Index'
+        self.ohlcv_df = pd.DataFrame({'PX_OPEN': np.linspace(100, 110, len(dates)),
+                                      'PX_HIGH': np.linspace(101, 111, len(dates)),
+                                      'PX_LOW': np.linspace(99, 109, len(dates)),
+                                      'PX_LAST': np.linspace(100.5, 110.5, len(dates)),
+                                      'PX_VOLUME': np.arange(len(dates), dtype=float)},
+                                     index=pd.Index(dates.values, name='DATE'),
+                                     columns=['PX_OPEN', 'PX_HIGH', 'PX_LOW', 'PX_LAST', 'PX_VOLUME'])
+        self.ohlcv_df.iloc[3, 4] = np.nan
+        self.ohlcv_df.to_csv(os.path.join(self.csv_path, self.ticker + '.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.csv_path)
+        shutil.rmtree(self.store_path)
+
+    def test_read_csv_fallback(self):
+        df = ohlcv_store.read_ohlcv(self.ticker, self.store_path, self.csv_path)
+        assert_frame_equal(df, self.ohlcv_df, check_names=False)
+
+    def test_convert_csv_tree(self):
+        tickers = ohlcv_store.convert_csv_tree(self.csv_path, self.store_path)
+        self.assertEqual(tickers, [self.ticker])
+        self.assertTrue(os.path.exists(ohlcv_store.store_filename(self.ticker, self.store_path)))
+
+        df = ohlcv_store.read_ohlcv(self.ticker, self.store_path, self.csv_path)
+        assert_frame_equal(df, self.ohlcv_df, check_names=False)
+        self.assertEqual(df.index.name, 'DATE')
+        self.assertEqual(list(df.columns), list(self.ohlcv_df.columns))
+
+    def test_missing_ticker(self):
+        df = ohlcv_store.read_ohlcv('ESM15 Index', self.store_path, self.csv_path)
+        self.assertTrue(df.empty)
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
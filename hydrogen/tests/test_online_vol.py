@@ -0,0 +1,68 @@
+import unittest
+import logging
+import json
+import numpy as np
+import pandas as pd
+import hydrogen.analytics
+from hydrogen.online_vol import OnlineVol
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class OnlineVolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        n_day = 500
+        close = 100 * np.exp(np.cumsum(random_state.randn(n_day) * 0.01))
+        open_ = close * np.exp(random_state.randn(n_day) * 0.003)
+        self.ohlcv = pd.DataFrame({'OPEN': open_,
+                                   'HIGH': np.maximum(open_, close) * 1.004,
+                                   'LOW': np.minimum(open_, close) * 0.996,
+                                   'CLOSE': close},
+                                  index=pd.bdate_range('20150101', periods=n_day))
+        self.ohlcv.iloc[[50, 300], 0] = np.nan
+
+    def tearDown(self):
+        pass
+
+    def test_match_batch(self):
+        for kwargs in [dict(window=66), dict(ewm=True, span=36)]:
+            for method in ['SD', 'ATR', 'RS', 'YZ']:
+                expected = hydrogen.analytics.vol(self.ohlcv, annualised=True, method=method, **kwargs)
+                res = OnlineVol(method, annualised=True, **kwargs).update_df(self.ohlcv)
+                np.testing.assert_allclose(res.values, expected.values, rtol=1e-10)
+
+    def test_zero_bar(self):
+        ohlcv = self.ohlcv.copy()
+        # infinite log returns and log prices
+        ohlcv.iloc[200, :] = 0.0
+        for kwargs in [dict(window=66), dict(ewm=True, span=36)]:
+            for method in ['SD', 'ATR', 'RS', 'YZ']:
+                expected = hydrogen.analytics.vol(ohlcv, annualised=True, method=method, **kwargs)
+                res = OnlineVol(method, annualised=True, **kwargs).update_df(ohlcv)
+                self.assertTrue(np.isfinite(res.values[-100:]).all())
+                np.testing.assert_allclose(res.values, expected.values, rtol=1e-10)
+
+    def test_restore_state(self):
+        online_vol = OnlineVol('YZ', window=66)
+        online_vol.update_df(self.ohlcv.iloc[:400])
+
+        state = json.loads(json.dumps(online_vol.state_dict()))
+        self.assertEqual(state['last_date'], self.ohlcv.index[399].isoformat())
+
+        res = OnlineVol.from_state(state).update_df(self.ohlcv.iloc[400:])
+        expected = hydrogen.analytics.vol(self.ohlcv, annualised=False, method='YZ', window=66)
+        np.testing.assert_allclose(res.values, expected.iloc[400:].values, rtol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,88 @@
+import unittest
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from hydrogen.panel import Panel, LazyPanel
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class PanelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        index = pd.DatetimeIndex(pd.bdate_range('20150101', periods=100).values, name='DATE')
+        self.frames = OrderedDict([
+            ('A', pd.DataFrame(random_state.randn(100, 2), index=index, columns=['R1', 'R2'])),
+            ('B', pd.DataFrame(random_state.randn(60, 2), index=index[40:], columns=['R1', 'R2'])),
+            ('C', pd.DataFrame(random_state.randn(50, 2), index=index[::2], columns=['R1', 'R2'])),
+        ])
+        self.frames['B'].iloc[10, 0] = np.nan
+        self.panel = Panel.from_frames(self.frames)
+
+    def tearDown(self):
+        pass
+
+    def test_views(self):
+        self.assertEqual(self.panel.values.shape, (100, 3, 2))
+        for ticker, frame in self.frames.items():
+            pd.util.testing.assert_frame_equal(self.panel.frame(ticker), frame)
+
+        res = self.panel.select(['C', 'A'], ['R2']).to_dict()
+        self.assertEqual(sorted(res), ['A', 'C'])
+        pd.util.testing.assert_frame_equal(res['C'], self.frames['C'][['R2']])
+
+    def test_shift_diff(self):
+        shifted = self.panel.shift(2)
+        diff = self.panel.diff()
+        for ticker, frame in self.frames.items():
+            pd.util.testing.assert_frame_equal(shifted.frame(ticker), frame.shift(2))
+            pd.util.testing.assert_frame_equal(diff.frame(ticker), frame.diff())
+
+        pd.util.testing.assert_series_equal(diff.mean().loc['C'], self.frames['C'].diff().mean(), check_names=False)
+
+    def test_field_dates(self):
+        series_maps = OrderedDict((ticker, OrderedDict([('R1', frame.R1), ('R2', frame.R2.iloc[::3])]))
+                                  for ticker, frame in self.frames.items())
+        panel = Panel.from_series(series_maps)
+        diff = panel.diff()
+        for ticker, series_map in series_maps.items():
+            self.assertEqual(len(panel.frame(ticker)), len(series_map['R1']))
+            for field, series in series_map.items():
+                pd.util.testing.assert_series_equal(diff.frame(ticker, [field])[field], series.diff())
+
+        # the dates of a field do not depend on the other fields of the panel
+        pd.util.testing.assert_frame_equal(panel.select(['A'], ['R2']).diff().frame('A'),
+                                           Panel.from_series(OrderedDict([('A', series_maps['A'])]), fields=['R2'])
+                                           .diff().frame('A'))
+
+    def test_lazy_panel(self):
+        requests = []
+
+        def calc_panel(tickers, fields):
+            requests.append((tickers, fields))
+            return self.panel.select(tickers, fields)
+
+        lazy_panel = LazyPanel(self.frames, ['R1', 'R2'], calc_panel)
+        pd.util.testing.assert_frame_equal(lazy_panel.select(['C'], ['R2']).frame('C'), self.frames['C'][['R2']])
+        lazy_panel.select(['B', 'C'], ['R2'])
+        lazy_panel.select(['A', 'C'])
+        self.assertEqual(requests, [(['C'], ['R2']), (['B'], ['R2']), (['A'], ['R1', 'R2']), (['C'], ['R1'])])
+
+        res = lazy_panel.select()
+        self.assertEqual(len(requests), 5)
+        for ticker, frame in self.frames.items():
+            pd.util.testing.assert_frame_equal(res.frame(ticker), frame)
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,161 @@
+import unittest
+import logging
+import time
+from collections import OrderedDict
+from unittest import mock
+import numpy as np
+import pandas as pd
+import hydrogen.portfolio
+from hydrogen.portfolio import Portfolio
+from hydrogen.trading_rules import EWMAC, carry
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class SyntheticInstrument:
+    def __init__(self, ticker, price):
+        self._ticker = ticker
+        self._as_of_date = price.index[-1]
+        self.ohlcv = pd.DataFrame({'CLOSE': price})
+        self.cost = 0.01
+        self.cont_size = 50.0
+
+    def vol_price(self, to_usd=False):
+        return self.ohlcv.CLOSE.diff().abs().rolling(window=20, min_periods=1).mean()
+
+    def calc_annual_yield(self):
+        return self.ohlcv.CLOSE.pct_change()
+
+
+class CalendarYieldInstrument(SyntheticInstrument):
+    ''' Instrument whose annual yield is on more dates than its price, as the carry of a future '''
+    def calc_annual_yield(self):
+        return self.ohlcv.CLOSE.resample('D').ffill().pct_change()
+
+
+class PortfolioTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        index = pd.DatetimeIndex(pd.bdate_range('20150101', periods=300).values, name='DATE')
+        self.portfolio = Portfolio('Test Portfolio', cache_size=3)
+        self.portfolio.rules = [('EWMAC_4_16', EWMAC, {"fast_span": 4, "slow_span": 16}),
+                                ('carry', carry, {"span": 32})]
+        self.portfolio.ticker_instrument_map = OrderedDict(
+            (ticker, SyntheticInstrument(ticker, pd.Series(100 + np.cumsum(random_state.randn(300)), index=index)))
+            for ticker in ['A', 'B'])
+
+    def tearDown(self):
+        pass
+
+    def test_set_instruments(self):
+        price = self.portfolio.ticker_instrument_map['A'].ohlcv.CLOSE
+        tickers = ['D', 'C', 'B', 'A']
+
+        def create_instrument(ticker, as_of_date):
+            if ticker == 'C':
+                raise IOError('No data for {}'.format(ticker))
+            # the first tickers finish last
+            time.sleep(0.01 * (len(tickers) - tickers.index(ticker)))
+            return SyntheticInstrument(ticker, price[:as_of_date])
+
+        with mock.patch.object(hydrogen.portfolio, '_create_instrument', create_instrument):
+            self.portfolio.set_instruments(tickers, price.index[-10], executor='thread', max_workers=4)
+
+        self.assertEqual(list(self.portfolio.ticker_instrument_map), ['D', 'B', 'A'])
+        self.assertEqual([inst._ticker for inst in self.portfolio.ticker_instrument_map.values()], ['D', 'B', 'A'])
+        self.assertEqual(list(self.portfolio.instrument_errors), ['C'])
+        self.assertIsInstance(self.portfolio.instrument_errors['C'], IOError)
+        self.assertRaises(ValueError, self.portfolio.set_instruments, tickers, price.index[-1], executor='fork')
+
+    def test_result_cache(self):
+        portfolio = self.portfolio
+        forecast = portfolio.forecast()
+        self.assertEqual(portfolio.cache_info(), (0, 1, 3, 1))
+
+        # a slice of a cached result is a hit
+        pd.util.testing.assert_frame_equal(portfolio.forecast('B', 'carry')['B'], forecast['B'][['carry']])
+        self.assertEqual(portfolio.cache_info().hits, 1)
+
+        # other parameters are cached separately
+        clipped_forecast = portfolio.forecast(clip=True)
+        self.assertEqual(portfolio.cache_info().misses, 2)
+        self.assertLessEqual(clipped_forecast['A'].abs().max().max(), 20)
+
+        # changing the rules or the instruments is a miss
+        portfolio.rules = portfolio.rules[:1]
+        self.assertEqual(list(portfolio.forecast()['A']), ['EWMAC_4_16'])
+        price = portfolio.ticker_instrument_map['A'].ohlcv.CLOSE
+        portfolio.ticker_instrument_map['B'] = SyntheticInstrument('B', price)
+        pd.util.testing.assert_frame_equal(portfolio.forecast()['B'], portfolio.forecast()['A'])
+        self.assertEqual(portfolio.cache_info(), (2, 4, 3, 3))
+
+        # the least recently used result is evicted
+        portfolio.position()
+        self.assertEqual(portfolio.cache_info().currsize, 3)
+        self.assertEqual(portfolio.invalidate_cache('position'), 1)
+        self.assertEqual(portfolio.invalidate_cache(), 2)
+        portfolio.forecast(clip=True)
+        self.assertEqual(portfolio.cache_info(), (3, 6, 3, 1))
+
+    def test_lazy_results(self):
+        portfolio = self.portfolio
+        position = portfolio.position('B', 'carry', buffered_position=True)
+        forecast = portfolio._result_cache[next(iter(portfolio._result_cache))][1]
+        self.assertEqual(forecast.computed.tolist(), [[False, False], [False, True]])
+
+        pd.util.testing.assert_frame_equal(portfolio.position(buffered_position=True)['B'][['carry']],
+                                           position['B'])
+        self.assertTrue(forecast.computed.all())
+
+    def test_pnl(self):
+        portfolio = self.portfolio
+        res = portfolio.pnl(delay=[0, 2])
+        position = portfolio.position()
+
+        for ticker, inst in portfolio.ticker_instrument_map.items():
+            pnl_one_contract = inst.ohlcv.CLOSE.diff() * inst.cont_size
+            cost = position[ticker].diff().abs() * inst.cost
+            for delay in [0, 2]:
+                gross_pnl = position[ticker].shift(delay).mul(pnl_one_contract, axis=0)
+                pd.util.testing.assert_frame_equal(res[delay][0][ticker], gross_pnl)
+                pd.util.testing.assert_frame_equal(res[delay][1][ticker], cost)
+                pd.util.testing.assert_frame_equal(res[delay][2][ticker], gross_pnl - cost)
+
+        gross_pnl, cost, net_pnl = portfolio.pnl('A', delay=2)
+        pd.util.testing.assert_frame_equal(net_pnl['A'], res[2][2]['A'])
+
+    def test_rule_dates(self):
+        for ticker, inst in self.portfolio.ticker_instrument_map.items():
+            self.portfolio.ticker_instrument_map[ticker] = CalendarYieldInstrument(ticker, inst.ohlcv.CLOSE)
+        all_at_once = Portfolio('All At Once')
+        all_at_once.rules = self.portfolio.rules
+        all_at_once.ticker_instrument_map = self.portfolio.ticker_instrument_map
+
+        # carry first, then every rule
+        self.portfolio.pnl('A', 'carry')
+        self.portfolio.position_turnover(['A', 'B'], 'carry')
+        for method in ['forecast', 'position_turnover', 'pnl']:
+            res = getattr(self.portfolio, method)()
+            expected = getattr(all_at_once, method)()
+            for res_dict, expected_dict in zip(*[[x] if method != 'pnl' else x for x in (res, expected)]):
+                for ticker in expected_dict:
+                    pd.util.testing.assert_frame_equal(res_dict[ticker], expected_dict[ticker])
+
+        # the turnover of EWMAC is on the dates of the price, whatever the dates of carry
+        turnover = all_at_once.position_turnover('A', 'EWMAC_4_16')['A']
+        price = all_at_once.ticker_instrument_map['A'].ohlcv.CLOSE
+        position = all_at_once.position('A')['A'].EWMAC_4_16.reindex(price.index)
+        pd.util.testing.assert_series_equal(turnover.EWMAC_4_16, position.diff().abs())
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
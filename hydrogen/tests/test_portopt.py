@@ -0,0 +1,131 @@
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+from hydrogen.portopt import generate_fitting_period, markotwitz_port_opt, moments_port_opt, MomentAccumulator, \
+    batch_moments, max_sharpe_weights, mean_var_port_opt, port_SR, bootstrap_port_opt, _nan_cov, _nan_corr, \
+    max_sharpe_port_opt, port_opt
+from hydrogen.portfoliooptimiser import Optimiser
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class PortOptTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.return_df = pd.DataFrame(random_state.randn(300, 3) * [0.01, 0.02, 0.01] + 0.001,
+                                      index=pd.bdate_range('20150101', periods=300), columns=['A', 'B', 'C'])
+        self.return_df.iloc[:40, 1] = np.nan
+        self.return_df.iloc[100:110, 2] = np.nan
+
+    def tearDown(self):
+        pass
+
+    def test_generate_fitting_period(self):
+        self.assertEqual(list(generate_fitting_period(self.return_df, 'in_sample')), [(0, 300)])
+        self.assertEqual(list(generate_fitting_period(self.return_df, 'rolling', 256, 22)), [(0, 256), (22, 278),
+                                                                                             (44, 300)])
+        self.assertEqual(list(generate_fitting_period(self.return_df, 'expanding', 256, 22)), [(0, 256), (0, 278),
+                                                                                               (0, 300)])
+
+    def test_nan_moments(self):
+        np.testing.assert_allclose(_nan_cov(self.return_df.values), self.return_df.cov().values)
+        np.testing.assert_allclose(_nan_corr(self.return_df.values), self.return_df.corr().values)
+
+        weights = markotwitz_port_opt(self.return_df.values)
+        self.assertAlmostEqual(weights.sum(), 1.0, places=6)
+
+    def test_moment_accumulator(self):
+        returns = self.return_df.values
+        accumulator = MomentAccumulator(3)
+        for start, end in generate_fitting_period(self.return_df, 'rolling', 100, 30):
+            accumulator.update_window(returns, start, end)
+            window_df = self.return_df.iloc[start:end]
+            np.testing.assert_allclose(accumulator.mean(), window_df.mean().values)
+            np.testing.assert_allclose(accumulator.cov(), window_df.cov().values)
+            np.testing.assert_allclose(accumulator.corr(), window_df.corr().values)
+
+        # the standardisation is done on the moments
+        standardised_returns = self.return_df / self.return_df.std() * (0.2 / 16)
+        np.testing.assert_allclose(moments_port_opt(MomentAccumulator.from_returns(returns), use_standardise_vol=True),
+                                   markotwitz_port_opt(standardised_returns.values), atol=1e-6)
+
+    def test_batch_bootstrap(self):
+        returns = self.return_df.values
+        indices = np.random.RandomState(1).choice(len(returns), (50, 100))
+        means, sigma_mats = batch_moments(returns[indices])
+        np.testing.assert_allclose(means[7], self.return_df.iloc[indices[7]].mean().values)
+        np.testing.assert_allclose(sigma_mats[7], self.return_df.iloc[indices[7]].cov().values)
+
+        weights = max_sharpe_weights(means, sigma_mats)
+        np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+        self.assertTrue((weights >= 0).all())
+        for i in range(len(weights)):
+            slsqp_weights, _ = mean_var_port_opt(means[i], sigma_mats[i], method='SLSQP')
+            self.assertGreaterEqual(port_SR(weights[i], means[i], sigma_mats[i]),
+                                    port_SR(slsqp_weights, means[i], sigma_mats[i]) - 1e-12)
+
+    def test_max_sharpe_port_opt(self):
+        returns = self.return_df.values
+        means, sigma_mat = np.nanmean(returns, axis=0), _nan_cov(returns)
+        weights, solution = mean_var_port_opt(means, sigma_mat)
+        slsqp_weights, _ = mean_var_port_opt(means, sigma_mat, method='SLSQP')
+        self.assertTrue(solution.success)
+        np.testing.assert_allclose(weights.sum(), 1.0)
+        self.assertGreaterEqual(port_SR(weights, means, sigma_mat), port_SR(slsqp_weights, means, sigma_mat) - 1e-12)
+        np.testing.assert_allclose(weights, slsqp_weights, atol=1e-3)
+
+        # starting from the solution, no iteration is needed
+        warm_weights, n_iter = max_sharpe_port_opt(means, sigma_mat, weights)
+        np.testing.assert_allclose(warm_weights, weights)
+        self.assertEqual(n_iter, 0)
+
+        # from stale weights holding every asset, only the assets blocking the move to the solution are dropped
+        stale_weights, _ = max_sharpe_port_opt(means * [1.0, 1.0, -1.0], sigma_mat, np.ones(3) / 3)
+        np.testing.assert_allclose(stale_weights, max_sharpe_port_opt(means * [1.0, 1.0, -1.0], sigma_mat)[0])
+
+        # no asset of positive mean, left to SLSQP
+        self.assertIsNone(max_sharpe_port_opt(-np.abs(means), sigma_mat))
+        self.assertRaises(ValueError, mean_var_port_opt, means, sigma_mat, method='newton')
+
+    def test_bootstrap_seed(self):
+        returns = self.return_df.values
+        weights = bootstrap_port_opt(returns, n_bootstrap_run=100, n_samples_per_run=64, seed=1, n_runs_per_block=16)
+        np.testing.assert_array_equal(weights, bootstrap_port_opt(returns, n_bootstrap_run=100, n_samples_per_run=64,
+                                                                  seed=1, n_runs_per_block=16, executor='process',
+                                                                  max_workers=2))
+        self.assertFalse((weights == bootstrap_port_opt(returns, n_bootstrap_run=100, n_samples_per_run=64, seed=2,
+                                                        n_runs_per_block=16)).all())
+
+    def test_optimiser_executor(self):
+        kwargs = dict(n_roll_days=100, step=100, seed=1, n_bootstrap_run=32, n_samples_per_run=64)
+        weights = Optimiser(None).port_opt(self.return_df, 'bootstrap', 'rolling', **kwargs)
+        self.assertEqual(len(weights), 3)
+        pd.util.testing.assert_frame_equal(weights, Optimiser(None).port_opt(self.return_df, 'bootstrap', 'rolling',
+                                                                             executor='process', max_workers=2,
+                                                                             **kwargs))
+        pd.util.testing.assert_frame_equal(weights, port_opt(self.return_df, 'bootstrap', 'rolling', **kwargs))
+        self.assertRaises(ValueError, Optimiser(None).port_opt, self.return_df, 'bootstrap', 'rolling',
+                          executor='thread')
+
+        # the optimiser fits with its own methods
+        optimiser = Optimiser(None)
+        pd.util.testing.assert_frame_equal(optimiser.port_opt(self.return_df, 'one_period', 'expanding', 100, 100),
+                                           port_opt(self.return_df, 'one_period', 'expanding', 100, 100))
+        self.assertTrue(optimiser.solution.success)
+        pd.util.testing.assert_frame_equal(port_opt(self.return_df, 'bootstrap', 'expanding', executor='process',
+                                                    max_workers=2, **kwargs),
+                                           port_opt(self.return_df, 'bootstrap', 'expanding', **kwargs))
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,66 @@
+import unittest
+import logging
+import os
+import tempfile
+import pandas as pd
+from numpy.testing import assert_array_equal
+from hydrogen.market_data import static_store
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class StaticStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        static_store.clear_cache()
+        fd, self.filename = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        pd.DataFrame({'TICKER': ['Z M05 Index', 'ESH05 Index', 'Z H05 Index', 'CLH15 Comdty', 'ESM05 Index'],
+                      'ROLL_DT': ['2005-06-17', '2005-03-18', '2005-03-18', '2015-02-19', '2005-06-17'],
+                      'FUT_CONT_SIZE': [10, 50, 10, 1000, 50]}).to_csv(self.filename, index=False)
+
+    def tearDown(self):
+        static_store.clear_cache()
+        os.remove(self.filename)
+
+    def test_generic_ticker(self):
+        self.assertEqual(static_store.generic_ticker('Z H05 Index'), 'Z 1 Index')
+        self.assertEqual(static_store.generic_ticker('CLH15 Comdty'), 'CL1 Comdty')
+
+    def test_lookup(self):
+        static_data = static_store.get_static_data(self.filename)
+
+        read_multiple_files, static_df = static_data.lookup('Z 1 Index')
+        self.assertTrue(read_multiple_files)
+        assert_array_equal(static_df.TICKER.values, ['Z H05 Index', 'Z M05 Index'])
+
+        read_multiple_files, static_df = static_data.lookup('CLH15 Comdty')
+        self.assertFalse(read_multiple_files)
+        assert_array_equal(static_df.FUT_CONT_SIZE.values, [1000])
+
+        assert_array_equal(static_data.roll_dates('ES1 Index'),
+                           [pd.datetime(2005, 3, 18).date(), pd.datetime(2005, 6, 17).date()])
+
+        self.assertTrue(static_data.lookup('VG1 Index')[1].empty)
+
+    def test_parsed_once(self):
+        static_data = static_store.get_static_data(self.filename)
+        self.assertIs(static_store.get_static_data(self.filename), static_data)
+
+        # a modified file is parsed again
+        mtime = os.path.getmtime(self.filename)
+        os.utime(self.filename, (mtime + 10, mtime + 10))
+        self.assertIsNot(static_store.get_static_data(self.filename), static_data)
+        self.assertEqual(len(static_store._cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,57 @@
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+import hydrogen.system as system
+from hydrogen.sweep import sweep
+from hydrogen.trading_rules import signal_scalar
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class SweepTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        index = pd.bdate_range('20100101', periods=1000)
+        price = pd.DataFrame(100 + np.cumsum(random_state.randn(1000, 3), axis=0), index=index,
+                             columns=['A', 'B', 'C'])
+        price.iloc[:200, 1] = np.nan
+        self.panels = {'price': price,
+                       'vol': price.diff().abs().ewm(span=36).mean(),
+                       'annual_yield': price.pct_change().rolling(window=20).mean()}
+        self.grids = {'EWMAC': [(2, 8), (8, 32), (32, 128)], 'breakout': [20, (40, 5)], 'carry': [32]}
+
+    def tearDown(self):
+        pass
+
+    def test_sharpe_ratio(self):
+        res = sweep(self.panels, self.grids)
+
+        price = self.panels['price'].B.dropna()
+        vol = self.panels['vol'].B.reindex(price.index)
+        scaled_forecast = signal_scalar((price.ewm(span=8).mean() - price.ewm(span=32).mean()) / vol)
+        returns = (scaled_forecast / vol).shift(1) * price.diff()
+        self.assertAlmostEqual(res.sharpe_ratio['EWMAC'].loc['B', '(8, 32)'],
+                               returns.mean() / returns.std() * system.root_n_bday_in_year)
+
+    def test_chunks(self):
+        res = sweep(self.panels, self.grids, keep_forecasts=True)
+        chunked_res = sweep(self.panels, self.grids, chunk_size=1, keep_forecasts=True)
+
+        for family in self.grids:
+            pd.util.testing.assert_frame_equal(res.sharpe_ratio[family], chunked_res.sharpe_ratio[family])
+            np.testing.assert_array_equal(res.scaled_forecast[family], chunked_res.scaled_forecast[family])
+            self.assertEqual(res.forecast[family].shape, (1000, 3, len(self.grids[family])))
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
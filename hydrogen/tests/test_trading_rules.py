@@ -0,0 +1,124 @@
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+from hydrogen.trading_rules import ewmac_bank, breakout_bank, EWMAC, carry, ForecastGraph, rule_node, buffer_positions
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class PriceOnlyInstrument:
+    def __init__(self, price, vol):
+        self.ohlcv = pd.DataFrame({'CLOSE': price})
+        self._vol = vol
+
+    def vol_price(self):
+        return self._vol
+
+    def calc_annual_yield(self):
+        return self.ohlcv.CLOSE.pct_change()
+
+
+class TradingRulesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        index = pd.bdate_range('20150101', periods=500)
+        self.price = pd.DataFrame(100 + np.cumsum(random_state.randn(500, 3), axis=0), index=index,
+                                  columns=['A', 'B', 'C'])
+        self.price.iloc[:120, 1] = np.nan
+        self.price = self.price.drop(self.price.index[200:210:3])
+        self.price.iloc[300:305, 2] = np.nan
+        self.vol = self.price.diff().abs().rolling(window=20, min_periods=1).mean()
+        self.span_pairs = [(2, 8), (4, 16), (8, 32)]
+
+    def tearDown(self):
+        pass
+
+    def test_ewmac_bank(self):
+        price = self.price.A
+        res = ewmac_bank(price, self.vol.A, self.span_pairs)
+        self.assertEqual(list(res.columns), ['EWMAC_2_8', 'EWMAC_4_16', 'EWMAC_8_32'])
+
+        for fast_span, slow_span in self.span_pairs:
+            expected = (price.ewm(span=fast_span).mean() - price.ewm(span=slow_span).mean()) / self.vol.A
+            np.testing.assert_allclose(res['EWMAC_{}_{}'.format(fast_span, slow_span)].values, expected.values)
+
+    def test_ewmac_bank_panel(self):
+        res = ewmac_bank(self.price, self.vol, self.span_pairs)
+
+        for ticker in self.price.columns:
+            price = self.price[ticker].dropna()
+            expected = ewmac_bank(price, self.vol[ticker], self.span_pairs)
+            np.testing.assert_allclose(res.xs(ticker, axis=1, level=1).reindex(price.index).values, expected.values)
+            self.assertTrue(res.xs(ticker, axis=1, level=1)[self.price[ticker].isnull()].isnull().all().all())
+
+    def test_breakout_bank(self):
+        windows = [10, 20, 40]
+        res = breakout_bank(self.price, windows)
+
+        for ticker in self.price.columns:
+            price = self.price[ticker].dropna()
+            for window in windows:
+                span = window // 4
+                roll_max = price.rolling(window=window).max()
+                roll_min = price.rolling(window=window).min()
+                forecast = 40.0 * (price - 0.5 * (roll_max + roll_min)) / (roll_max - roll_min)
+                expected = forecast.ewm(span=span, min_periods=np.ceil(span / 2.0)).mean()
+                np.testing.assert_allclose(res['breakout_{}'.format(window)][ticker].reindex(price.index).values,
+                                           expected.values)
+
+    def test_forecast_graph(self):
+        rules = [('EWMAC_2_8', EWMAC, {"fast_span": 2, "slow_span": 8}),
+                 ('EWMAC_8_32', EWMAC, {"fast_span": 8, "slow_span": 32}),
+                 ('carry', carry, {"span": 32})]
+        forecast_graph = ForecastGraph([(rulename, rule_node(rulename, rule, **kargs))
+                                        for rulename, rule, kargs in rules])
+
+        # ewma(8) is shared by both EWMAC rules
+        self.assertEqual([node.name for node in forecast_graph.nodes],
+                         ['price', 'ewma(2)', 'ewma(8)', 'vol_price', 'EWMAC(2,8)', 'ewma(32)', 'EWMAC(8,32)',
+                          'annual_yield', 'carry(32)'])
+
+        inst = PriceOnlyInstrument(self.price.A, self.vol.A)
+        res = forecast_graph.run(inst)
+        self.assertEqual(list(res), ['EWMAC_2_8', 'EWMAC_8_32', 'carry'])
+
+        expected = ewmac_bank(self.price.A, self.vol.A, [(2, 8), (8, 32)])
+        np.testing.assert_allclose(res['EWMAC_8_32'].values, expected.EWMAC_8_32.values)
+        np.testing.assert_allclose(res['carry'].values, inst.calc_annual_yield().ewm(span=32).mean().values)
+        self.assertEqual(set(forecast_graph.timing().index), set(node.name for node in forecast_graph.nodes))
+
+
+    def test_buffer_positions(self):
+        random_state = np.random.RandomState(1)
+        opt_pos = np.cumsum(random_state.randn(200, 3, 2), axis=0)
+        opt_pos[:50, 1] = np.nan
+        opt_pos[120, 0, 1] = np.nan
+
+        for trade_to_edge, round_position in [(False, False), (True, False), (True, True)]:
+            res = buffer_positions(opt_pos, trade_to_edge, round_position)
+            for i in range(opt_pos.shape[1]):
+                for j in range(opt_pos.shape[2]):
+                    position = 0.0
+                    for k, x in enumerate(opt_pos[:, i, j]):
+                        lower, upper = x - abs(x) * 0.1, x + abs(x) * 0.1
+                        if round_position:
+                            x, lower, upper = np.round(x), np.round(lower), np.round(upper)
+                        if position > upper:
+                            position = upper if trade_to_edge else x
+                        elif position < lower:
+                            position = lower if trade_to_edge else x
+                        self.assertTrue(np.isnan(res[k, i, j]) if np.isnan(x) else res[k, i, j] == position)
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
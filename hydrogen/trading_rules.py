@@ -1,4 +1,5 @@
-from collections import OrderedDict
+import time
+from collections import Counter, OrderedDict, namedtuple
 import numpy as np
 import pandas as pd
 import hydrogen.system as system
@@ -27,11 +28,90 @@ def EWMAC(rulename: str, inst: Instrument, fast_span, slow_span):#w_span_pair=[(
     :rtype pd.Series
     """
 
-    signal = (inst.ohlcv.CLOSE.ewm(span=fast_span).mean() - inst.ohlcv.CLOSE.ewm(span=slow_span).mean()) / (
-    inst.vol_price())
-    #signal = signal.rename('S_EWMAC_{fast}_{slow}'.format(fast_span, slow_span))
-    signal = signal.rename(rulename)
-    return signal
+    return ewmac_bank(inst.ohlcv.CLOSE, inst.vol_price(), [(fast_span, slow_span)], [rulename])[rulename]
+
+
+def ewmac_bank(price, vol, span_pairs, rulenames=None):
+    ''' EWMAC forecasts of many (fast, slow) span pairs, computing the EWMA of each distinct span only once
+
+    Args:
+        price: Price level time series of one instrument, or a data frame of dates by instruments
+        vol: Vol of the price level, of the same shape as price
+        span_pairs: List of (fast_span, slow_span)
+        rulenames: Names of the forecasts, default to EWMAC_{fast}_{slow}
+
+    Returns:
+        A data frame of dates by rules for a price time series. For a data frame of prices, a data frame of dates by
+        (rule, instrument), where each instrument is computed on its own dates, i.e., the ones with a price.
+    '''
+    if rulenames is None:
+        rulenames = ['EWMAC_{}_{}'.format(fast_span, slow_span) for fast_span, slow_span in span_pairs]
+
+    price_values, own_dates = _bank_price_values(price)
+    vol_values = _bank_values(price, vol, own_dates)
+    forecasts = ewmac_arrays(price_values, vol_values, span_pairs)
+    return _bank_frame(price, _bank_scatter(forecasts, own_dates), rulenames)
+
+
+def ewmac_arrays(price, vol, span_pairs):
+    ''' EWMAC forecasts of arrays of dates by instruments
+
+    Returns:
+        An array of dates by instruments by span pairs
+    '''
+    ewma = {span: hydrogen.analytics.ewm_mean(price, span=span)
+            for span in sorted(set(span for span_pair in span_pairs for span in span_pair))}
+
+    forecasts = np.empty(price.shape + (len(span_pairs),))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i, (fast_span, slow_span) in enumerate(span_pairs):
+            forecasts[..., i] = (ewma[fast_span] - ewma[slow_span]) / vol
+
+    return forecasts
+
+
+def _bank_price_values(price):
+    ''' Return the prices as a 2D array of dates by instruments and, for a panel, the own dates order of
+        hydrogen.analytics.own_dates_order after which the dates of each instrument are at the top of its column
+    '''
+    if not isinstance(price, pd.DataFrame):
+        return price.values.astype(np.float64).reshape(-1, 1), None
+
+    price_values = price.values.astype(np.float64)
+    has_price = ~np.isnan(price_values)
+    row_order, col_index = hydrogen.analytics.own_dates_order(has_price)
+    return price_values[row_order, col_index], (has_price, row_order, col_index)
+
+
+def _bank_values(price, data, own_dates):
+    ''' Return data, e.g., the vol, aligned to price as a 2D array in the same order as _bank_price_values '''
+    if not isinstance(price, pd.DataFrame):
+        return data.reindex(price.index).values.astype(np.float64).reshape(-1, 1)
+
+    data_values = data.reindex(index=price.index, columns=price.columns).values.astype(np.float64)
+    has_price, row_order, col_index = own_dates
+    return data_values[row_order, col_index]
+
+
+def _bank_scatter(forecasts, own_dates):
+    ''' Move forecasts of dates by instruments by rules computed on the own dates back to the original dates '''
+    if own_dates is None:
+        return forecasts
+
+    has_price, row_order, col_index = own_dates
+    res = np.empty_like(forecasts)
+    res[row_order, col_index] = forecasts
+    res[~has_price] = np.nan
+    return res
+
+
+def _bank_frame(price, forecasts, rulenames):
+    if not isinstance(price, pd.DataFrame):
+        return pd.DataFrame(forecasts[:, 0, :], index=price.index, columns=rulenames)
+
+    return pd.concat([pd.DataFrame(forecasts[..., i], index=price.index, columns=price.columns)
+                      for i in range(len(rulenames))], axis=1, keys=rulenames)
+
 
 def carry(rulename: str, inst: Instrument, span):
     signal = (inst.calc_annual_yield())
@@ -40,6 +120,18 @@ def carry(rulename: str, inst: Instrument, span):
     return signal
 
 
+def carry_arrays(annual_yield, spans):
+    ''' Carry forecasts of an array of annual yields of dates by instruments
+
+    Returns:
+        An array of dates by instruments by spans
+    '''
+    forecasts = np.empty(annual_yield.shape + (len(spans),))
+    for i, span in enumerate(spans):
+        forecasts[..., i] = hydrogen.analytics.ewm_mean(annual_yield, span=span)
+    return forecasts
+
+
 def breakout(instrument: hydrogen.instrument.Instrument, window: int, span: int = None):
     """
     :param price: the price level time series
@@ -55,23 +147,65 @@ def breakout(instrument: hydrogen.instrument.Instrument, window: int, span: int
     :rtype pd.DataFrame
     """
 
-    assert span < window
+    return breakout_bank(instrument.ohlcv.CLOSE, [window], [span]).iloc[:, 0]
+
+
+def breakout_bank(price, windows, spans=None, rulenames=None):
+    ''' Smoothed breakout forecasts of many windows, sharing the rolling extrema of all windows
+
+    Args:
+        price: Price level time series of one instrument, or a data frame of dates by instruments
+        windows: List of window sizes to look back
+        spans: List of smoothing spans, one per window. A span of None, or spans of None, defaults to a quarter of the
+            window.
+        rulenames: Names of the forecasts, default to breakout_{window}
+
+    Returns:
+        A data frame of dates by rules for a price time series. For a data frame of prices, a data frame of dates by
+        (rule, instrument), where each instrument is computed on its own dates, i.e., the ones with a price.
+    '''
+    if rulenames is None:
+        rulenames = ['breakout_{}'.format(window) for window in windows]
+
+    price_values, own_dates = _bank_price_values(price)
+    forecasts = breakout_arrays(price_values, windows, spans)
+    return _bank_frame(price, _bank_scatter(forecasts, own_dates), rulenames)
+
+
+def breakout_arrays(price, windows, spans=None):
+    ''' Smoothed breakout forecasts of an array of dates by instruments
 
+    Returns:
+        An array of dates by instruments by windows
+    '''
+    if spans is None:
+        spans = [None] * len(windows)
+
+    roll_extrema = hydrogen.analytics.rolling_extrema(price, sorted(set(windows)))
+
+    forecasts = np.empty(price.shape + (len(windows),))
+    for i, (window, span) in enumerate(zip(windows, spans)):
+        roll_max, roll_min = roll_extrema[window]
+        forecasts[..., i] = _breakout_forecast(price, roll_max, roll_min, _breakout_span(window, span))
+
+    return forecasts
+
+
+def _breakout_span(window, span):
     if span is None:
-        span = max(int(window / 4.0, 1))
+        span = max(int(window / 4.0), 1)
 
-    assert (span < window)
+    assert span < window
 
-    min_periods = np.ceil(span / 2.0)
+    return span
 
-    price = instrument.ohlcv.CLOSE
-    roll_max = price.rolling(window=window).max()
-    roll_min = price.rolling(window=window).min()
-    roll_mean = 0.5 * (roll_max + roll_min)
-    forecast = 40.0 * ((price - roll_mean) / (roll_max - roll_min))
-    smooth_forecast = forecast.ewm(span=span, min_periods=min_periods).mean()
 
-    return smooth_forecast
+def _breakout_forecast(price, roll_max, roll_min, span):
+    ''' Smoothed position of the price within its rolling range, scaled to +/- 20 at the range boundaries '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roll_mean = 0.5 * (roll_max + roll_min)
+        forecast = 40.0 * ((price - roll_mean) / (roll_max - roll_min))
+    return hydrogen.analytics.ewm_mean(forecast, span=span, min_periods=np.ceil(span / 2.0))
 
 
 def long_only(instrument: hydrogen.instrument.Instrument):
@@ -117,6 +251,152 @@ def signal_clipper(signal: pd.Series, lower_limit=-20, upper_limit=20):
     return signal.clip(lower=lower_limit, upper=upper_limit)
 
 
+### Forecast graph
+#
+# A rule is declared as a node whose inputs are other nodes, e.g., EWMAC(2, 8) takes ewma(2), ewma(8) and vol_price.
+# Nodes are identified by name, so an intermediate shared by several rules is computed once per instrument.
+
+class RuleNode(namedtuple('RuleNode', ['name', 'func', 'inputs'])):
+    ''' Node of the forecast graph: func(inst, *values of inputs) gives the value of the node '''
+    __slots__ = ()
+
+
+def price_node():
+    return RuleNode('price', lambda inst: inst.ohlcv.CLOSE, ())
+
+
+def vol_price_node():
+    return RuleNode('vol_price', lambda inst: inst.vol_price(), ())
+
+
+def annual_yield_node():
+    return RuleNode('annual_yield', lambda inst: inst.calc_annual_yield(), ())
+
+
+def ewma_node(span):
+    def calc_ewma(inst, price):
+        return pd.Series(hydrogen.analytics.ewm_mean(price.values, span=span), index=price.index)
+
+    return RuleNode('ewma({})'.format(span), calc_ewma, (price_node(),))
+
+
+def rolling_extrema_node(window):
+    def calc_rolling_extrema(inst, price):
+        roll_max, roll_min = hydrogen.analytics.rolling_extrema(price.values, [window])[window]
+        return pd.Series(roll_max, index=price.index), pd.Series(roll_min, index=price.index)
+
+    return RuleNode('rolling_extrema({})'.format(window), calc_rolling_extrema, (price_node(),))
+
+
+def ewmac_node(fast_span, slow_span):
+    return RuleNode('EWMAC({},{})'.format(fast_span, slow_span),
+                    lambda inst, fast_ewma, slow_ewma, vol: (fast_ewma - slow_ewma) / vol,
+                    (ewma_node(fast_span), ewma_node(slow_span), vol_price_node()))
+
+
+def carry_node(span):
+    def calc_carry(inst, annual_yield):
+        return pd.Series(hydrogen.analytics.ewm_mean(annual_yield.values, span=span), index=annual_yield.index)
+
+    return RuleNode('carry({})'.format(span), calc_carry, (annual_yield_node(),))
+
+
+def breakout_node(window, span=None):
+    span = _breakout_span(window, span)
+
+    def calc_breakout(inst, price, roll_extrema):
+        roll_max, roll_min = roll_extrema
+        return pd.Series(_breakout_forecast(price.values, roll_max.values, roll_min.values, span), index=price.index)
+
+    return RuleNode('breakout({},{})'.format(window, span), calc_breakout, (price_node(), rolling_extrema_node(window)))
+
+
+def long_only_node():
+    return RuleNode('long_only', lambda inst, price: pd.Series(10.0, index=price.index), (price_node(),))
+
+
+RULE_NODES = {EWMAC: ewmac_node,
+              carry: carry_node,
+              breakout: breakout_node,
+              long_only: long_only_node,
+              }
+
+
+def rule_node(rulename: str, rule, **kwargs):
+    ''' Return the graph node of a rule as configured in Portfolio.rules
+
+    A rule without a declared node is wrapped as a node without inputs calling rule(rulename, inst, **kwargs).
+    '''
+    if rule in RULE_NODES:
+        return RULE_NODES[rule](**kwargs)
+
+    return RuleNode('rule({})'.format(rulename), lambda inst: rule(rulename, inst, **kwargs), ())
+
+
+class ForecastGraph:
+    ''' Executor of a graph of rule nodes
+
+    The nodes are evaluated in topological order, each once per instrument, and an intermediate value is freed as
+    soon as the last node using it has been evaluated. The time spent in each node is accumulated across runs.
+
+    Args:
+        outputs: List of (output name, node)
+    '''
+
+    def __init__(self, outputs):
+        self.outputs = OrderedDict(outputs)
+        self.nodes = self._topological_sort(self.outputs.values())
+
+        self._n_consumer = Counter(name for node in self.nodes for name in set(node_input.name
+                                                                              for node_input in node.inputs))
+        self._output_names = set(node.name for node in self.outputs.values())
+
+        self.node_times = OrderedDict((node.name, 0.0) for node in self.nodes)
+        self.n_run = 0
+
+    @staticmethod
+    def _topological_sort(outputs):
+        nodes = OrderedDict()
+
+        def visit(node):
+            if node.name in nodes:
+                return
+            for node_input in node.inputs:
+                visit(node_input)
+            nodes[node.name] = node
+
+        for node in outputs:
+            visit(node)
+
+        return list(nodes.values())
+
+    def run(self, inst):
+        ''' Evaluate the graph for one instrument
+
+        Returns:
+            An ordered dict of output name to value
+        '''
+        values = {}
+        n_consumer = dict(self._n_consumer)
+
+        for node in self.nodes:
+            start = time.perf_counter()
+            values[node.name] = node.func(inst, *[values[node_input.name] for node_input in node.inputs])
+            self.node_times[node.name] += time.perf_counter() - start
+
+            for name in set(node_input.name for node_input in node.inputs):
+                n_consumer[name] -= 1
+                if n_consumer[name] == 0 and name not in self._output_names:
+                    del values[name]
+
+        self.n_run += 1
+        return OrderedDict((output_name, values[node.name]) for output_name, node in self.outputs.items())
+
+    def timing(self):
+        ''' Return the total time in seconds spent in each node, the most expensive first '''
+        return pd.Series(self.node_times).sort_values(ascending=False)
+
+
 ### Transforming forecast to positions, costs, pnl
 
 def forecast_to_position(inst: Instrument, forecast: pd.Series):
@@ -126,6 +406,50 @@ def forecast_to_position(inst: Instrument, forecast: pd.Series):
     return position
 
 
+def buffer_positions(opt_pos, trade_to_edge=False, round_position=False):
+    ''' Apply a buffer of 10% of the optimal position around it to every column of positions at once
+
+    The position is only traded when it falls outside the buffer, then either to the edge of the buffer or to the
+    optimal position. A missing optimal position leaves the position unchanged and gives NA on that date. The dates are
+    walked once, each step being vectorised across all the other axes.
+
+    Args:
+        opt_pos: Array of optimal positions with dates along the first axis, e.g., dates by tickers by rules
+        trade_to_edge: Trade to the edge (True) or the optimal (False)
+        round_position: Produce rounded positions, with the buffer floored and ceiled as well
+
+    Returns:
+        An array of buffered positions of the same shape as opt_pos
+    '''
+    opt_pos = np.asarray(opt_pos, dtype=np.float64)
+    buffer = np.abs(opt_pos) * 0.1
+    lower_limit = opt_pos - buffer
+    upper_limit = opt_pos + buffer
+
+    if round_position:
+        opt_pos = np.round(opt_pos)
+        upper_limit = np.round(upper_limit)
+        lower_limit = np.round(lower_limit)
+
+    buffered_position = np.empty_like(opt_pos)
+    current_position = np.zeros(opt_pos.shape[1:])
+
+    # comparisons with NA are False, so a missing optimal position or limit keeps the current position
+    with np.errstate(invalid='ignore'):
+        for i in range(len(opt_pos)):
+            is_above = current_position > upper_limit[i]
+            is_below = current_position < lower_limit[i]
+            if trade_to_edge:
+                current_position = np.where(is_above, upper_limit[i], np.where(is_below, lower_limit[i],
+                                                                               current_position))
+            else:
+                current_position = np.where(is_above | is_below, opt_pos[i], current_position)
+            buffered_position[i] = current_position
+
+    buffered_position[np.isnan(opt_pos)] = np.nan
+    return buffered_position
+
+
 ###
 def turnover(series:pd.Series):
     ratios = series.diff().abs() / series.abs().rolling(window=system.n_bday_in_3m).mean() * system.n_bday_in_year